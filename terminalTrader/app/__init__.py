@@ -1,5 +1,9 @@
 from . import controller
-from .errs import InsufficientFundsError, InsufficientSharesError, NoSuchTickerError
+from .errs import InsufficientFundsError, InsufficientSharesError, NoSuchTickerError, StaleAccountError
+from . import trade
+from . import ticks
+from . import db
+from . import storage
 from .trade import Trade 
 from .position import Position
 from .account import Account
@@ -11,10 +15,14 @@ from .account import Account
 # 'from app import run'
 
 run = controller.run
+setPriceProvider = trade.setPriceProvider
+setStorage = storage.setStorage
 
 
 def setDB(dbpath):
-    # Update the dbpath of all of the classes
+    # Update the dbpath of all of the classes and the shared connections
+    db.setDB(dbpath)
     Trade.setDB(dbpath)
     Position.setDB(dbpath)
-    Account.setDB(dbpath)
\ No newline at end of file
+    Account.setDB(dbpath)
+    ticks.TICK_STORE.setDB(dbpath)
\ No newline at end of file
@@ -1,9 +1,16 @@
 import sqlite3
+import time
 import bcrypt
 from random import randint
 from . import position
 from . import trade
 from . import errs
+from . import db
+from . import groupcommit
+from . import locks
+from . import session
+from . import storage
+from . import symbols
 from .config import DBPATH
 
 Position = position.Position
@@ -24,6 +31,11 @@ from . import
 
 class Account:
 
+    # slots instead of a __dict__ per object, in the column order of the table
+    __slots__ = ("id", "first_name", "last_name", "username", "email_address",
+                 "password_hash", "balance", "account_number", "admin", "api_key", "version")
+    COLUMNS = ", ".join(__slots__)
+
     dbpath = DBPATH
 
     @classmethod
@@ -42,80 +54,172 @@ class Account:
         self.account_number = kwargs.get("account_number")
         self.admin = kwargs.get("admin", 0)
         self.api_key = kwargs.get("api_key")
+        self.version = kwargs.get("version", 0)
+
 
+    @classmethod
+    def from_row(cls, row):
+        """ build an object from a row of SELECT COLUMNS, without __init__ """
+        acct = cls.__new__(cls)
+        (acct.id, acct.first_name, acct.last_name, acct.username, acct.email_address,
+         acct.password_hash, acct.balance, acct.account_number, acct.admin, acct.api_key,
+         acct.version) = row
+        return acct
 
 
+    @storage.backed
     def save(self):
         """ inserts or updates depending on id's value """
+        with db.transaction(self.dbpath) as connection:
+            self.save_with(connection)
+        session.clean(self)
+
+
+    @storage.backed
+    def save_with(self, connection):
+        """ save using an open connection, without committing, so the write
+        can share a transaction with others """
         if self.id is None:
-            self._insert()
+            self._insert(connection)
         else:
-            self._update()
+            self._update(connection)
 
 
-    def _insert(self):
+    def _insert(self, connection):
         """ inserts a new row into the database and sets self.id """
         self.account_number = randint(1111111,9999999)
-        with sqlite3.connect(self.dbpath) as connection: 
-            cursor = connection.cursor()
-            INSERTSQL = """INSERT INTO accounts(first_name, last_name, 
-                                                username, email_address, 
-                                                password_hash, balance, 
-                                                account_number, admin,
-                                                api_key) 
-                            VALUES (:first_name, :last_name, 
-                                    :username, :email_address, 
-                                    :password_hash, :balance, 
-                                    :account_number, :admin,
-                                    :api_key); """
-            values = {
-                "first_name": self.first_name,
-                "last_name": self.last_name,
-                "username": self.username,
-                "email_address": self.email_address,
-                "password_hash": self.password_hash, 
-                "balance": self.balance, 
-                "account_number": self.account_number,
-                "admin": self.admin,
-                "api_key": randint(111111111, 999999999)
-                }
-            try: 
-                cursor.execute(INSERTSQL, values)
-                self.id = cursor.lastrowid
-            except sqlite3.IntegrityError:
-                raise ValueError("ticker not set or a position for this ticker already exists")
+        cursor = connection.cursor()
+        INSERTSQL = """INSERT INTO accounts(first_name, last_name, 
+                                            username, email_address, 
+                                            password_hash, balance, 
+                                            account_number, admin,
+                                            api_key) 
+                        VALUES (:first_name, :last_name, 
+                                :username, :email_address, 
+                                :password_hash, :balance, 
+                                :account_number, :admin,
+                                :api_key); """
+        values = {
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "username": self.username,
+            "email_address": self.email_address,
+            "password_hash": self.password_hash, 
+            "balance": self.balance, 
+            "account_number": self.account_number,
+            "admin": self.admin,
+            "api_key": randint(111111111, 999999999)
+            }
+        try: 
+            cursor.execute(INSERTSQL, values)
+            self.id = cursor.lastrowid
+        except sqlite3.IntegrityError:
+            raise ValueError("ticker not set or a position for this ticker already exists")
+
+
+    def _update(self, connection):
+        """ updates the row with id=self.id with this objects current values.
+        raises errs.StaleAccountError, changing nothing, if the row has been
+        written since this object was loaded """
+        cursor = connection.cursor()
+        UPDATESQL = """UPDATE accounts
+                        SET first_name=:first_name, last_name=:last_name, 
+                            username=:username, email_address=:email_address, 
+                            password_hash=:password_hash, balance=:balance, 
+                            account_number=:account_number, admin=:admin,
+                            version=version+1
+                        WHERE id=:id AND version=:version;"""
+        values = {
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "username": self.username,
+            "email_address": self.email_address,
+            "password_hash": self.password_hash, 
+            "balance": self.balance, 
+            "account_number": self.account_number,
+            "admin": self.admin,
+            "id": self.id,
+            "version": self.version
+            }
+        try:
+            cursor.execute(UPDATESQL, values)
+        except sqlite3.IntegrityError:
+            raise ValueError("ID (id) does not set in datebase.")
+        if cursor.rowcount == 0:
+            raise errs.StaleAccountError
+        self.version += 1
 
 
-    def _update(self):
-        """ updates the row with id=self.id with this objects current values"""
-        with sqlite3.connect(self.dbpath) as connection:
+    @classmethod
+    @storage.backed
+    def save_many(cls, accounts):
+        """ save many accounts in a single transaction, e.g. for an import.
+        accounts without an id are inserted with one executemany and get
+        their id, account_number and api_key set; the rest are updated, and
+        nothing is saved if any of them is stale (errs.StaleAccountError) """
+        new = [acct for acct in accounts if acct.id is None]
+        old = [acct for acct in accounts if acct.id is not None]
+        for acct in new:
+            acct.account_number = randint(1111111,9999999)
+            acct.api_key = randint(111111111, 999999999)
+        INSERTSQL = """INSERT INTO accounts(first_name, last_name, 
+                                            username, email_address, 
+                                            password_hash, balance, 
+                                            account_number, admin,
+                                            api_key) 
+                        VALUES (:first_name, :last_name, 
+                                :username, :email_address, 
+                                :password_hash, :balance, 
+                                :account_number, :admin,
+                                :api_key); """
+        UPDATESQL = """UPDATE accounts
+                        SET first_name=:first_name, last_name=:last_name, 
+                            username=:username, email_address=:email_address, 
+                            password_hash=:password_hash, balance=:balance, 
+                            account_number=:account_number, admin=:admin,
+                            version=version+1
+                        WHERE id=:id AND version=:version;"""
+        # the write lock is held from the start, so the new ids are consecutive
+        with db.immediate(cls.dbpath) as connection:
             cursor = connection.cursor()
-            UPDATESQL = """UPDATE accounts
-                            SET first_name=:first_name, last_name=:last_name, 
-                                username=:username, email_address=:email_address, 
-                                password_hash=:password_hash, balance=:balance, 
-                                account_number=:account_number, admin=:admin
-                            WHERE id=:id;"""
-            values = {
-                "first_name": self.first_name,
-                "last_name": self.last_name,
-                "username": self.username,
-                "email_address": self.email_address,
-                "password_hash": self.password_hash, 
-                "balance": self.balance, 
-                "account_number": self.account_number,
-                "admin": self.admin,
-                "id": self.id
-                }
             try:
-                cursor.execute(UPDATESQL, values)
+                if new:
+                    cursor.executemany(INSERTSQL, [acct._values() for acct in new])
+                    last_id = connection.execute("SELECT last_insert_rowid();").fetchone()[0]
+                    first_id = last_id - len(new) + 1
+                if old:
+                    cursor.executemany(UPDATESQL, [acct._values() for acct in old])
+                    if cursor.rowcount != len(old):
+                        raise errs.StaleAccountError
             except sqlite3.IntegrityError:
-                raise ValueError("ID (id) does not set in datebase.")
-
-
+                raise ValueError("username not set or account_number already exists")
+        for offset, acct in enumerate(new):
+            acct.id = first_id + offset
+        for acct in old:
+            acct.version += 1
+
+
+    def _values(self):
+        """ return this account's columns as a dict of named parameters """
+        return {
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "username": self.username,
+            "email_address": self.email_address,
+            "password_hash": self.password_hash,
+            "balance": self.balance,
+            "account_number": self.account_number,
+            "admin": self.admin,
+            "api_key": self.api_key,
+            "id": self.id,
+            "version": self.version
+            }
+
+
+    @storage.backed
     def delete(self):
         """ deletes row with id=self.id from db and sets self.id to None """
-        with sqlite3.connect(self.dbpath) as connection: 
+        with db.transaction(self.dbpath) as connection: 
             cursor = connection.cursor()
             DELETESQL = """DELETE FROM accounts WHERE id=:id """
             cursor.execute(DELETESQL, {"id": self.id})
@@ -123,52 +227,59 @@ class Account:
 
 
     @classmethod
+    @storage.backed
     def from_id(cls, id):
         """ return an object of this class for the given database row id """
-        SELECTSQL = "SELECT * FROM accounts WHERE id=:id;"
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        acct = session.cached(cls, id)
+        if acct is not None:
+            return acct
+        SELECTSQL = f"SELECT {cls.COLUMNS} FROM accounts WHERE id=:id;"
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             cursor.execute(SELECTSQL, {"id": id})
             dictrow = cursor.fetchone()
             if dictrow:
-                return cls(**dictrow)
+                return session.remember(cls.from_row(dictrow))
             return None
 
 
     @classmethod
+    @storage.backed
     def from_api_key(cls, api_key):
         """ return an object of this class for the given api_key """
-        SELECTSQL = "SELECT * FROM accounts WHERE api_key=:api_key;"
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        key = (cls, "api_key", str(api_key))
+        acct = session.found(key)
+        if acct is not None:
+            return acct
+        SELECTSQL = f"SELECT {cls.COLUMNS} FROM accounts WHERE api_key=:api_key;"
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             cursor.execute(SELECTSQL, {"api_key": api_key})
             dictrow = cursor.fetchone()
             if dictrow:
-                return cls(**dictrow)
+                return session.remember(cls.from_row(dictrow), key)
             return None
 
 
     @classmethod
+    @storage.backed
     def all(cls):
         """ return a list of every row of this table as objects of this class """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
-            SELECTSQL = "SELECT * FROM accounts;"
+            SELECTSQL = f"SELECT {cls.COLUMNS} FROM accounts;"
             cursor.execute(SELECTSQL)
             result = []
             for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
+                result.append(cls.from_row(dictrow))
             return result
 
 
     @classmethod
+    @storage.backed
     def delete_all(cls):
         """ delete all rows from this table """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             SQL = "DELETE FROM accounts;"
             cursor.execute(SQL)
@@ -178,7 +289,7 @@ class Account:
         """ return a string representing this object """
         # this is a good default __repr__
         # Q: using the docs, can you figure out what this is doing?
-        return f"<{type(self).__name__} {self.__dict__}>"
+        return f"<{type(self).__name__} {session.fields(self)}>"
 
 
     def set_password_hash(self, password):
@@ -187,10 +298,14 @@ class Account:
         self.password_hash = bcrypt.hashpw(password.encode(), salt)
 
     @classmethod
+    @storage.backed
     def get_from_username(cls, username):
-        SELECTSQL = "SELECT * FROM accounts WHERE username=:username;"
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        key = (cls, "username", username)
+        acct = session.found(key)
+        if acct is not None:
+            return acct
+        SELECTSQL = f"SELECT {cls.COLUMNS} FROM accounts WHERE username=:username;"
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             try:
                 cursor.execute(SELECTSQL, {"username": username})
@@ -198,7 +313,7 @@ class Account:
                 raise ValueError("ID (id) not set in datebase.")
             dictrow = cursor.fetchone()
             if dictrow:
-                return cls(**dictrow)
+                return session.remember(cls.from_row(dictrow), key)
             return None
 
 
@@ -228,6 +343,16 @@ class Account:
         return position.Position.all_from_account_id(self.id)
     
 
+    def value_positions(self, positions=None):
+        """ return a list of (position, price, value) for this account's
+        positions, fetching the quotes in concurrent batches """
+        if positions is None:
+            positions = self.get_positions()
+        prices = trade.get_current_prices_concurrently([position.ticker for position in positions])
+        return [(position, prices[position.ticker], position.value(prices[position.ticker]))
+                for position in positions]
+
+
     def get_trades_for(self, ticker):
         """ return all Trade objects for this account and a given ticker """
         return trade.Trade.all_from_account_id_and_ticker(self.id, ticker)
@@ -240,55 +365,139 @@ class Account:
 
     def buy(self, ticker, volume):
         """ Create a trade and modify a position for this user, creating a buy. 
-        Can raise errs.InsufficientFundsError or errs.NoSuchTickerError """
+        The balance check and debit, the position and the trade are written
+        in one transaction, so a failure part way leaves nothing behind.
+        Can raise errs.InsufficientFundsError, errs.NoSuchTickerError or
+        errs.PriceUnavailableError """
         if volume <= 0:
             raise errs.VolumeLessThanZeroError
 
-        buy_trade = Trade(ticker=ticker, volume=volume, account_id=self.id)
-        if trade.get_current_price(ticker) is None:
-            raise errs.NoSuchTickerError
-        else:
-            buy_trade.unit_price = trade.get_current_price(ticker) 
-        if self.balance < buy_trade.volume * buy_trade.unit_price:
-            raise errs.InsufficientFundsError
-
-        increase_position = Position.from_account_id_and_ticker(account_id=buy_trade.account_id, ticker=buy_trade.ticker)
-        if increase_position.id:
-            increase_position.shares += buy_trade.volume
-        else: # sets data if position didn't exists
-            increase_position.ticker = buy_trade.ticker
-            increase_position.shares = buy_trade.volume
-            increase_position.account_id = buy_trade.account_id
-        increase_position.save()
-
-        buy_trade.save()
+        ticker = symbols.normalize(ticker)
+        with locks.ACCOUNT_LOCKS.hold(self.id):
+            buy_trade = Trade(ticker=ticker, volume=volume, account_id=self.id)
+            unit_price = trade.get_current_price(ticker)
+            if unit_price is None:
+                raise errs.NoSuchTickerError
+            buy_trade.unit_price = unit_price
+            cost = buy_trade.volume * buy_trade.unit_price
+
+            def execute(connection):
+                # check the stored balance, not this object's, which may be out
+                # of date after another session's deposit or order
+                balance, version = self._balance_with(connection)
+                if balance < cost:
+                    raise errs.InsufficientFundsError
+                self._add_to_balance_with(connection, -cost)
+                Position.add_shares_with(connection, self.id, ticker, buy_trade.volume)
+                buy_trade.insert_with(connection)
+                return balance, version
+
+            balance, version = self._execute(execute)
+        self.balance = balance - cost
+        self.version = version + 1
+        session.clean(self)
+        session.evict((Position, self.id, ticker))
 
 
     def sell(self, ticker, volume):
         """ Create a trade and modify a position for this user, creating a sell.
-        Can raise errs.InsufficientSharesError or errs.NoSuchTickerError """
+        The position, the trade and the balance credit are written in one
+        transaction. Can raise errs.InsufficientSharesError,
+        errs.NoSuchTickerError or errs.PriceUnavailableError """
         if volume <= 0: 
             raise errs.VolumeLessThanZeroError
 
-        sell_trade = Trade(ticker=ticker, volume=volume, account_id=self.id)
-        if trade.get_current_price(ticker) is None:
-            raise errs.NoSuchTickerError
-        else:
-            sell_trade.unit_price = trade.get_current_price(ticker)
-        
-        decrease_position = Position.from_account_id_and_ticker(account_id=sell_trade.account_id, ticker=sell_trade.ticker)
-        if decrease_position.shares < sell_trade.volume:
-            raise errs.InsufficientSharesError
-        decrease_position.shares -= sell_trade.volume
-        decrease_position.save()
-
-        sell_trade.volume *= -1 # Differentiates buys/sells with pos/negative volume
-        sell_trade.save()
+        ticker = symbols.normalize(ticker)
+        with locks.ACCOUNT_LOCKS.hold(self.id):
+            sell_trade = Trade(ticker=ticker, volume=volume, account_id=self.id)
+            unit_price = trade.get_current_price(ticker)
+            if unit_price is None:
+                raise errs.NoSuchTickerError
+            sell_trade.unit_price = unit_price
+            proceeds = sell_trade.volume * sell_trade.unit_price
+
+            sell_trade.volume *= -1 # Differentiates buys/sells with pos/negative volume
+
+            def execute(connection):
+                if not Position.remove_shares_with(connection, self.id, ticker, volume):
+                    raise errs.InsufficientSharesError
+                balance, version = self._balance_with(connection)
+                self._add_to_balance_with(connection, proceeds)
+                sell_trade.insert_with(connection)
+                return balance, version
+
+            balance, version = self._execute(execute)
+        self.balance = balance + proceeds
+        self.version = version + 1
+        session.clean(self)
+        session.evict((Position, self.id, ticker))
+
+
+    def deposit(self, amount):
+        """ add amount to the stored balance in one transaction and update
+        this object to match. the deposit is kept in the ledger, next to
+        the trades, so balances can be rebuilt from them """
+        def execute(connection):
+            balance, version = self._balance_with(connection)
+            self._add_to_balance_with(connection, amount)
+            self._record_deposit_with(connection, amount)
+            return balance, version
+
+        with locks.ACCOUNT_LOCKS.hold(self.id):
+            balance, version = self._execute(execute)
+        self.balance = balance + amount
+        self.version = version + 1
+        session.clean(self)
+
+
+    @storage.backed
+    def _execute(self, fn):
+        """ run fn(connection) as one write transaction and return its result.
+        with group commit enabled it is batched with other orders by
+        groupcommit.WRITER. the caller holds the account's lock, which
+        serializes its orders and their quotes; the writes themselves take
+        SQLite's write lock, which one account at a time holds """
+        if groupcommit.WRITER.enabled:
+            return groupcommit.WRITER.submit(fn, self.dbpath).result()
+        with db.immediate(self.dbpath) as connection:
+            return fn(connection)
+
+
+    @storage.backed
+    def _balance_with(self, connection):
+        """ return this account's stored (balance, version), read on an open
+        connection """
+        SELECTSQL = "SELECT balance, version FROM accounts WHERE id=:id;"
+        row = connection.execute(SELECTSQL, {"id": self.id}).fetchone()
+        if row is None:
+            raise ValueError("account must be saved before it can trade")
+        return row[0] or 0.0, row[1]
+
+
+    @storage.backed
+    def _add_to_balance_with(self, connection, amount):
+        """ add amount, which may be negative, to the stored balance """
+        UPDATESQL = """UPDATE accounts SET balance=COALESCE(balance, 0)+:amount, version=version+1
+                       WHERE id=:id;"""
+        connection.execute(UPDATESQL, {"amount": amount, "id": self.id})
+
+
+    @storage.backed
+    def _record_deposit_with(self, connection, amount):
+        """ add a row for a deposit of amount to the deposits table """
+        INSERTSQL = "INSERT INTO deposits(account_id, amount, time) VALUES (:account_id, :amount, :time);"
+        connection.execute(INSERTSQL, {"account_id": self.id, "amount": amount, "time": time.time()})
 
 
     def stock_quotes(self, ticker):
-        stock_quote = trade.get_current_price(ticker)
-        if stock_quote:
+        return self.quote(ticker).price
+
+
+    def quote(self, ticker):
+        """ return a trade.Quote for ticker, saying whether its price is fresh
+        or stale. Can raise errs.NoSuchTickerError or errs.PriceUnavailableError """
+        stock_quote = trade.get_quote(symbols.normalize(ticker))
+        if stock_quote.price:
             return stock_quote
         raise errs.NoSuchTickerError
 
@@ -0,0 +1,85 @@
+import time
+import threading
+from collections import OrderedDict
+from .config import QUOTE_CACHE_TTL, QUOTE_CACHE_SIZE
+
+
+class QuoteCache:
+    """ process-wide ticker -> price cache. Entries expire after ttl seconds
+    and the least recently used ticker is evicted once maxsize is reached.
+    Expired prices are kept for another stale_ttl seconds so get_stale can
+    serve them while the upstream is slow or down """
+
+    def __init__(self, ttl=QUOTE_CACHE_TTL, maxsize=QUOTE_CACHE_SIZE, clock=time.monotonic,
+                 stale_ttl=0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # ticker -> (price, time fetched)
+        self._lock = threading.Lock()
+
+
+    def get(self, ticker):
+        """ return the cached price for ticker, None if missing or expired """
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is not None:
+                age = self.clock() - entry[1]
+                if age < self.ttl:
+                    self._entries.move_to_end(ticker)
+                    self.hits += 1
+                    return entry[0]
+                if age >= self.ttl + self.stale_ttl:
+                    del self._entries[ticker]
+            self.misses += 1
+            return None
+
+
+    def get_stale(self, ticker):
+        """ return the cached price for ticker even if it is past ttl, as long
+        as it is within stale_ttl of it. None if there is no such price """
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is None:
+                return None
+            age = self.clock() - entry[1]
+            if age < self.ttl + self.stale_ttl:
+                return entry[0]
+            del self._entries[ticker]
+            return None
+
+
+    def put(self, ticker, price):
+        """ store a freshly fetched price, evicting the oldest ticker if full """
+        with self._lock:
+            self._entries[ticker] = (price, self.clock())
+            self._entries.move_to_end(ticker)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self, ticker=None):
+        """ drop one ticker, or every ticker when called with no argument """
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ticker, None)
+
+
+    def stats(self):
+        """ return a dict of hit/miss counters and the current size """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._entries)}
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.stats()}>"
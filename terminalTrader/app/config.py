@@ -3,3 +3,120 @@ import os
 DIRNAME = os.path.dirname(__file__)
 DBFILE  = 'stock_trader.db'
 DBPATH  = os.path.join(DIRNAME, DBFILE)
+
+# Prepared statements each pooled sqlite3 connection keeps compiled
+DB_STATEMENT_CACHE_SIZE = 256
+
+# Where the models keep their rows: "sqlite", or "memory" for simulations
+# that never touch the disk
+STORAGE = "sqlite"
+
+# Orders and deposits on one account take turns on one of
+# ACCOUNT_LOCK_STRIPES locks, picked by account id
+ACCOUNT_LOCK_STRIPES = 64
+
+# Group commit: when GROUP_COMMIT_ENABLED, orders are handed to one writer
+# thread that commits up to GROUP_COMMIT_SIZE of them together. A batch is
+# whatever queued up while the last one was committing, plus anything that
+# arrives within GROUP_COMMIT_INTERVAL seconds. Every order waits for its
+# own commit, so a batch never holds more orders than there are threads
+# placing them, and waiting longer for more only idles the writer. With
+# the "durable" profile benchmarks/bench_group_commit.py measures about
+# 2.7x the one-by-one rate at 16 threads and 5.5x at 64, but 0.75x with a
+# single thread, and a 2ms interval is slower at every thread count. The
+# SAVEPOINT each order runs in costs microseconds, next to an fsync's
+# milliseconds. Enable it for many concurrent order threads on a durable
+# database, and leave the interval at 0
+GROUP_COMMIT_ENABLED  = False
+GROUP_COMMIT_SIZE     = 256
+GROUP_COMMIT_INTERVAL = 0.0
+
+# Ledger rebuilds leave a stored position or balance alone when it is within
+# LEDGER_TOLERANCE of the replayed one, float sums rarely match to the bit
+LEDGER_TOLERANCE = 1e-6
+
+# P&L treats a position with fewer than PNL_SHARES_EPSILON shares, left
+# over from float rounding, as closed
+PNL_SHARES_EPSILON = 1e-9
+
+# Trade history is read in keyset pages of TRADE_PAGE_SIZE rows, and the
+# API hands out at most TRADE_PAGE_MAX trades per request
+TRADE_PAGE_SIZE = 500
+TRADE_PAGE_MAX  = 1000
+
+# PRAGMAs run on every new database connection. DB_PROFILE picks one of
+# DB_PROFILES. "fast" uses write-ahead logging, so readers never block the
+# writer, and only fsyncs at checkpoints. "durable" also fsyncs every commit.
+# "default" keeps SQLite's own settings
+DB_PROFILE  = "fast"
+DB_PROFILES = {
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,   # 256MB
+        "cache_size": -65536,     # 64MB, negative means KiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,     # milliseconds
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "default": {
+        "busy_timeout": 5000,
+    },
+}
+
+# Where prices come from: "iex", "static" or "replay" (see providers.py).
+# DICT_FAKES are made-up tickers that never need a network call and
+# PRICE_REPLAY_FILE is a .csv or SQLite tick recording for "replay"
+PRICE_PROVIDER    = "iex"
+PRICE_REPLAY_FILE = os.path.join(DIRNAME, "price_ticks.csv")
+DICT_FAKES        = {"STOK": 123.45, "P2P": 678.90, "A33A": 98.76}
+
+# Local list of every tradable ticker, one per line. Refresh it from IEX
+# with: python3 refresh_symbols.py
+SYMBOLS_FILE = os.path.join(DIRNAME, "symbols.txt")
+
+# Quote cache: how long (seconds) a fetched price is reused, and how many
+# tickers are kept before the least recently used one is evicted
+QUOTE_CACHE_TTL  = 15
+QUOTE_CACHE_SIZE = 1024
+
+# Background refresher: every REFRESH_INTERVAL seconds (keep it below
+# QUOTE_CACHE_TTL) re-fetch the tickers held in positions and the last
+# REFRESH_RECENT_TICKERS tickers looked up, so user lookups hit a warm cache
+REFRESH_INTERVAL       = 10
+REFRESH_RECENT_TICKERS = 200
+
+# Tick history: every fetched price is appended to the price_ticks table by
+# a writer thread, in batches of up to TICK_BATCH_SIZE rows or at least every
+# TICK_FLUSH_INTERVAL seconds
+TICK_BATCH_SIZE     = 500
+TICK_FLUSH_INTERVAL = 1.0
+
+# Resilience: an expired price may still be served for QUOTE_STALE_TTL more
+# seconds while it is refreshed in the background. After BREAKER_FAILURES
+# upstream errors in a row the quote source is left alone for BREAKER_RESET
+# seconds before one trial request is let through
+QUOTE_STALE_TTL  = 300
+BREAKER_FAILURES = 5
+BREAKER_RESET    = 30
+
+# IEX cloud quote API. A batch request takes at most IEX_BATCH_SIZE symbols
+IEX_BASE_URL   = "https://cloud.iexapis.com/stable"
+IEX_TOKENFILE  = os.path.join(os.getenv('HOME', ''), ".credentials", "IEXTOKEN.txt")
+IEX_BATCH_SIZE = 100
+
+# HTTP settings for the pooled IEX client: (connect, read) timeouts in
+# seconds and the number of keep-alive connections kept open
+IEX_TIMEOUT   = (3.05, 10)
+IEX_POOL_SIZE = 10
+
+# Async valuation: how many quote requests may be in flight at once and how
+# long (seconds) each one may take before its tickers are given up on
+ASYNC_QUOTE_CONCURRENCY = 8
+ASYNC_QUOTE_TIMEOUT     = 10
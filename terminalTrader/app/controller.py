@@ -3,6 +3,10 @@ from flask import Flask, request, jsonify
 from . import view
 from . import account
 from . import errs
+from . import pnl
+from . import refresher
+from . import report
+from . import session
 
 
 # a way to get around having to use the module name when avoiding
@@ -15,6 +19,7 @@ Account = account.Account
 
 def run():
     view.welcome()
+    refresher.start()
     
     while True:
         account_data = login_menu()
@@ -22,6 +27,7 @@ def run():
             break
         main_menu(account_data)
     
+    refresher.stop()
     view.goodbye()
 
 
@@ -87,61 +93,66 @@ def main_menu(account_data):
         elif choice == "2":
             view.give_balance(account_data.balance)
             amount = round(float(view.enter_deposit_info()), 2)
-            account_data.balance += amount
-            account_data.save()
+            account_data.deposit(amount)
             view.give_balance(account_data.balance)
             return main_menu(account_data)
             
         # Buy and sell stock
         elif choice == "3":
 
-            while True:
-                # ticker = view.ticker_info() # 1st menu question
-
+            # one unit of work, so the order reads each row once
+            with session.Session():
                 while True:
-                    trade = view.buy_sell_choice() # 1st menu question
-                    if trade in ("1", "2"):
-                        break
-                    view.bad_choice_input()
+                    # ticker = view.ticker_info() # 1st menu question
 
-                if trade == "1":
                     while True:
-                        ticker = view.ticker_info() # 2nd menu question
-                        volume = view.enter_buy_info() # 3rd menu question
+                        trade = view.buy_sell_choice() # 1st menu question
+                        if trade in ("1", "2"):
+                            break
+                        view.bad_choice_input()
+
+                    if trade == "1":
+                        while True:
+                            ticker = view.ticker_info() # 2nd menu question
+                            volume = view.enter_buy_info() # 3rd menu question
+                            try:
+                                volume = float(volume)
+                                break
+                            except ValueError:
+                                view.bad_number_input()
                         try:
-                            volume = float(volume)
+                            account_data.buy(ticker, volume)
                             break
-                        except ValueError:
+                        except errs.VolumeLessThanZeroError:
                             view.bad_number_input()
-                    try:
-                        account_data.buy(ticker, volume)
-                        break
-                    except errs.VolumeLessThanZeroError:
-                        view.bad_number_input()
-                    except errs.NoSuchTickerError:
-                        view.bad_ticker()
-                    except errs.InsufficientFundsError:
-                        view.insufficient_funds()
-
-                elif trade == "2":
-                    while True:
-                        ticker = view.ticker_info() # 2nd menu question
-                        volume = view.enter_sell_info() # 3rd menu question
+                        except errs.NoSuchTickerError:
+                            view.bad_ticker()
+                        except errs.InsufficientFundsError:
+                            view.insufficient_funds()
+                        except errs.PriceUnavailableError:
+                            view.price_unavailable()
+
+                    elif trade == "2":
+                        while True:
+                            ticker = view.ticker_info() # 2nd menu question
+                            volume = view.enter_sell_info() # 3rd menu question
+                            try:
+                                volume = float(volume)
+                                break
+                            except ValueError:
+                                view.bad_number_input()
+
                         try:
-                            volume = float(volume)
+                            account_data.sell(ticker, volume)
                             break
-                        except ValueError:
+                        except errs.VolumeLessThanZeroError:
                             view.bad_number_input()
-
-                    try:
-                        account_data.sell(ticker, volume)
-                        break
-                    except errs.VolumeLessThanZeroError:
-                        view.bad_number_input()
-                    except errs.NoSuchTickerError:
-                        view.bad_ticker()
-                    except errs.InsufficientSharesError:
-                        view.insufficient_shares()
+                        except errs.NoSuchTickerError:
+                            view.bad_ticker()
+                        except errs.InsufficientSharesError:
+                            view.insufficient_shares()
+                        except errs.PriceUnavailableError:
+                            view.price_unavailable()
             
             return main_menu(account_data)
 
@@ -149,16 +160,18 @@ def main_menu(account_data):
         elif choice == "4":
             ticker = view.ticker_info()
             try:
-                stock_quote = account_data.stock_quotes(ticker)
-                view.stock_info(ticker, stock_quote)
+                stock_quote = account_data.quote(ticker)
+                view.stock_info(ticker, stock_quote.price, stock_quote.stale)
             except NoSuchTickerError:
                 view.bad_ticker()
                 return main_menu(account_data)
+            except errs.PriceUnavailableError:
+                view.price_unavailable()
+                return main_menu(account_data)
 
         # View positions
         elif choice == "5":
-            positions = account_data.get_positions()
-            view.positions_info(positions)
+            view.pnl_info(pnl.account_pnl(account_data.id))
             return main_menu(account_data)
     
         # Review trade history
@@ -179,9 +192,9 @@ def main_menu(account_data):
         elif choice == "9":
             if account_data.admin == 1:
                 username = view.grant_admin()
-                other_account = account_data.get_from_username(username)
-                other_account.admin = 1
-                other_account.save()
+                with session.Session(): # saves the change on the way out
+                    other_account = account_data.get_from_username(username)
+                    other_account.admin = 1
             else:
                 view.bad_choice_input()
             return main_menu(account_data)
@@ -246,26 +259,8 @@ def create_account():
 
 
 def data_for_admin(account_data):
-    all_data = account_data.all()
-
-    # first gets LISTS of position objs then....
-    list_positions = []
-    for row in all_data:
-        acct = Account.from_id(row.id)
-        raw_list = acct.get_positions()
-        for position in raw_list: #...then it extracts individuals positions
-            list_positions.append(position)
-
-    list_values = []
-    for position in list_positions:
-        value = position.shares * account_data.stock_quotes(position.ticker)
-        list_values.append([position.account_id, value,
-                            position.ticker, position.shares, 
-                            account_data.stock_quotes(position.ticker)] )
-    def onFourth(elem):
-        return elem[3]
-    list_values.sort(key=onFourth, reverse=True)
-    view.all_account_positions(list_values)
+    """ show every account's positions, largest first, priced in one batch """
+    view.all_account_positions(report.portfolio_report(sort="shares"))
      
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from .config import DBPATH, DB_STATEMENT_CACHE_SIZE, DB_PROFILE, DB_PROFILES
+
+
+MEMORY = ":memory:"
+
+
+def is_memory(dbpath):
+    """ True for ":memory:" and for named in-memory databases like
+    ":memory:simulation" """
+    return dbpath is not None and dbpath.startswith(MEMORY)
+
+
+def apply_profile(connection, profile=DB_PROFILE):
+    """ run the PRAGMAs of the named DB_PROFILES entry on connection """
+    if profile not in DB_PROFILES:
+        raise ValueError(f"unknown database profile {profile!r}")
+    for pragma, value in DB_PROFILES[profile].items():
+        connection.execute(f"PRAGMA {pragma}={value};")
+
+
+class ConnectionManager:
+    """ hands out one long-lived sqlite3 connection per thread per database
+    file, instead of a new connection for every query. Keeping the
+    connection open also keeps its cache of prepared statements, so the
+    model classes' SQL is only compiled once per thread.
+
+    An in-memory database (see is_memory) only lives as long as its
+    connection, so instead every thread shares one pinned connection to it,
+    and transaction() and immediate() take turns on it with a lock. The
+    database lasts until discard() and can be copied to and from a file
+    with snapshot() and restore() """
+
+    def __init__(self, dbpath=DBPATH, cached_statements=DB_STATEMENT_CACHE_SIZE,
+                 profile=DB_PROFILE):
+        self.dbpath = dbpath
+        self.cached_statements = cached_statements
+        self.profile = profile
+        self.opened = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pinned = {} # in-memory dbpath -> (connection, lock)
+
+
+    def setDB(self, dbpath):
+        """ change the database used when no dbpath is given """
+        self.dbpath = dbpath
+
+
+    def setProfile(self, profile):
+        """ change the PRAGMA profile used for connections opened from now on """
+        if profile not in DB_PROFILES:
+            raise ValueError(f"unknown database profile {profile!r}")
+        self.profile = profile
+
+
+    def connection(self, dbpath=None):
+        """ return this thread's connection to dbpath, opening it if needed """
+        dbpath = dbpath or self.dbpath
+        if is_memory(dbpath):
+            return self._pin(dbpath)[0]
+        connections = self._connections()
+        connection = connections.get(dbpath)
+        if connection is None:
+            connection = self.connect(dbpath)
+            connections[dbpath] = connection
+        return connection
+
+
+    def connect(self, dbpath):
+        """ open a new connection set up the way the models expect """
+        if is_memory(dbpath):
+            connection = sqlite3.connect(MEMORY, cached_statements=self.cached_statements,
+                                         check_same_thread=False)
+        else:
+            connection = sqlite3.connect(dbpath, cached_statements=self.cached_statements)
+        connection.row_factory = sqlite3.Row
+        apply_profile(connection, self.profile)
+        with self._lock:
+            self.opened += 1
+        return connection
+
+
+    @contextmanager
+    def transaction(self, dbpath=None):
+        """ use this thread's connection to dbpath in a with-block that
+        commits on success and rolls back on an exception, just like
+        'with sqlite3.connect(dbpath) as connection' """
+        with self._turn(dbpath) as connection:
+            with connection:
+                yield connection
+
+
+    @contextmanager
+    def immediate(self, dbpath=None):
+        """ like transaction, but starts with BEGIN IMMEDIATE so the write
+        lock is taken up front. Rows read inside the block cannot be changed
+        by another writer before it commits, and everything in the block is
+        written with a single commit """
+        with self._turn(dbpath) as connection:
+            connection.execute("BEGIN IMMEDIATE;")
+            try:
+                yield connection
+            except BaseException:
+                connection.rollback()
+                raise
+            connection.commit()
+
+
+    def snapshot(self, path, dbpath=None):
+        """ copy the database at dbpath, e.g. an in-memory one, into the file
+        at path with the sqlite backup API """
+        target = sqlite3.connect(path)
+        try:
+            with self._turn(dbpath) as connection:
+                connection.backup(target)
+        finally:
+            target.close()
+
+
+    def restore(self, path, dbpath=None):
+        """ replace the contents of the database at dbpath with the file at
+        path, e.g. to load a saved state into memory """
+        source = sqlite3.connect(path)
+        try:
+            with self._turn(dbpath) as connection:
+                source.backup(connection)
+        finally:
+            source.close()
+
+
+    def discard(self, dbpath=None):
+        """ close the pinned connection of an in-memory database, which
+        throws its contents away """
+        with self._lock:
+            pinned = self._pinned.pop(dbpath or self.dbpath, None)
+        if pinned is not None:
+            with pinned[1]:
+                pinned[0].close()
+
+
+    def close(self, dbpath=None):
+        """ close this thread's connections, or only the one to dbpath.
+        in-memory databases stay open, see discard() """
+        connections = self._connections()
+        for path in list(connections):
+            if dbpath is None or path == dbpath:
+                connections.pop(path).close()
+
+
+    @contextmanager
+    def _turn(self, dbpath):
+        """ yield the connection to dbpath, holding the pinned connection's
+        lock for in-memory databases so threads do not interleave """
+        dbpath = dbpath or self.dbpath
+        if not is_memory(dbpath):
+            yield self.connection(dbpath)
+            return
+        connection, lock = self._pin(dbpath)
+        with lock:
+            yield connection
+
+
+    def _pin(self, dbpath):
+        with self._lock:
+            if dbpath not in self._pinned:
+                self._pinned[dbpath] = (None, threading.RLock())
+            connection, lock = self._pinned[dbpath]
+        if connection is None:
+            with lock:
+                connection = self._pinned[dbpath][0]
+                if connection is None:
+                    connection = self.connect(dbpath)
+                    self._pinned[dbpath] = (connection, lock)
+        return connection, lock
+
+
+    def _connections(self):
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        return self._local.connections
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.dbpath} opened={self.opened}>"
+
+
+MANAGER = ConnectionManager()
+
+connection = MANAGER.connection
+transaction = MANAGER.transaction
+immediate = MANAGER.immediate
+close = MANAGER.close
+snapshot = MANAGER.snapshot
+restore = MANAGER.restore
+discard = MANAGER.discard
+setDB = MANAGER.setDB
+setProfile = MANAGER.setProfile
@@ -8,4 +8,16 @@ class InsufficientSharesError(Exception):
     pass
 
 class VolumeLessThanZeroError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class PriceUnavailableError(Exception):
+    pass
+
+class StaleAccountError(Exception):
+    pass
+
+class UnsupportedStorageError(Exception):
+    pass
+
+class LedgerLockedError(Exception):
+    pass
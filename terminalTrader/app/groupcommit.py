@@ -0,0 +1,130 @@
+import atexit
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from .config import GROUP_COMMIT_ENABLED, GROUP_COMMIT_SIZE, GROUP_COMMIT_INTERVAL
+from . import db
+
+
+class GroupCommitWriter:
+    """ write-behind queue that commits many callers' writes together.
+
+    submit(fn) queues fn, which is given an open connection and must not
+    commit. One writer thread takes up to batch_size queued writes, or as
+    many as arrive within interval seconds of the first, and runs them in a
+    single transaction, so a burst of orders costs one commit instead of one
+    each. Every write runs in its own SAVEPOINT, so one that raises is rolled
+    back on its own without failing the rest of its batch.
+
+    submit() returns a concurrent.futures.Future that gets fn's return
+    value, or its exception, once the batch has committed. How durable the
+    commit is depends on DB_PROFILE """
+
+    def __init__(self, batch_size=GROUP_COMMIT_SIZE, interval=GROUP_COMMIT_INTERVAL,
+                 enabled=GROUP_COMMIT_ENABLED):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.enabled = enabled
+        self.commits = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+
+    def submit(self, fn, dbpath=None):
+        """ queue fn(connection) to run in the next batch for dbpath """
+        future = Future()
+        self._start_writer()
+        self._queue.put((dbpath or db.MANAGER.dbpath, fn, future))
+        return future
+
+
+    def flush(self, dbpath=None):
+        """ wait until everything submitted so far has been committed """
+        self.submit(lambda connection: None, dbpath).result()
+
+
+    def close(self):
+        """ commit what is queued and stop the writer thread """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+    def _start_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+
+
+    def _run(self):
+        while True:
+            batch, stop = self._take()
+            for dbpath, items in itertools.groupby(batch, key=lambda item: item[0]):
+                self._commit(dbpath, list(items))
+            if stop:
+                return
+
+
+    def _take(self):
+        """ block for one write, then gather more until the batch is full or
+        interval has passed. returns (batch, whether close() was called) """
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+
+    def _commit(self, dbpath, items):
+        outcomes = []
+        try:
+            with db.immediate(dbpath) as connection:
+                for _, fn, future in items:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    connection.execute("SAVEPOINT group_commit_item;")
+                    try:
+                        outcomes.append((future, fn(connection), None))
+                    except Exception as err:
+                        connection.execute("ROLLBACK TO group_commit_item;")
+                        outcomes.append((future, None, err))
+                    connection.execute("RELEASE group_commit_item;")
+        except Exception as err:
+            # the transaction itself failed, so nothing in it was written
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        self.commits += 1
+        self.written += len(outcomes)
+        for future, result, err in outcomes:
+            if err is None:
+                future.set_result(result)
+            else:
+                future.set_exception(err)
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} commits={self.commits} written={self.written}>"
+
+
+WRITER = GroupCommitWriter()
+atexit.register(WRITER.close)
@@ -0,0 +1,156 @@
+import time
+from collections import namedtuple
+from .config import LEDGER_TOLERANCE
+from . import db
+from . import errs
+from . import position
+from . import storage
+
+"""
+Trade ledger
+
+The trades and deposits tables are the ledger, an append-only log of every
+event that changed a position or a balance. positions.shares and
+accounts.balance are kept up to date as orders are written, but they can
+always be worked out again from the log.
+
+snapshot() stores every position and balance as of the newest trade and
+deposit, so a rebuild only has to replay what came after it. rebuild()
+adds up the snapshot and the later events with one GROUP BY per table,
+compares the result with the stored positions and balances, and writes
+back the ones that drifted. Run ledger.py snapshot periodically, e.g. from
+cron, to keep the replay short.
+
+An account's opening balance and a position written directly, e.g.
+imported with Position.upsert_many, are not events. The first snapshot
+that sees them takes them as they are stored, so balances are rebuilt
+only for accounts in the latest snapshot, and positions only where there
+is a snapshot row or a trade to replay.
+
+Trades and deposits a snapshot covers can no longer be changed or deleted,
+a rebuild would never see the change. Triggers on both tables reject it
+with LOCKED_MESSAGE.
+
+The ledger lives in the SQLite tables, so it cannot be used while another
+storage backend is selected.
+"""
+
+LOCKED_MESSAGE = "ledger rows covered by a snapshot cannot change"
+
+Drift = namedtuple("Drift", ["account_id", "ticker", "stored", "rebuilt"])
+
+# a position or balance as of the latest snapshot plus the later events
+REBUILT_POSITIONS = """rebuilt AS (
+    SELECT account_id, ticker, SUM(shares) AS shares FROM (
+        SELECT account_id, ticker, shares FROM snapshot_positions WHERE snapshot_id=:snapshot_id
+        UNION ALL
+        SELECT account_id, ticker, volume FROM trades WHERE id>:last_trade_id
+    ) GROUP BY account_id, ticker)"""
+
+REBUILT_BALANCES = """rebuilt AS (
+    SELECT account_id, SUM(amount) AS balance FROM (
+        SELECT account_id, balance AS amount FROM snapshot_balances WHERE snapshot_id=:snapshot_id
+        UNION ALL
+        SELECT account_id, -volume*unit_price FROM trades WHERE id>:last_trade_id
+        UNION ALL
+        SELECT account_id, amount FROM deposits WHERE id>:last_deposit_id
+    ) GROUP BY account_id)"""
+
+# positions with no snapshot row and no trades, e.g. imported ones, are not
+# in rebuilt and are left alone
+POSITION_DRIFT = f"""WITH {REBUILT_POSITIONS}
+SELECT rebuilt.account_id, rebuilt.ticker, positions.shares, rebuilt.shares
+FROM rebuilt LEFT JOIN positions
+    ON positions.account_id=rebuilt.account_id AND positions.ticker=rebuilt.ticker
+WHERE ABS(COALESCE(positions.shares, 0)-rebuilt.shares)>:tolerance;"""
+
+BALANCE_DRIFT = f"""WITH {REBUILT_BALANCES}
+SELECT accounts.id, accounts.balance, rebuilt.balance
+FROM accounts JOIN rebuilt ON rebuilt.account_id=accounts.id
+WHERE accounts.id IN (SELECT account_id FROM snapshot_balances WHERE snapshot_id=:snapshot_id)
+AND ABS(COALESCE(accounts.balance, 0)-rebuilt.balance)>:tolerance;"""
+
+
+def latest_snapshot(connection):
+    """ return (snapshot_id, last_trade_id, last_deposit_id) of the newest
+    snapshot, all 0 if there is none """
+    SELECTSQL = "SELECT id, last_trade_id, last_deposit_id FROM snapshots ORDER BY id DESC LIMIT 1;"
+    row = connection.execute(SELECTSQL).fetchone()
+    return tuple(row) if row else (0, 0, 0)
+
+
+def snapshot(dbpath=None):
+    """ store every position and balance as of the newest trade and deposit,
+    folded from the previous snapshot and the events since, and return the
+    new snapshot's id """
+    _check_storage()
+    with db.immediate(dbpath or position.Position.dbpath) as connection:
+        values = _replay_values(connection)
+        INSERTSQL = """INSERT INTO snapshots(time, last_trade_id, last_deposit_id)
+                       VALUES (:time, (SELECT COALESCE(MAX(id), 0) FROM trades),
+                               (SELECT COALESCE(MAX(id), 0) FROM deposits));"""
+        snapshot_id = connection.execute(INSERTSQL, {"time": time.time()}).lastrowid
+        values["new_id"] = snapshot_id
+        # positions that are not in the last snapshot, e.g. imported ones,
+        # start from their stored shares, like new accounts' balances below
+        connection.execute(f"""WITH {REBUILT_POSITIONS}
+            INSERT INTO snapshot_positions(snapshot_id, account_id, ticker, shares)
+            SELECT :new_id, account_id, ticker, shares FROM rebuilt
+            WHERE EXISTS (SELECT 1 FROM snapshot_positions AS previous
+                          WHERE previous.snapshot_id=:snapshot_id AND previous.account_id=rebuilt.account_id
+                          AND previous.ticker=rebuilt.ticker)
+            OR NOT EXISTS (SELECT 1 FROM positions
+                           WHERE positions.account_id=rebuilt.account_id AND positions.ticker=rebuilt.ticker)
+            UNION ALL
+            SELECT :new_id, account_id, ticker, COALESCE(shares, 0) FROM positions
+            WHERE NOT EXISTS (SELECT 1 FROM snapshot_positions AS previous
+                              WHERE previous.snapshot_id=:snapshot_id AND previous.account_id=positions.account_id
+                              AND previous.ticker=positions.ticker);""", values)
+        # accounts opened since the last snapshot start from their stored balance
+        connection.execute(f"""WITH {REBUILT_BALANCES}
+            INSERT INTO snapshot_balances(snapshot_id, account_id, balance)
+            SELECT :new_id, accounts.id, CASE WHEN previous.account_id IS NULL
+                THEN COALESCE(accounts.balance, 0) ELSE rebuilt.balance END
+            FROM accounts
+            LEFT JOIN rebuilt ON rebuilt.account_id=accounts.id
+            LEFT JOIN snapshot_balances AS previous
+                ON previous.account_id=accounts.id AND previous.snapshot_id=:snapshot_id;""", values)
+        return snapshot_id
+
+
+def rebuild(dbpath=None, apply=True):
+    """ replay the ledger from the latest snapshot and return a list of Drift
+    for every position and balance whose stored value differs from the
+    replayed one. a balance Drift has a ticker of None. with apply=True the
+    stored values are corrected in the same transaction """
+    _check_storage()
+    with db.immediate(dbpath or position.Position.dbpath) as connection:
+        values = _replay_values(connection)
+        drift = [Drift(*row) for row in connection.execute(POSITION_DRIFT, values)]
+        drift += [Drift(row[0], None, row[1], row[2]) for row in connection.execute(BALANCE_DRIFT, values)]
+        if apply:
+            _correct(connection, drift)
+        return drift
+
+
+def _check_storage():
+    if storage.BACKEND is not storage.SQLITE:
+        raise errs.UnsupportedStorageError("the ledger needs the sqlite storage backend")
+
+
+def _replay_values(connection):
+    snapshot_id, last_trade_id, last_deposit_id = latest_snapshot(connection)
+    return {"snapshot_id": snapshot_id, "last_trade_id": last_trade_id,
+            "last_deposit_id": last_deposit_id, "tolerance": LEDGER_TOLERANCE}
+
+
+def _correct(connection, drift):
+    UPSERTSQL = """INSERT INTO positions(ticker, shares, account_id) VALUES (:ticker, :shares, :account_id)
+                   ON CONFLICT(ticker, account_id) DO UPDATE SET shares=excluded.shares;"""
+    connection.executemany(UPSERTSQL, [
+        {"ticker": row.ticker, "shares": row.rebuilt, "account_id": row.account_id}
+        for row in drift if row.ticker is not None])
+    UPDATESQL = "UPDATE accounts SET balance=:balance, version=version+1 WHERE id=:id;"
+    connection.executemany(UPDATESQL, [
+        {"balance": row.rebuilt, "id": row.account_id}
+        for row in drift if row.ticker is None])
@@ -0,0 +1,33 @@
+import threading
+from contextlib import contextmanager
+from .config import ACCOUNT_LOCK_STRIPES
+
+
+class LockStripes:
+    """ a fixed set of locks shared out by key, e.g. account id. The same key
+    always gets the same lock, so work on one account is serialized, while
+    different accounts usually get different locks and do not wait on each
+    other. Memory stays at `stripes` locks however many keys there are """
+
+    def __init__(self, stripes=ACCOUNT_LOCK_STRIPES):
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+
+    def lock_for(self, key):
+        """ return the lock that guards key """
+        return self._locks[hash(key) % self.stripes]
+
+
+    @contextmanager
+    def hold(self, key):
+        """ hold key's lock for the length of a with-block """
+        with self.lock_for(key):
+            yield
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} stripes={self.stripes}>"
+
+
+ACCOUNT_LOCKS = LockStripes()
@@ -0,0 +1,159 @@
+from collections import namedtuple
+import numpy as np
+from .config import PNL_SHARES_EPSILON
+from . import position
+from . import trade
+
+"""
+Profit and loss
+
+An account's trades, or every account's, are loaded into columnar NumPy
+arrays sorted by account, ticker and id, and each (account, ticker) run of
+trades is worked out in one vectorized pass, without a Python loop over the
+trades.
+
+Cost is the weighted average cost: a buy moves the average towards its
+price, a sell leaves it where it is and realizes (price - average) on the
+shares sold, and a buy into a closed position starts a fresh average.
+
+Only the average after the last buy matters, so it is the sum over the
+buys since the position was last opened of cost / shares, each scaled by
+how much the later buys diluted it, and the dilution is a cumulative sum
+of logs. Realized P&L then follows from the totals:
+
+    realized = sell proceeds - (buy costs - average * shares still held)
+"""
+
+TradeColumns = namedtuple("TradeColumns", ["account_id", "ticker", "volume", "unit_price"])
+PnlRow = namedtuple("PnlRow", ["account_id", "ticker", "shares", "average_cost",
+                               "price", "realized", "unrealized"])
+
+def account_pnl(account_id, prices=None, dbpath=None):
+    """ return a list of PnlRow, one per ticker the account holds or has
+    traded. prices is a dict of ticker -> price, the held tickers are batch
+    quoted when it is None """
+    positions = position.Position.all_from_account_id(account_id)
+    return held_pnl(positions, pnl(load_trades(account_id, dbpath), {}), prices)
+
+
+def book_pnl(prices=None, dbpath=None):
+    """ return a list of PnlRow for every account and ticker """
+    return held_pnl(position.Position.all(), pnl(load_trades(None, dbpath), {}), prices)
+
+
+def held_pnl(positions, rows, prices=None):
+    """ join the P&L of rows onto the shares held in positions, so every
+    position is listed, even one with no trades behind it, which has no
+    average cost. a position the trades do not add up to has an unknown
+    cost, so its average_cost, realized and unrealized are None. rows of
+    tickers that are no longer held keep only their realized P&L. returns
+    PnlRows sorted by account and ticker """
+    held = [position for position in positions if abs(position.shares or 0) > PNL_SHARES_EPSILON]
+    if prices is None:
+        prices = trade.get_current_prices_concurrently(sorted({position.ticker for position in held}))
+    traded = {(row.account_id, row.ticker): row for row in rows}
+    result = []
+    for position in held:
+        row = traded.pop((position.account_id, position.ticker), None)
+        if row is None:
+            average, realized = None, 0.0
+        elif abs(row.shares - position.shares) > PNL_SHARES_EPSILON:
+            # the trades do not add up to the shares held, so some of them
+            # were not bought through trades and their cost is not known
+            average, realized = None, None
+        else:
+            average, realized = row.average_cost, row.realized
+        price = prices.get(position.ticker)
+        unrealized = None if price is None or average is None else position.shares * (price - average)
+        result.append(PnlRow(position.account_id, position.ticker, position.shares, average, price,
+                             realized, unrealized))
+    for row in traded.values():
+        result.append(row._replace(shares=0.0, average_cost=None, price=None,
+                                   unrealized=None if row.realized is None else 0.0))
+    result.sort(key=lambda row: (row.account_id, row.ticker))
+    return result
+
+
+def totals(rows):
+    """ return (realized, unrealized) summed over rows, leaving out the
+    P&L that is not known, of tickers with no price or no known cost """
+    return (sum(row.realized for row in rows if row.realized is not None),
+            sum(row.unrealized for row in rows if row.unrealized is not None))
+
+
+def load_trades(account_id=None, dbpath=None):
+    """ return the trades of account_id, or of every account when it is
+    None, as TradeColumns of arrays in account, ticker and id order """
+    rows = trade.Trade.volume_rows(account_id, dbpath)
+    account_ids, tickers, volumes, unit_prices = zip(*rows) if rows else ((), (), (), ())
+    return TradeColumns(np.array(account_ids, dtype=np.int64), np.array(tickers, dtype=object),
+                        np.array(volumes, dtype=float), np.array(unit_prices, dtype=float))
+
+
+def pnl(columns, prices=None):
+    """ return a list of PnlRow for TradeColumns sorted by account, ticker
+    and id. average_cost is None for a closed position, and price and
+    unrealized are None for a ticker with no price. when more shares were
+    sold than bought the cost basis is unknown, and average_cost, realized
+    and unrealized are all None """
+    count = len(columns.volume)
+    if count == 0:
+        return []
+    volume, unit_price = columns.volume, columns.unit_price
+    index = np.arange(count)
+
+    # a run of trades per (account, ticker), numbered by group
+    first = np.ones(count, dtype=bool)
+    first[1:] = (columns.account_id[1:] != columns.account_id[:-1]) | (columns.ticker[1:] != columns.ticker[:-1])
+    group = np.cumsum(first) - 1
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], count) - 1
+
+    # shares held after and before each trade
+    running = np.cumsum(volume)
+    shares = running - (running - volume)[starts][group]
+    before = shares - volume
+    buy = volume > 0
+    cost = volume * unit_price
+
+    # a buy into no shares starts a new average, earlier buys do not count
+    opened = first | (buy & (before <= PNL_SHARES_EPSILON))
+    last_opened = np.maximum.reduceat(np.where(opened, index, 0), starts)
+    live = buy & (index >= last_opened[group])
+
+    # each later buy scales the average by before / shares
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dilution = np.where(buy & ~opened, np.log(before / shares), 0.0)
+        diluted = np.cumsum(dilution)
+        weight = np.exp(diluted[ends][group] - diluted)
+        part = np.where(live, cost / shares * weight, 0.0)
+    groups = len(starts)
+    average = np.bincount(group, weights=part, minlength=groups)
+    held = shares[ends]
+    bought = np.bincount(group, weights=np.where(buy, cost, 0.0), minlength=groups)
+    sold = np.bincount(group, weights=np.where(buy, 0.0, -cost), minlength=groups)
+    realized = sold - (bought - average * held)
+
+    # more shares sold than were bought: the position came from somewhere
+    # else, e.g. an import, and its cost basis is not known
+    unknown = np.minimum.reduceat(shares, starts) < -PNL_SHARES_EPSILON
+    average[unknown] = np.nan
+    realized[unknown] = np.nan
+
+    tickers = columns.ticker[starts]
+    held_open = np.abs(held) > PNL_SHARES_EPSILON
+    if prices is None:
+        prices = trade.get_current_prices_concurrently(sorted(set(tickers[held_open])))
+    price = np.array([prices.get(ticker) for ticker in tickers], dtype=float) # None -> nan
+    unrealized = np.where(held_open | unknown, held * (price - average), 0.0)
+
+    rows = []
+    for n, account_id in enumerate(columns.account_id[starts].tolist()):
+        rows.append(PnlRow(account_id, tickers[n], float(held[n]),
+                           _number(average[n]) if held_open[n] else None,
+                           _number(price[n]), _number(realized[n]), _number(unrealized[n])))
+    return rows
+
+
+def _number(value):
+    return None if np.isnan(value) else float(value)
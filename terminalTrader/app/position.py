@@ -3,6 +3,9 @@ from .config import DBPATH
 from . import account
 from . import trade
 from . import errs
+from . import db
+from . import session
+from . import storage
 # """
 # CREATE TABLE positions(
 #         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -14,8 +17,16 @@ from . import errs
 #     );
 # """
 
+# default of Position.value, which looks the price up itself; a price of
+# None passed in means the ticker has no price
+_FETCH = object()
+
 class Position:
 
+    # slots instead of a __dict__ per object, in the column order of the table
+    __slots__ = ("id", "ticker", "shares", "account_id")
+    COLUMNS = ", ".join(__slots__)
+
     dbpath = DBPATH
 
     @classmethod
@@ -31,55 +42,93 @@ class Position:
         self.account_id = kwargs.get("account_id")
 
 
+    @classmethod
+    def from_row(cls, row):
+        """ build an object from a row of SELECT COLUMNS, without __init__ """
+        position = cls.__new__(cls)
+        position.id, position.ticker, position.shares, position.account_id = row
+        return position
+
+
+    @storage.backed
     def save(self):
         """ inserts or updates depending on id's value """
+        with db.transaction(self.dbpath) as connection:
+            self.save_with(connection)
+        session.clean(self)
+
+
+    @storage.backed
+    def save_with(self, connection):
+        """ save using an open connection, without committing, so the write
+        can share a transaction with others """
         if self.id is None:
-            self._insert()
+            self._insert(connection)
         else:
-            self._update()
+            self._update(connection)
 
 
-    def _insert(self):
+    def _insert(self, connection):
         """ inserts a new row into the database and sets self.id """
-        with sqlite3.connect(self.dbpath) as connection: 
-            cursor = connection.cursor()
-            INSERTSQL = """INSERT INTO positions(ticker, shares, account_id) 
-            VALUES (:ticker, :shares, :account_id); """
-            values = {
-                "ticker": self.ticker,
-                "shares" : self.shares, 
-                "account_id" : self.account_id 
-            }
-            try: 
-                cursor.execute(INSERTSQL, values)
-                self.id = cursor.lastrowid      
-            except sqlite3.IntegrityError:
-                raise ValueError("ticker not set or a position for this ticker already exists")
+        cursor = connection.cursor()
+        INSERTSQL = """INSERT INTO positions(ticker, shares, account_id) 
+        VALUES (:ticker, :shares, :account_id); """
+        values = {
+            "ticker": self.ticker,
+            "shares" : self.shares, 
+            "account_id" : self.account_id 
+        }
+        try: 
+            cursor.execute(INSERTSQL, values)
+            self.id = cursor.lastrowid      
+        except sqlite3.IntegrityError:
+            raise ValueError("ticker not set or a position for this ticker already exists")
 
 
-    def _update(self):
+    def _update(self, connection):
         """ updates the row with id=self.id with this objects current values"""
-        with sqlite3.connect(self.dbpath) as connection: 
-            cursor = connection.cursor()
-            UPDATESQL = """UPDATE positions 
-            SET ticker=:ticker, shares=:shares, account_id=:account_id 
-            WHERE id=:id;"""
-            values = {
-                "ticker": self.ticker,
-                "shares" : self.shares, 
-                "account_id" : self.account_id,
-                "id" : self.id
-                }
+        cursor = connection.cursor()
+        UPDATESQL = """UPDATE positions 
+        SET ticker=:ticker, shares=:shares, account_id=:account_id 
+        WHERE id=:id;"""
+        values = {
+            "ticker": self.ticker,
+            "shares" : self.shares, 
+            "account_id" : self.account_id,
+            "id" : self.id
+            }
+        try:
+            cursor.execute(UPDATESQL, values)
+            # Check back on this line here..... do we need to raise an error?
+        except sqlite3.IntegrityError:
+            raise ValueError("ticker not set or a position for this ticker already exists")
+
+
+    @classmethod
+    @storage.backed
+    def upsert_many(cls, positions):
+        """ write many positions with one executemany in a single transaction.
+        a position that already exists for its ticker and account_id has its
+        shares replaced, otherwise a new row is inserted. ids are not set """
+        UPSERTSQL = """INSERT INTO positions(ticker, shares, account_id)
+        VALUES (:ticker, :shares, :account_id)
+        ON CONFLICT(ticker, account_id) DO UPDATE SET shares=excluded.shares;"""
+        values = [{
+                "ticker": position.ticker,
+                "shares": position.shares,
+                "account_id": position.account_id
+            } for position in positions]
+        with db.transaction(cls.dbpath) as connection:
             try:
-                cursor.execute(UPDATESQL, values)
-                # Check back on this line here..... do we need to raise an error?
+                connection.executemany(UPSERTSQL, values)
             except sqlite3.IntegrityError:
-                raise ValueError("ticker not set or a position for this ticker already exists")
+                raise ValueError("ticker not set for a position")
 
 
+    @storage.backed
     def delete(self):
         """ deletes row with id=self.id from db and sets self.id to None """
-        with sqlite3.connect(self.dbpath) as connection: 
+        with db.transaction(self.dbpath) as connection: 
             cursor = connection.cursor()
             DELETESQL = "DELETE FROM positions WHERE id=:id;"
             try: 
@@ -90,76 +139,121 @@ class Position:
         
 
     @classmethod
+    @storage.backed
     def delete_all(cls):
         """ delete all rows from this table """
-        with sqlite3.connect(cls.dbpath) as connection:
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             DELETE_SQL = "DELETE FROM positions;"
             cursor.execute(DELETE_SQL)
             
 
     @classmethod
+    @storage.backed
     def from_id(cls, id):
         """ return an object of this class for the given database row id """
-        with sqlite3.connect(cls.dbpath) as connection:
-            SELECTSQL = "SELECT * FROM positions WHERE id=:id;"
-            connection.row_factory = sqlite3.Row
+        cached = session.cached(cls, id)
+        if cached is not None:
+            return cached
+        with db.transaction(cls.dbpath) as connection:
+            SELECTSQL = f"SELECT {cls.COLUMNS} FROM positions WHERE id=:id;"
             cursor = connection.cursor()
             cursor.execute(SELECTSQL, {"id": id})
             dictrow = cursor.fetchone()
             if dictrow:
                 # this is creating an instance with that particular row of data
-                return cls(**dictrow)
+                return session.remember(cls.from_row(dictrow))
             return None
 
     @classmethod
+    @storage.backed
     def all(cls):
         """ return a list of every row of this table as objects of this class """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
-            SELECTSQL = "SELECT * FROM positions;"
+            SELECTSQL = f"SELECT {cls.COLUMNS} FROM positions;"
             cursor.execute(SELECTSQL)
             result = []
             for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
+                result.append(cls.from_row(dictrow))
             return result
 
 
     def __repr__(self):
         """ return a string representing this object """
         # this is a good default __repr__
-        return f"<{type(self).__name__} {self.__dict__}>"
+        return f"<{type(self).__name__} {session.fields(self)}>"
     
-    def value(self):
-        """ look up the current price and return that * number of shares """
-        ## will complete w API integration
-        pass
+    def value(self, price=_FETCH):
+        """ look up the current price and return that * number of shares.
+        pass price when it has already been fetched, e.g. by a batch quote,
+        even when it is None. returns None if the ticker has no price """
+        if price is _FETCH:
+            price = trade.get_current_price(self.ticker)
+        if price is None:
+            return None
+        return self.shares * price
+
+
+    @classmethod
+    @storage.backed
+    def held_rows(cls, sort=None, descending=True, limit=None, offset=0, dbpath=None):
+        """ return (account_id, username, ticker, shares) rows for every
+        position with shares, ordered by sort, "shares" or "account_id", and
+        paged with limit and offset """
+        SELECTSQL = """SELECT positions.account_id, accounts.username, positions.ticker, positions.shares
+                       FROM positions JOIN accounts ON accounts.id=positions.account_id
+                       WHERE positions.shares>0"""
+        if sort is not None:
+            if sort not in ("shares", "account_id"):
+                raise ValueError(f"unknown sort {sort!r}")
+            order = "DESC" if descending else "ASC"
+            SELECTSQL += f" ORDER BY positions.{sort} {order}, positions.id"
+        with db.transaction(dbpath or cls.dbpath) as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            values = {"limit": -1 if limit is None else limit, "offset": offset}
+            return cursor.execute(SELECTSQL + " LIMIT :limit OFFSET :offset;", values).fetchall()
 
 
     @classmethod
+    @storage.backed
     def all_from_account_id(cls, account_id):
         """ return every Position object for a given account_id that has more than
         0 shares """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
-            SELECTSQL = "SELECT * FROM positions WHERE account_id=:account_id AND shares>0;"
+            SELECTSQL = f"SELECT {cls.COLUMNS} FROM positions WHERE account_id=:account_id AND shares>0;"
             cursor.execute(SELECTSQL, {"account_id": account_id})
             result = []
             for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
+                result.append(cls.from_row(dictrow))
             return result
 
 
     @classmethod
+    @storage.backed
+    def held_tickers(cls):
+        """ return a list of every ticker that some account has shares of """
+        with db.transaction(cls.dbpath) as connection:
+            cursor = connection.cursor()
+            SELECTSQL = "SELECT DISTINCT ticker FROM positions WHERE shares>0;"
+            cursor.execute(SELECTSQL)
+            return [row[0] for row in cursor.fetchall()]
+
+
+    @classmethod
+    @storage.backed
     def from_account_id_and_ticker(cls, account_id, ticker):
         """ return the Position object for a given account_id and ticker symbol
         if there is no such position, return a new object with zero shares """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        key = (cls, account_id, ticker)
+        cached = session.found(key)
+        if cached is not None:
+            return cached
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
-            SELECTSQL = "SELECT * FROM positions WHERE account_id=:account_id AND ticker=:ticker;"
+            SELECTSQL = f"SELECT {cls.COLUMNS} FROM positions WHERE account_id=:account_id AND ticker=:ticker;"
             values = {
                     "account_id": account_id,
                     "ticker": ticker
@@ -167,10 +261,42 @@ class Position:
             cursor.execute(SELECTSQL, values)
             result = None # result = [] in previous logic, list isn't ideal
             for dictrow in cursor.fetchall():
-                result = cls(**dictrow)
+                result = cls.from_row(dictrow)
             if result is None:
-                return cls(account_id=account_id, ticker=ticker, shares=0)
-            return result
+                result = cls(account_id=account_id, ticker=ticker, shares=0)
+            return session.remember(result, key)
+
+
+    @classmethod
+    @storage.backed
+    def add_shares_with(cls, connection, account_id, ticker, shares):
+        """ add shares to the account's position in ticker, creating it if it
+        does not exist, using an open connection without committing """
+        UPSERTSQL = """INSERT INTO positions(ticker, shares, account_id)
+        VALUES (:ticker, :shares, :account_id)
+        ON CONFLICT(ticker, account_id) DO UPDATE SET shares=shares+excluded.shares;"""
+        values = {
+                "ticker": ticker,
+                "shares": shares,
+                "account_id": account_id
+            }
+        connection.execute(UPSERTSQL, values)
+
+
+    @classmethod
+    @storage.backed
+    def remove_shares_with(cls, connection, account_id, ticker, shares):
+        """ take shares out of the account's position in ticker using an open
+        connection without committing. returns False, changing nothing, if
+        the position does not hold that many shares """
+        UPDATESQL = """UPDATE positions SET shares=shares-:shares
+        WHERE account_id=:account_id AND ticker=:ticker AND shares>=:shares;"""
+        values = {
+                "ticker": ticker,
+                "shares": shares,
+                "account_id": account_id
+            }
+        return connection.execute(UPDATESQL, values).rowcount == 1
 
 
     def get_account(self):
@@ -0,0 +1,109 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .config import (IEX_BASE_URL, IEX_TOKENFILE, IEX_BATCH_SIZE,
+                     IEX_TIMEOUT, IEX_POOL_SIZE)
+
+
+class PriceClient:
+    """ long-lived IEX quote client. Keeps one keep-alive requests.Session
+    with a connection pool and reads the api token once, on first use """
+
+    def __init__(self, base_url=IEX_BASE_URL, tokenfile=IEX_TOKENFILE,
+                 timeout=IEX_TIMEOUT, pool_size=IEX_POOL_SIZE,
+                 batch_size=IEX_BATCH_SIZE):
+        self.base_url = base_url
+        self.tokenfile = tokenfile
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self._token = None
+        self._session = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def token(self):
+        """ the api token, read from tokenfile the first time it is needed """
+        if self._token is None:
+            with self._lock:
+                if self._token is None:
+                    with open(self.tokenfile) as tokenfile:
+                        self._token = tokenfile.read().strip()
+        return self._token
+
+
+    @property
+    def session(self):
+        """ the pooled session, created the first time it is needed """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                          pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+
+    def get_price(self, ticker):
+        """ return the latest price of ticker, None if IEX does not know it.
+        can raise requests.ConnectionError, requests.Timeout or, when IEX
+        answers with an error such as 503 or 429, requests.HTTPError """
+        url = "{base}/stock/{ticker}/quote".format(base=self.base_url, ticker=ticker)
+        response = self.session.get(url, params={"token": self.token}, timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()['latestPrice']
+
+
+    def get_prices(self, tickers, timeout=None):
+        """ return a dict of ticker -> latest price for the tickers IEX found,
+        requesting at most batch_size symbols per call. timeout, in seconds,
+        overrides the client's timeout for these calls. raises like get_price """
+        prices = {}
+        for start in range(0, len(tickers), self.batch_size):
+            prices.update(self._get_batch(tickers[start:start + self.batch_size], timeout))
+        return prices
+
+
+    def _get_batch(self, tickers, timeout=None):
+        """ fetch one IEX batch of quotes """
+        url = "{base}/stock/market/batch".format(base=self.base_url)
+        params = {"symbols": ",".join(tickers), "types": "quote", "token": self.token}
+        response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+
+        data = response.json()
+        prices = {}
+        for ticker in tickers:
+            quote = data.get(ticker.upper(), {}).get("quote")
+            if quote and quote.get("latestPrice") is not None:
+                prices[ticker] = quote["latestPrice"]
+        return prices
+
+
+    def get_symbols(self):
+        """ return a list of every ticker symbol IEX supports """
+        url = "{base}/ref-data/symbols".format(base=self.base_url)
+        response = self.session.get(url, params={"token": self.token}, timeout=self.timeout)
+        response.raise_for_status()
+        return [row["symbol"] for row in response.json()]
+
+
+    def close(self):
+        """ close the pooled connections and forget the token """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._token = None
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.base_url}>"
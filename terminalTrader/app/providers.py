@@ -0,0 +1,166 @@
+import csv
+import sqlite3
+import threading
+from .config import DICT_FAKES, PRICE_PROVIDER, PRICE_REPLAY_FILE
+from . import price_client
+
+
+class PriceProvider:
+    """ where prices come from. Subclasses implement get_price and may
+    override get_prices with something faster than one call per ticker.
+
+    remote is True when a lookup costs a network round trip, which tells
+    trade.py whether it is worth caching the answers """
+
+    remote = False
+
+    def get_price(self, ticker):
+        """ return the current price of ticker, None if it is not found """
+        raise NotImplementedError
+
+
+    def get_prices(self, tickers):
+        """ return a dict of ticker -> price for the tickers that were found """
+        prices = {}
+        for ticker in tickers:
+            price = self.get_price(ticker)
+            if price is not None:
+                prices[ticker] = price
+        return prices
+
+
+    def get_prices_within(self, tickers, timeout):
+        """ like get_prices, but a provider that makes network calls gives
+        each of them at most timeout seconds """
+        return self.get_prices(tickers)
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__}>"
+
+
+class IEXProvider(PriceProvider):
+    """ live prices from IEX cloud through a pooled PriceClient """
+
+    remote = True
+
+    def __init__(self, client=None):
+        self.client = client or price_client.PriceClient()
+
+
+    def get_price(self, ticker):
+        return self.client.get_price(ticker)
+
+
+    def get_prices(self, tickers):
+        return self.client.get_prices(list(tickers))
+
+
+    def get_prices_within(self, tickers, timeout):
+        return self.client.get_prices(list(tickers), timeout=timeout)
+
+
+class StaticProvider(PriceProvider):
+    """ prices from an in-process dict. Tickers that are not in the dict are
+    passed to fallback, if there is one """
+
+    def __init__(self, prices=None, fallback=None):
+        self.prices = dict(DICT_FAKES if prices is None else prices)
+        self.fallback = fallback
+
+
+    @property
+    def remote(self):
+        return self.fallback is not None and self.fallback.remote
+
+
+    def get_price(self, ticker):
+        if ticker in self.prices:
+            return self.prices[ticker]
+        if self.fallback is not None:
+            return self.fallback.get_price(ticker)
+        return None
+
+
+    def get_prices(self, tickers):
+        prices = {ticker: self.prices[ticker] for ticker in tickers if ticker in self.prices}
+        rest = [ticker for ticker in tickers if ticker not in prices]
+        if rest and self.fallback is not None:
+            prices.update(self.fallback.get_prices(rest))
+        return prices
+
+
+    def get_prices_within(self, tickers, timeout):
+        prices = {ticker: self.prices[ticker] for ticker in tickers if ticker in self.prices}
+        rest = [ticker for ticker in tickers if ticker not in prices]
+        if rest and self.fallback is not None:
+            prices.update(self.fallback.get_prices_within(rest, timeout))
+        return prices
+
+
+class ReplayProvider(PriceProvider):
+    """ replays recorded ticks from a CSV file (ticker,ts,price columns) or a
+    SQLite database with a price_ticks(ticker, ts, price) table.
+
+    Each lookup of a ticker returns its next tick in time order, starting
+    over at the first tick once the recording runs out (or returning None if
+    loop is False). The same sequence of calls always sees the same prices """
+
+    def __init__(self, path=PRICE_REPLAY_FILE, loop=True):
+        self.path = path
+        self.loop = loop
+        self.ticks = self._load(path)
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _load(path):
+        """ return a dict of ticker -> list of prices sorted by ts """
+        if path.endswith(".csv"):
+            with open(path, newline="") as tickfile:
+                rows = [(row["ticker"], float(row["ts"]), float(row["price"]))
+                        for row in csv.DictReader(tickfile)]
+        else:
+            with sqlite3.connect(path) as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT ticker, ts, price FROM price_ticks;")
+                rows = cursor.fetchall()
+
+        ticks = {}
+        for ticker, ts, price in sorted(rows, key=lambda row: row[1]):
+            ticks.setdefault(ticker, []).append(price)
+        return ticks
+
+
+    def get_price(self, ticker):
+        prices = self.ticks.get(ticker)
+        if not prices:
+            return None
+        with self._lock:
+            index = self._cursors.get(ticker, 0)
+            if index >= len(prices):
+                if not self.loop:
+                    return None
+                index = 0
+            self._cursors[ticker] = index + 1
+        return prices[index]
+
+
+    def reset(self):
+        """ rewind every ticker to its first tick """
+        with self._lock:
+            self._cursors.clear()
+
+
+def from_config(name=PRICE_PROVIDER):
+    """ build the provider named in app.config: "iex" (live prices, with
+    DICT_FAKES answered locally), "static" (DICT_FAKES only) or "replay"
+    (ticks recorded in PRICE_REPLAY_FILE) """
+    if name == "iex":
+        return StaticProvider(DICT_FAKES, fallback=IEXProvider())
+    if name == "static":
+        return StaticProvider(DICT_FAKES)
+    if name == "replay":
+        return ReplayProvider(PRICE_REPLAY_FILE)
+    raise ValueError(f"unknown price provider {name!r}")
@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+from .config import REFRESH_INTERVAL
+from . import errs
+from . import position
+from . import trade
+
+
+class PriceRefresher:
+    """ background thread that keeps hot tickers warm in trade.QUOTE_CACHE.
+
+    Hot tickers are the ones held in positions plus the ones recently looked
+    up through trade.get_quote. Every interval seconds they are all fetched
+    again in batch calls, so the CLI quote lookup, Flask buy/sell and
+    position valuation almost always find a fresh price """
+
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        self.runs = 0
+        self.refreshed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def hot_tickers(self):
+        """ return the tickers worth keeping warm, held ones first """
+        held = position.Position.held_tickers()
+        return list(dict.fromkeys(held + trade.recent_tickers()))
+
+
+    def refresh_once(self):
+        """ fetch every hot ticker now and return a dict of ticker -> price """
+        prices = trade.refresh_prices(self.hot_tickers())
+        self.runs += 1
+        self.refreshed += sum(1 for price in prices.values() if price is not None)
+        return prices
+
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def start(self):
+        """ start the refresher thread if it is not already running """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="price-refresher", daemon=True)
+        self._thread.start()
+
+
+    def stop(self, timeout=None):
+        """ ask the refresher thread to stop and wait for it """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except (OSError, sqlite3.Error, errs.PriceUnavailableError):
+                pass # try again next interval, user lookups still work without us
+            self._stop.wait(self.interval)
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} runs={self.runs} refreshed={self.refreshed}>"
+
+
+PRICE_REFRESHER = PriceRefresher()
+
+def start():
+    """ start the process-wide refresher """
+    PRICE_REFRESHER.start()
+
+
+def stop():
+    """ stop the process-wide refresher """
+    PRICE_REFRESHER.stop()
@@ -0,0 +1,65 @@
+import heapq
+from collections import namedtuple
+from . import position
+from . import trade
+
+"""
+Admin portfolio report
+
+Every account's positions are read with one joined query and the distinct
+tickers are priced with one batch quote, instead of loading each account and
+its positions and quoting each position one at a time.
+
+When sorting by a column of the table (shares, account_id) the sort and the
+page are done by the storage, SQLite by default, so only the tickers on the
+page are priced. Sorting by value needs every price, so the rows are
+valued in one pass and the top rows are picked with a heap.
+"""
+
+ReportRow = namedtuple("ReportRow", ["account_id", "username", "ticker", "shares", "price", "value"])
+
+COLUMN_SORTS = {"shares", "account_id"}
+SORTS = COLUMN_SORTS | {"value"}
+
+
+def portfolio_report(sort="shares", descending=True, limit=None, offset=0, dbpath=None):
+    """ return a list of ReportRow for every held position, sorted by sort
+    (one of SORTS) and paged with limit and offset. a ticker with no price
+    has a price and value of None and sorts last by value """
+    if sort not in SORTS:
+        raise ValueError(f"unknown report sort {sort!r}")
+    held_rows = position.Position.held_rows
+
+    if sort in COLUMN_SORTS:
+        return _value(held_rows(sort, descending, limit, offset, dbpath))
+
+    rows = _value(held_rows(dbpath=dbpath))
+    key = _value_key(descending)
+    if limit is None:
+        rows.sort(key=key)
+        return rows[offset:]
+    return heapq.nsmallest(offset + limit, rows, key=key)[offset:]
+
+
+def top_positions(count, sort="value", dbpath=None):
+    """ return the count largest positions by sort """
+    return portfolio_report(sort=sort, limit=count, dbpath=dbpath)
+
+
+def _value(rows):
+    """ price the distinct tickers of (account_id, username, ticker, shares)
+    rows in one batch and build ReportRows """
+    prices = trade.get_current_prices_concurrently(list({row[2] for row in rows}))
+    result = []
+    for account_id, username, ticker, shares in rows:
+        price = prices.get(ticker)
+        value = None if price is None else shares * price
+        result.append(ReportRow(account_id, username, ticker, shares, price, value))
+    return result
+
+
+def _value_key(descending):
+    """ return a sort key that orders rows by value, with unpriced positions
+    at the bottom either way """
+    sign = -1 if descending else 1
+    return lambda row: (row.value is None, sign * (row.value or 0))
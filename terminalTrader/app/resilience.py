@@ -0,0 +1,83 @@
+import time
+import threading
+from .config import BREAKER_FAILURES, BREAKER_RESET
+from . import errs
+
+
+class CircuitBreaker:
+    """ stops calling an upstream that keeps failing.
+
+    closed:    calls go through. failure_threshold failures in a row opens it
+    open:      calls fail at once with PriceUnavailableError until
+               reset_timeout seconds have passed
+    half-open: one trial call goes through. success closes the breaker,
+               failure opens it again """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+
+    def call(self, function, *args):
+        """ return function(*args) unless the breaker is open. can raise
+        PriceUnavailableError or whatever function raises """
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_running):
+                self.rejected += 1
+                raise errs.PriceUnavailableError("quote source is unavailable, circuit is open")
+            if self.state == self.HALF_OPEN:
+                self._trial_running = True
+
+        try:
+            result = function(*args)
+        except Exception:
+            self._record(success=False)
+            raise
+        self._record(success=True)
+        return result
+
+
+    def _record(self, success):
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+
+    def reset(self):
+        """ close the breaker and forget past failures """
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+
+    def stats(self):
+        """ return a dict of the breaker state and counters """
+        with self._lock:
+            return {"state": self.state, "failures": self.failures,
+                    "rejected": self.rejected}
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.stats()}>"
@@ -0,0 +1,190 @@
+import threading
+from . import storage
+
+"""
+Unit of work
+
+A Session is opened for one CLI action or Flask request:
+
+    with session.Session():
+        acct = Account.from_api_key(api_key)
+        ...
+
+While it is open, the model lookups (from_id, from_api_key,
+from_account_id_and_ticker, ...) hand back the object already loaded for
+that row instead of querying again, so every part of the action works on the
+same instance. When the block ends without an exception, every object that
+was changed since it was loaded, and every object passed to add(), is saved
+in one transaction.
+
+Outside of a session the lookups behave as before.
+"""
+
+_local = threading.local()
+
+
+class Session:
+
+    def __init__(self, dbpath=None):
+        self.dbpath = dbpath
+        self.hits = 0
+        self._objects = {}  # (class, id) -> object
+        self._keys = {}     # other unique lookup key -> object
+        self._loaded = {}   # id(object) -> (object, its fields when loaded)
+        self._added = []
+
+
+    def get(self, cls, id):
+        """ return the loaded cls object for row id, None if there is none """
+        obj = self._objects.get((cls, id))
+        if obj is not None:
+            self.hits += 1
+        return obj
+
+
+    def find(self, key):
+        """ return the object loaded under another unique key, e.g.
+        (Position, account_id, ticker), None if there is none """
+        obj = self._keys.get(key)
+        if obj is not None:
+            self.hits += 1
+        return obj
+
+
+    def remember(self, obj, *keys):
+        """ put a freshly loaded obj in the identity map, under its id and
+        each of keys. returns the object already mapped for that row, if any,
+        so callers always share one instance per row """
+        if obj.id is not None:
+            obj = self._objects.setdefault((type(obj), obj.id), obj)
+        for key in keys:
+            obj = self._keys.setdefault(key, obj)
+        if id(obj) not in self._loaded:
+            self._loaded[id(obj)] = (obj, fields(obj))
+        return obj
+
+
+    def add(self, obj):
+        """ save obj at flush() even if it has not changed, e.g. a new object """
+        self._added.append(obj)
+
+
+    def clean(self, obj):
+        """ note that obj has just been written, so it is not dirty """
+        if obj is not None and id(obj) in self._loaded:
+            self._loaded[id(obj)] = (obj, fields(obj))
+
+
+    def evict(self, key):
+        """ forget the object loaded under a lookup key, so the next lookup
+        reads the row again, e.g. after it was changed with SQL """
+        obj = self._keys.pop(key, None)
+        if obj is not None:
+            self._loaded.pop(id(obj), None)
+            self._objects.pop((type(obj), obj.id), None)
+
+
+    def dirty(self):
+        """ return the objects flush() would save """
+        result = list(self._added)
+        for obj, loaded in self._loaded.values():
+            if loaded["id"] is not None and obj.id is None:
+                continue # deleted
+            if fields(obj) != loaded and obj not in result:
+                result.append(obj)
+        return result
+
+
+    def flush(self):
+        """ save every dirty object in one transaction """
+        objects = self.dirty()
+        if not objects:
+            return
+        dbpath = self.dbpath or objects[0].dbpath
+        with storage.transaction(dbpath) as connection:
+            for obj in objects:
+                obj.save_with(connection)
+        self._added = []
+        for obj in objects:
+            if obj.id is not None:
+                self._objects.setdefault((type(obj), obj.id), obj)
+            self._loaded[id(obj)] = (obj, fields(obj))
+
+
+    def open(self):
+        """ make this the thread's current session """
+        _stack().append(self)
+        return self
+
+
+    def close(self):
+        """ stop being the current session, without flushing """
+        if self in _stack():
+            _stack().remove(self)
+
+
+    def __enter__(self):
+        return self.open()
+
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        if exc_type is None:
+            self.flush()
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} objects={len(self._loaded)} hits={self.hits}>"
+
+
+def fields(obj):
+    """ return a dict of a model object's slotted fields """
+    return {name: getattr(obj, name, None) for name in type(obj).__slots__}
+
+
+def _stack():
+    if not hasattr(_local, "sessions"):
+        _local.sessions = []
+    return _local.sessions
+
+
+def current():
+    """ return this thread's innermost open Session, None if there is none """
+    sessions = _stack()
+    return sessions[-1] if sessions else None
+
+
+def cached(cls, id):
+    """ the open session's cls object for row id, None if there is none """
+    session = current()
+    return session.get(cls, id) if session else None
+
+
+def found(key):
+    """ the open session's object for a unique lookup key, None if none """
+    session = current()
+    return session.find(key) if session else None
+
+
+def remember(obj, *keys):
+    """ add a loaded obj to the open session, if there is one, and return
+    the instance callers should use """
+    session = current()
+    if session is None or obj is None:
+        return obj
+    return session.remember(obj, *keys)
+
+
+def clean(*objs):
+    """ tell the open session, if any, that objs were just saved """
+    session = current()
+    if session is not None:
+        for obj in objs:
+            session.clean(obj)
+
+
+def evict(key):
+    """ make the open session, if any, forget the object under key """
+    session = current()
+    if session is not None:
+        session.evict(key)
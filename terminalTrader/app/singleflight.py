@@ -0,0 +1,63 @@
+import threading
+
+
+class _Call:
+    """ one in-flight call that other callers can wait on """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ makes sure only one call per key runs at a time. Callers that arrive
+    while a call for their key is in flight wait for it and share its result
+    (or its exception) instead of starting their own """
+
+    def __init__(self):
+        self.calls = 0      # calls that actually ran
+        self.coalesced = 0  # calls that waited on someone else's result
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+
+    def do(self, key, function, *args):
+        """ return function(*args), sharing one run between concurrent
+        callers that use the same key """
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+
+    def stats(self):
+        """ return a dict of how many calls ran and how many were coalesced """
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced,
+                    "in_flight": len(self._in_flight)}
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.stats()}>"
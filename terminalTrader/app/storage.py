@@ -0,0 +1,467 @@
+import functools
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from random import randint
+from .config import STORAGE, TRADE_PAGE_SIZE
+from . import db
+from . import errs
+from . import session
+
+"""
+Storage backends
+
+Every method of Account, Position and Trade that reads or writes rows is
+marked @storage.backed. With the "sqlite" backend (the default) those
+methods run their own SQL, as always. Another backend supplies, for each
+model, a repository object with methods of the same names and signatures,
+and while it is selected with setStorage() the backed methods are sent to
+it instead.
+
+MemoryStorage keeps every table in dicts, with hash indexes on id, api_key,
+username and (account_id, ticker), for simulations and backtests where
+millions of buy()/sell() calls have to take microseconds. It is one
+process's state, nothing is written to disk, and a write that raises part
+way through is not rolled back. An order holds only its account's lock, so
+orders for different accounts run side by side, and each row it changes is
+updated under the store's lock.
+"""
+
+SQLITE = None  # the backed methods' own SQL is the SQLite backend
+BACKEND = SQLITE
+
+
+def setStorage(backend):
+    """ pick the storage the models use: "sqlite", "memory", or a backend
+    object such as a MemoryStorage """
+    global BACKEND
+    if backend == "sqlite":
+        backend = SQLITE
+    elif backend == "memory":
+        backend = MemoryStorage()
+    BACKEND = backend
+    return backend
+
+
+def backed(method):
+    """ mark a model method as storage access, so it is sent to the selected
+    backend's repository for that model when that is not SQLite """
+    model = method.__qualname__.split(".")[0]
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if BACKEND is SQLITE:
+            return method(*args, **kwargs)
+        return getattr(BACKEND.repository(model), name)(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def transaction(dbpath=None):
+    """ a write transaction on the selected storage: an sqlite3 connection
+    from db.transaction, or the in-memory store itself """
+    if BACKEND is SQLITE:
+        with db.transaction(dbpath) as connection:
+            yield connection
+    else:
+        with BACKEND.lock:
+            yield BACKEND
+
+
+class MemoryStorage:
+    """ in-process tables, one dict of id -> row tuple per table """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.accounts = {}
+        self.positions = {}
+        self.trades = {}
+        self.deposits = {}
+        self.accounts_by_api_key = {}      # str(api_key) -> id
+        self.accounts_by_username = {}     # username -> id
+        self.positions_by_key = {}         # (account_id, ticker) -> id
+        self.trades_by_account = {}        # account_id -> [id, ...] in id order
+        self._repositories = {
+            "Account": AccountRepository(self),
+            "Position": PositionRepository(self),
+            "Trade": TradeRepository(self),
+        }
+        self._ids = {"accounts": 0, "positions": 0, "trades": 0, "deposits": 0}
+
+
+    def repository(self, model):
+        return self._repositories[model]
+
+
+    def next_id(self, table):
+        with self.lock:
+            self._ids[table] += 1
+            return self._ids[table]
+
+
+    def __repr__(self):
+        return (f"<{type(self).__name__} accounts={len(self.accounts)} "
+                f"positions={len(self.positions)} trades={len(self.trades)}>")
+
+
+class AccountRepository:
+
+    def __init__(self, store):
+        self.store = store
+
+
+    def save(self, acct):
+        with self.store.lock:
+            self.save_with(acct, self.store)
+
+
+    def save_with(self, acct, connection):
+        if acct.id is None:
+            self._insert(acct)
+        else:
+            self._update(acct)
+
+
+    def _insert(self, acct, api_key=None):
+        store = self.store
+        acct.account_number = randint(1111111,9999999)
+        acct.id = store.next_id("accounts")
+        row = _row(acct)
+        # like the SQL insert, the stored api_key is made up here
+        row = row[:9] + (api_key or randint(111111111, 999999999),) + row[10:]
+        store.accounts[acct.id] = row
+        self._index(row)
+
+
+    def _update(self, acct):
+        store = self.store
+        old = store.accounts.get(acct.id)
+        if old is None or old[10] != acct.version:
+            raise errs.StaleAccountError
+        acct.version += 1
+        row = _row(acct)
+        row = row[:9] + (old[9],) + row[10:] # the api_key is never updated
+        self._unindex(old)
+        store.accounts[acct.id] = row
+        self._index(row)
+
+
+    def _index(self, row):
+        self.store.accounts_by_api_key.setdefault(str(row[9]), row[0])
+        self.store.accounts_by_username.setdefault(row[3], row[0])
+
+
+    def _unindex(self, row):
+        for index, key in ((self.store.accounts_by_api_key, str(row[9])),
+                           (self.store.accounts_by_username, row[3])):
+            if index.get(key) == row[0]:
+                del index[key]
+
+
+    def save_many(self, cls, accounts):
+        with self.store.lock:
+            for acct in accounts:
+                if acct.id is None:
+                    acct.api_key = randint(111111111, 999999999)
+                    self._insert(acct, acct.api_key)
+                else:
+                    self._update(acct)
+
+
+    def delete(self, acct):
+        with self.store.lock:
+            row = self.store.accounts.pop(acct.id, None)
+            if row is not None:
+                self._unindex(row)
+            acct.id = None
+
+
+    def from_id(self, cls, id, *keys):
+        acct = session.cached(cls, id)
+        if acct is not None:
+            return acct
+        row = self.store.accounts.get(id)
+        return session.remember(cls.from_row(row), *keys) if row else None
+
+
+    def from_api_key(self, cls, api_key):
+        key = (cls, "api_key", str(api_key))
+        return session.found(key) or self.from_id(
+            cls, self.store.accounts_by_api_key.get(str(api_key)), key)
+
+
+    def get_from_username(self, cls, username):
+        key = (cls, "username", username)
+        return session.found(key) or self.from_id(
+            cls, self.store.accounts_by_username.get(username), key)
+
+
+    def all(self, cls):
+        return [cls.from_row(row) for row in list(self.store.accounts.values())]
+
+
+    def delete_all(self, cls):
+        with self.store.lock:
+            self.store.accounts.clear()
+            self.store.accounts_by_api_key.clear()
+            self.store.accounts_by_username.clear()
+
+
+    def _execute(self, acct, fn):
+        # the caller holds the account's lock from locks.ACCOUNT_LOCKS, so
+        # orders for different accounts run side by side
+        return fn(self.store)
+
+
+    def _balance_with(self, acct, connection):
+        row = self.store.accounts.get(acct.id)
+        if row is None:
+            raise ValueError("account must be saved before it can trade")
+        return row[6] or 0.0, row[10]
+
+
+    def _add_to_balance_with(self, acct, connection, amount):
+        with self.store.lock: # against save() of the same account
+            row = self.store.accounts[acct.id]
+            self.store.accounts[acct.id] = row[:6] + ((row[6] or 0.0) + amount,) + row[7:10] + (row[10] + 1,)
+
+
+    def _record_deposit_with(self, acct, connection, amount):
+        id = self.store.next_id("deposits")
+        self.store.deposits[id] = (id, acct.id, amount, time.time())
+
+
+class PositionRepository:
+
+    def __init__(self, store):
+        self.store = store
+
+
+    def save(self, position):
+        with self.store.lock:
+            self.save_with(position, self.store)
+
+
+    def save_with(self, position, connection):
+        store = self.store
+        key = (position.account_id, position.ticker)
+        if position.id is None:
+            if position.ticker is None or key in store.positions_by_key:
+                raise ValueError("ticker not set or a position for this ticker already exists")
+            position.id = store.next_id("positions")
+        else:
+            old = store.positions.get(position.id)
+            if old is not None and store.positions_by_key.get((old[3], old[1])) == old[0]:
+                del store.positions_by_key[(old[3], old[1])]
+        store.positions[position.id] = _row(position)
+        store.positions_by_key[key] = position.id
+
+
+    def upsert_many(self, cls, positions):
+        with self.store.lock:
+            for position in positions:
+                existing = self.store.positions_by_key.get((position.account_id, position.ticker))
+                if existing is None:
+                    self._put(position.account_id, position.ticker, position.shares)
+                else:
+                    row = self.store.positions[existing]
+                    self.store.positions[existing] = row[:2] + (position.shares,) + row[3:]
+
+
+    def delete(self, position):
+        with self.store.lock:
+            row = self.store.positions.pop(position.id, None)
+            if row is not None:
+                self.store.positions_by_key.pop((row[3], row[1]), None)
+            position.id = None
+
+
+    def delete_all(self, cls):
+        with self.store.lock:
+            self.store.positions.clear()
+            self.store.positions_by_key.clear()
+
+
+    def from_id(self, cls, id):
+        cached = session.cached(cls, id)
+        if cached is not None:
+            return cached
+        row = self.store.positions.get(id)
+        return session.remember(cls.from_row(row)) if row else None
+
+
+    def all(self, cls):
+        return [cls.from_row(row) for row in list(self.store.positions.values())]
+
+
+    def all_from_account_id(self, cls, account_id):
+        return [cls.from_row(row) for row in list(self.store.positions.values())
+                if row[3] == account_id and row[2] > 0]
+
+
+    def held_tickers(self, cls):
+        return list({row[1]: None for row in list(self.store.positions.values()) if row[2] > 0})
+
+
+    def held_rows(self, cls, sort=None, descending=True, limit=None, offset=0, dbpath=None):
+        accounts = self.store.accounts
+        rows = sorted((row for row in list(self.store.positions.values())
+                       if row[2] > 0 and row[3] in accounts), key=lambda row: row[0])
+        if sort is not None:
+            column = {"shares": 2, "account_id": 3}[sort]
+            rows.sort(key=lambda row: row[column], reverse=descending)
+        end = None if limit is None else offset + limit
+        return [(row[3], accounts[row[3]][3], row[1], row[2]) for row in rows[offset:end]]
+
+
+    def from_account_id_and_ticker(self, cls, account_id, ticker):
+        key = (cls, account_id, ticker)
+        cached = session.found(key)
+        if cached is not None:
+            return cached
+        id = self.store.positions_by_key.get((account_id, ticker))
+        if id is None:
+            return session.remember(cls(account_id=account_id, ticker=ticker, shares=0), key)
+        return session.remember(cls.from_row(self.store.positions[id]), key)
+
+
+    def add_shares_with(self, cls, connection, account_id, ticker, shares):
+        with self.store.lock:
+            id = self.store.positions_by_key.get((account_id, ticker))
+            if id is None:
+                self._put(account_id, ticker, shares)
+            else:
+                row = self.store.positions[id]
+                self.store.positions[id] = (id, ticker, row[2] + shares, account_id)
+
+
+    def remove_shares_with(self, cls, connection, account_id, ticker, shares):
+        with self.store.lock:
+            id = self.store.positions_by_key.get((account_id, ticker))
+            if id is None or self.store.positions[id][2] < shares:
+                return False
+            row = self.store.positions[id]
+            self.store.positions[id] = (id, ticker, row[2] - shares, account_id)
+            return True
+
+
+    def _put(self, account_id, ticker, shares):
+        id = self.store.next_id("positions")
+        self.store.positions[id] = (id, ticker, shares, account_id)
+        self.store.positions_by_key[(account_id, ticker)] = id
+
+
+class TradeRepository:
+
+    def __init__(self, store):
+        self.store = store
+
+
+    def save(self, trade):
+        with self.store.lock:
+            self.save_with(trade, self.store)
+
+
+    def save_async(self, trade):
+        future = Future()
+        self.save(trade)
+        future.set_result(None)
+        return future
+
+
+    def save_with(self, trade, connection):
+        if trade.id is None:
+            self.insert_with(trade, connection)
+        else:
+            trade.time = time.time()
+            old = self.store.trades[trade.id]
+            if old[5] != trade.account_id:
+                self.store.trades_by_account[old[5]].remove(trade.id)
+                self.store.trades_by_account.setdefault(trade.account_id, []).append(trade.id)
+                self.store.trades_by_account[trade.account_id].sort()
+            self.store.trades[trade.id] = _row(trade)
+
+
+    def insert_with(self, trade, connection):
+        with self.store.lock:
+            trade.id = self.store.next_id("trades")
+            self.store.trades[trade.id] = _row(trade)
+            self.store.trades_by_account.setdefault(trade.account_id, []).append(trade.id)
+
+
+    def save_many(self, cls, trades):
+        with self.store.lock:
+            for trade in trades:
+                self.insert_with(trade, self.store)
+
+
+    def delete(self, trade):
+        with self.store.lock:
+            row = self.store.trades.pop(trade.id, None)
+            if row is not None:
+                self.store.trades_by_account[row[5]].remove(row[0])
+
+
+    def delete_all(self, cls):
+        with self.store.lock:
+            self.store.trades.clear()
+            self.store.trades_by_account.clear()
+
+
+    def from_id(self, cls, id):
+        cached = session.cached(cls, id)
+        if cached is not None:
+            return cached
+        row = self.store.trades.get(id)
+        return session.remember(cls.from_row(row)) if row else None
+
+
+    def iter_all(self, cls, after_id=0, batch_size=TRADE_PAGE_SIZE):
+        rows = self.store.trades
+        return (cls.from_row(rows[id]) for id in sorted(rows) if id > after_id)
+
+
+    def iter_from_account_id(self, cls, account_id, ticker=None, after_id=0, since=None,
+                             until=None, batch_size=TRADE_PAGE_SIZE):
+        return (cls.from_row(row) for row in self._account_rows(account_id, ticker, after_id, since, until))
+
+
+    def page_from_account_id(self, cls, account_id, ticker=None, after_id=0, since=None,
+                             until=None, limit=TRADE_PAGE_SIZE):
+        trades = []
+        for row in self._account_rows(account_id, ticker, after_id, since, until):
+            if len(trades) == limit:
+                return trades, trades[-1].id
+            trades.append(cls.from_row(row))
+        return trades, None
+
+
+    def volume_rows(self, cls, account_id=None, dbpath=None):
+        trades = self.store.trades
+        if account_id is None:
+            ids = sorted(trades, key=lambda id: (trades[id][5], trades[id][1], id))
+        else:
+            ids = sorted(self.store.trades_by_account.get(account_id, ()), key=lambda id: (trades[id][1], id))
+        return [(trades[id][5], trades[id][1], trades[id][2], trades[id][3]) for id in ids]
+
+
+    def _account_rows(self, account_id, ticker, after_id, since, until):
+        rows = self.store.trades
+        for id in list(self.store.trades_by_account.get(account_id, ())):
+            row = rows.get(id)
+            if (row is None or id <= after_id
+                    or (ticker is not None and row[1] != ticker)
+                    or (since is not None and row[4] < since)
+                    or (until is not None and row[4] >= until)):
+                continue
+            yield row
+
+
+def _row(obj):
+    """ a model object's fields as a tuple, in column order """
+    return tuple(getattr(obj, name) for name in type(obj).__slots__)
+
+
+setStorage(STORAGE)
@@ -0,0 +1,60 @@
+import logging
+import os
+from .config import SYMBOLS_FILE, DICT_FAKES
+
+
+log = logging.getLogger(__name__)
+
+
+def normalize(ticker):
+    """ return ticker the way it is stored and looked up: trimmed, upper case """
+    return str(ticker).strip().upper()
+
+
+class SymbolUniverse:
+    """ every ticker symbol we can trade, loaded from a local file with one
+    symbol per line, so unknown tickers are rejected without a network call.
+    When the file does not exist nothing is known, and every ticker is let
+    through to the quote source as before """
+
+    def __init__(self, symbols=None):
+        self.symbols = frozenset(normalize(symbol) for symbol in symbols or ())
+
+
+    @classmethod
+    def from_file(cls, path=SYMBOLS_FILE):
+        """ load the symbols in path, plus the made-up DICT_FAKES tickers.
+        warns when there is no file, since then nothing is validated """
+        if not os.path.exists(path):
+            log.warning("no symbols file at %s, tickers are not validated. "
+                        "create it with: python3 refresh_symbols.py", path)
+            return cls()
+        with open(path) as symbolfile:
+            symbols = [line for line in symbolfile.read().split() if line]
+        return cls(symbols + list(DICT_FAKES))
+
+
+    @property
+    def loaded(self):
+        return bool(self.symbols)
+
+
+    def __contains__(self, ticker):
+        return not self.loaded or normalize(ticker) in self.symbols
+
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {len(self)} symbols>"
+
+
+def write(symbols, path=SYMBOLS_FILE):
+    """ replace the symbols file with the given symbols, sorted """
+    tmppath = path + ".tmp"
+    with open(tmppath, "w") as symbolfile:
+        for symbol in sorted(set(normalize(symbol) for symbol in symbols)):
+            symbolfile.write(symbol + "\n")
+    os.replace(tmppath, path)
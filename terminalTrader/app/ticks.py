@@ -0,0 +1,160 @@
+import atexit
+import sqlite3
+import threading
+import time
+from .config import DBPATH, TICK_BATCH_SIZE, TICK_FLUSH_INTERVAL
+from . import db
+
+CREATE_SQL_PRICE_TICKS = """
+CREATE TABLE IF NOT EXISTS price_ticks(
+    ticker VARCHAR(15) NOT NULL,
+    ts FLOAT NOT NULL,
+    price FLOAT NOT NULL
+); """
+
+CREATE_SQL_PRICE_TICKS_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_price_ticks_ticker_ts ON price_ticks(ticker, ts); """
+
+
+class TickStore:
+    """ append-only history of every fetched price in the price_ticks table.
+
+    record() only appends to an in-memory buffer, so it is cheap enough for
+    the quote path. A writer thread inserts the buffer with executemany, in
+    one transaction per batch. Queries flush first, so they see everything
+    recorded so far """
+
+    def __init__(self, dbpath=DBPATH, batch_size=TICK_BATCH_SIZE,
+                 flush_interval=TICK_FLUSH_INTERVAL):
+        self.dbpath = dbpath
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._created = None # the dbpath price_ticks is known to exist in
+
+
+    def setDB(self, dbpath):
+        """ write what is buffered to the old database, then switch """
+        self.flush()
+        self.dbpath = dbpath
+
+
+    def record(self, ticker, price, ts=None):
+        """ buffer one tick, stamped with the current time by default """
+        self.record_many({ticker: price}, ts)
+
+
+    def record_many(self, prices, ts=None):
+        """ buffer a tick for every ticker -> price in prices """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self._buffer.extend((ticker, ts, price) for ticker, price in prices.items()
+                                if price is not None)
+            full = len(self._buffer) >= self.batch_size
+        self._start_writer()
+        if full:
+            self._wakeup.set()
+
+
+    def flush(self):
+        """ write every buffered tick now """
+        rows = self._take()
+        if rows:
+            self._write(rows)
+
+
+    def close(self):
+        """ flush, counting the ticks as dropped if they cannot be written """
+        rows = self._take()
+        try:
+            if rows:
+                self._write(rows)
+        except sqlite3.Error:
+            self.dropped += len(rows)
+
+
+    def _take(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        return rows
+
+
+    def _write(self, rows):
+        INSERTSQL = "INSERT INTO price_ticks(ticker, ts, price) VALUES (?, ?, ?);"
+        with self._write_lock, db.transaction(self.dbpath) as connection:
+            cursor = connection.cursor()
+            if self._created != self.dbpath:
+                # once per database, for one that schema.py has not migrated
+                cursor.execute(CREATE_SQL_PRICE_TICKS)
+                cursor.execute(CREATE_SQL_PRICE_TICKS_INDEX)
+            cursor.executemany(INSERTSQL, rows)
+        self._created = self.dbpath
+        self.written += len(rows)
+
+
+    def range(self, ticker, start=None, end=None):
+        """ return a list of (ts, price) for ticker with start <= ts < end,
+        oldest first. leave start or end out for an open range """
+        self.flush()
+        SELECTSQL = """SELECT ts, price FROM price_ticks
+                       WHERE ticker=:ticker AND ts>=:start AND ts<:end
+                       ORDER BY ts;"""
+        values = {
+            "ticker": ticker,
+            "start": float("-inf") if start is None else start,
+            "end": float("inf") if end is None else end
+            }
+        with db.transaction(self.dbpath) as connection:
+            cursor = connection.cursor()
+            cursor.execute(SELECTSQL, values)
+            return [tuple(row) for row in cursor.fetchall()]
+
+
+    def price_at(self, ticker, ts):
+        """ return the last price recorded for ticker at or before ts, None if
+        there is none """
+        self.flush()
+        SELECTSQL = """SELECT price FROM price_ticks
+                       WHERE ticker=:ticker AND ts<=:ts
+                       ORDER BY ts DESC LIMIT 1;"""
+        with db.transaction(self.dbpath) as connection:
+            cursor = connection.cursor()
+            cursor.execute(SELECTSQL, {"ticker": ticker, "ts": ts})
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+
+    def prices_at(self, tickers, ts):
+        """ return a dict of ticker -> price_at(ticker, ts), e.g. to value a
+        portfolio as it was at time ts """
+        return {ticker: self.price_at(ticker, ts) for ticker in dict.fromkeys(tickers)}
+
+
+    def _start_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tick-writer", daemon=True)
+                self._thread.start()
+
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.close()
+
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.dbpath} written={self.written} dropped={self.dropped}>"
+
+
+TICK_STORE = TickStore()
+atexit.register(TICK_STORE.close)
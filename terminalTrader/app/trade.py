@@ -1,37 +1,276 @@
+import asyncio
 import sqlite3
+import threading
 import time  # time.time() => floating point unix time stamp for right now
-import requests
-import os
-from .config import DBPATH
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .config import (DBPATH, DICT_FAKES, IEX_BATCH_SIZE, ASYNC_QUOTE_CONCURRENCY,
+                     ASYNC_QUOTE_TIMEOUT, QUOTE_STALE_TTL, SYMBOLS_FILE,
+                     REFRESH_RECENT_TICKERS, TRADE_PAGE_SIZE)
 from . import account
 from . import position
 from . import errs
+from . import db
+from . import groupcommit
+from . import ledger
+from . import session
+from . import storage
+from . import cache
+from . import price_client
+from . import providers
+from . import resilience
+from . import singleflight
+from . import symbols
+from . import ticks
+
+# stale is True when price is an expired cached price served because the
+# quote source was slow or failing
+Quote = namedtuple("Quote", ["ticker", "price", "stale"])
+
+QUOTE_CACHE = cache.QuoteCache(stale_ttl=QUOTE_STALE_TTL)
+QUOTE_FLIGHTS = singleflight.SingleFlight()
+QUOTE_BREAKER = resilience.CircuitBreaker()
+PRICE_PROVIDER = providers.from_config()
+SYMBOLS = symbols.SymbolUniverse.from_file()
+
+# batches fetched by get_current_prices_async run here. the pool outlives
+# each asyncio.run(), so a batch that timed out is left to finish on its own
+# instead of holding up the caller
+QUOTE_EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_QUOTE_CONCURRENCY, thread_name_prefix="quotes")
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_recent = OrderedDict() # most recently looked up tickers, oldest first
+_recent_lock = threading.Lock()
+
+def setPriceProvider(provider):
+    """ switch where prices come from, either a providers.PriceProvider or
+    the name of one from app.config, e.g. "static" """
+    global PRICE_PROVIDER
+    if isinstance(provider, str):
+        provider = providers.from_config(provider)
+    PRICE_PROVIDER = provider
+    QUOTE_CACHE.invalidate()
+    QUOTE_BREAKER.reset()
+
+
+def refresh_symbols(client=None, path=SYMBOLS_FILE):
+    """ download every ticker symbol from IEX into the symbols file, reload
+    SYMBOLS from it and return how many symbols there are """
+    global SYMBOLS
+    client = client or price_client.PriceClient()
+    symbols.write(client.get_symbols(), path)
+    SYMBOLS = symbols.SymbolUniverse.from_file(path)
+    return len(SYMBOLS)
 
-DICT_FAKES = {"STOK": 123.45, "P2P": 678.90, "A33A": 98.76}
 
 def get_current_price(ticker):
-    """ return the current price of a given ticker. 
-    can raise NoSuchTickerError or ConnectionError """
-    if ticker in DICT_FAKES:
-        return DICT_FAKES[ticker]
-
-    CRED_DIR = os.path.join( os.getenv('HOME'), ".credentials" )
-    IEX_TOKEN = "IEXTOKEN.txt"
-    TOKENFILE = os.path.join(CRED_DIR, IEX_TOKEN)
-    token = open(TOKENFILE).read().strip()
-    api_url = "https://cloud.iexapis.com/stable/stock/{ticker}/quote?token={token}"
-    get_url = api_url.format(ticker=ticker, token=token)
-
-    response = requests.get(get_url)
-    ticker_symbol = None
-    if response.status_code == 200:
-        ticker_symbol = response.json()['latestPrice']
-        return ticker_symbol
-    return ticker_symbol
+    """ return the current price of a given ticker, or None if it is not found.
+    can raise PriceUnavailableError or a requests error, see get_quote """
+    return get_quote(ticker).price
+
+
+def get_quote(ticker):
+    """ return a Quote for ticker. A fresh cached price is used as is and an
+    expired one (within QUOTE_STALE_TTL) is returned right away, marked stale,
+    while a background thread refreshes it. Otherwise the price is fetched,
+    joining any lookup of the same ticker that is already in flight.
+    can raise PriceUnavailableError when the circuit breaker is open and there
+    is no cached price to fall back on, or the requests error of a failed
+    fetch, e.g. ConnectionError or HTTPError """
+    if ticker not in SYMBOLS:
+        return Quote(ticker, None, False)
+    if not PRICE_PROVIDER.remote:
+        return Quote(ticker, PRICE_PROVIDER.get_price(ticker), False)
+
+    _track(ticker)
+    price = QUOTE_CACHE.get(ticker)
+    if price is not None:
+        return Quote(ticker, price, False)
+
+    price = QUOTE_CACHE.get_stale(ticker)
+    if price is not None:
+        _refresh_in_background(ticker)
+        return Quote(ticker, price, True)
+
+    return Quote(ticker, QUOTE_FLIGHTS.do(ticker, _fetch_price, ticker), False)
+
+
+def _fetch_price(ticker):
+    """ ask the provider for ticker through the circuit breaker and cache the
+    answer. concurrent callers for the same ticker share one call through
+    QUOTE_FLIGHTS """
+    price = QUOTE_BREAKER.call(PRICE_PROVIDER.get_price, ticker)
+    if price is not None:
+        QUOTE_CACHE.put(ticker, price)
+        ticks.TICK_STORE.record(ticker, price)
+    return price
+
+
+def _track(ticker):
+    """ remember ticker as recently looked up, for the background refresher """
+    with _recent_lock:
+        _recent[ticker] = None
+        _recent.move_to_end(ticker)
+        while len(_recent) > REFRESH_RECENT_TICKERS:
+            _recent.popitem(last=False)
+
+
+def recent_tickers():
+    """ return the tickers most recently looked up with get_quote """
+    with _recent_lock:
+        return list(_recent)
+
+
+def _refresh_in_background(ticker):
+    """ start one thread per ticker to replace a stale cached price """
+    with _refreshing_lock:
+        if ticker in _refreshing:
+            return
+        _refreshing.add(ticker)
+    threading.Thread(target=_refresh, args=(ticker,), daemon=True).start()
+
+
+def _refresh(ticker):
+    try:
+        QUOTE_FLIGHTS.do(ticker, _fetch_price, ticker)
+    except (OSError, errs.PriceUnavailableError):
+        pass # keep serving the stale price, the breaker has counted the failure
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(ticker)
+
+
+def get_current_prices(tickers):
+    """ return a dict of ticker -> current price for many tickers at once,
+    fetching everything that is not cached in one provider call. tickers
+    that are not found map to None. if the provider fails, stale cached
+    prices are used where there are any. tickers are looked up normalized,
+    but the dict is keyed by the tickers as given """
+    requested, tickers = _normalized(tickers)
+    if not PRICE_PROVIDER.remote:
+        fetched = PRICE_PROVIDER.get_prices([ticker for ticker in tickers if ticker in SYMBOLS])
+        return {ticker: fetched.get(symbols.normalize(ticker)) for ticker in requested}
+
+    prices, missing = _split_cached(tickers)
+    if missing:
+        _store_fetched(prices, missing, _fetch_prices(missing))
+    return _requested(requested, prices)
+
+
+def refresh_prices(tickers):
+    """ fetch tickers now, even the ones that are still cached, and cache the
+    new prices. returns a dict of ticker -> price. used to keep hot tickers
+    warm, so it does nothing for providers that are not remote """
+    tickers = [ticker for ticker in _normalized(tickers)[1] if ticker in SYMBOLS]
+    prices = {}
+    if PRICE_PROVIDER.remote and tickers:
+        _store_fetched(prices, tickers, _fetch_prices(tickers))
+    return prices
+
+
+async def get_current_prices_async(tickers, concurrency=ASYNC_QUOTE_CONCURRENCY,
+                                   timeout=ASYNC_QUOTE_TIMEOUT, chunk_size=IEX_BATCH_SIZE):
+    """ like get_current_prices, but the uncached tickers are split into
+    chunk_size batches that are fetched concurrently, at most concurrency at
+    a time. a batch that takes longer than timeout seconds is treated as a
+    failed fetch, and the call returns without waiting for it """
+    requested, tickers = _normalized(tickers)
+    if not PRICE_PROVIDER.remote:
+        return get_current_prices(requested)
+
+    prices, missing = _split_cached(tickers)
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def fetch(chunk):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(QUOTE_EXECUTOR, _fetch_prices, chunk, timeout), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+    for chunk, fetched in zip(chunks, await asyncio.gather(*map(fetch, chunks))):
+        _store_fetched(prices, chunk, fetched)
+    return _requested(requested, prices)
+
+
+def get_current_prices_concurrently(tickers, timeout=ASYNC_QUOTE_TIMEOUT):
+    """ blocking wrapper around get_current_prices_async for code that is not
+    already running inside an event loop, e.g. the CLI and Flask views """
+    return asyncio.run(get_current_prices_async(tickers, timeout=timeout))
+
+
+def _normalized(tickers):
+    """ return (tickers as given, normalized tickers), both without repeats """
+    requested = list(dict.fromkeys(tickers))
+    return requested, list(dict.fromkeys(map(symbols.normalize, requested)))
+
+
+def _requested(requested, prices):
+    """ key prices, which are by normalized ticker, by the tickers as given """
+    return {ticker: prices[symbols.normalize(ticker)] for ticker in requested}
+
+
+def _split_cached(tickers):
+    """ return (dict of fresh cached prices, list of tickers to fetch) for
+    normalized tickers. tickers outside SYMBOLS are answered with None
+    right away """
+    prices = {}
+    missing = []
+    for ticker in tickers:
+        if ticker not in SYMBOLS:
+            prices[ticker] = None
+            continue
+        price = QUOTE_CACHE.get(ticker)
+        if price is None:
+            missing.append(ticker)
+        else:
+            prices[ticker] = price
+    return prices, missing
+
+
+def _fetch_prices(tickers, timeout=None):
+    """ ask the provider for tickers through the circuit breaker, giving
+    each network call at most timeout seconds when it is set. returns None
+    instead of raising when the quote source is failing """
+    try:
+        if timeout is None:
+            return QUOTE_BREAKER.call(PRICE_PROVIDER.get_prices, tickers)
+        return QUOTE_BREAKER.call(PRICE_PROVIDER.get_prices_within, tickers, timeout)
+    except (OSError, errs.PriceUnavailableError):
+        return None
+
+
+def _store_fetched(prices, tickers, fetched):
+    """ cache and copy fetched prices into prices. fetched is None when the
+    fetch failed, in which case stale cached prices fill in """
+    for ticker in tickers:
+        if fetched is None:
+            prices[ticker] = QUOTE_CACHE.get_stale(ticker)
+            continue
+        price = fetched.get(ticker)
+        if price is not None:
+            QUOTE_CACHE.put(ticker, price)
+        prices[ticker] = price
+    if fetched:
+        ticks.TICK_STORE.record_many(fetched)
+
+
+def _raise_locked(err):
+    """ raise errs.LedgerLockedError if err came from the ledger's triggers """
+    if ledger.LOCKED_MESSAGE in str(err):
+        raise errs.LedgerLockedError(str(err)) from err
 
 
 class Trade:
 
+    # slots instead of a __dict__ per object, in the column order of the table
+    __slots__ = ("id", "ticker", "volume", "unit_price", "time", "account_id")
+    COLUMNS = ", ".join(__slots__)
+
     dbpath = DBPATH
 
     @classmethod
@@ -47,65 +286,134 @@ class Trade:
         self.account_id = kwargs.get('account_id')
 
 
+    @classmethod
+    def from_row(cls, row):
+        """ build an object from a row of SELECT COLUMNS, without __init__.
+        unlike __init__ this keeps the time the trade was made """
+        trade = cls.__new__(cls)
+        trade.id, trade.ticker, trade.volume, trade.unit_price, trade.time, trade.account_id = row
+        return trade
+
+
+    @storage.backed
     def save(self):
         """ inserts or updates depending on id's value """
+        with db.transaction(self.dbpath) as connection:
+            self.save_with(connection)
+        session.clean(self)
+
+
+    @storage.backed
+    def save_async(self):
+        """ queue the save on groupcommit.WRITER and return a Future that is
+        done once it has been committed along with the rest of its batch """
+        return groupcommit.WRITER.submit(self.save_with, self.dbpath)
+
+
+    @storage.backed
+    def save_with(self, connection):
+        """ save using an open connection, without committing, so the write
+        can share a transaction with others """
         if self.id is None:
-            self._insert()
+            self.insert_with(connection)
         else:
-            self._update()
+            self._update(connection)
 
 
-    def _insert(self):
-        """ inserts a new row into the database and sets self.id """
-        with sqlite3.connect(self.dbpath) as connection:
-            cursor = connection.cursor()
-            INSERTSQL = """INSERT INTO trades
+    @storage.backed
+    def insert_with(self, connection):
+        """ inserts a new row using an open connection, without committing, so
+        it can share a transaction with other writes. sets self.id """
+        cursor = connection.cursor()
+        INSERTSQL = """INSERT INTO trades
 (ticker, volume, unit_price, time, account_id) VALUES 
 (:ticker, :volume, :unit_price, :time, :account_id);"""
-            values = {
-                    "ticker": self.ticker,
-                    "volume": self.volume,
-                    "unit_price": self.unit_price,
-                    "time": self.time,
-                    "account_id": self.account_id 
-                    }
-            try:
-                cursor.execute(INSERTSQL, values)
-                self.id = cursor.lastrowid
-            except sqlite3.IntegrityError:
-                raise ValueError("Ticker not set or is not found") # UNIQUE(4.cker, account_id)
+        values = {
+                "ticker": self.ticker,
+                "volume": self.volume,
+                "unit_price": self.unit_price,
+                "time": self.time,
+                "account_id": self.account_id 
+                }
+        try:
+            cursor.execute(INSERTSQL, values)
+            self.id = cursor.lastrowid
+        except sqlite3.IntegrityError:
+            raise ValueError("Ticker not set or is not found") # UNIQUE(4.cker, account_id)
 
 
-    def _update(self):
-        """ updates the row with id=self.id with this objects current values"""
-        with sqlite3.connect(self.dbpath) as connection:
+    @classmethod
+    @storage.backed
+    def save_many(cls, trades):
+        """ insert many new trades with one executemany in a single
+        transaction, e.g. to backfill history, and set each trade's id.
+        each trade is written with its own time, so set trade.time first
+        when backfilling """
+        trades = list(trades)
+        if not trades:
+            return
+        INSERTSQL = """INSERT INTO trades
+(ticker, volume, unit_price, time, account_id) VALUES 
+(:ticker, :volume, :unit_price, :time, :account_id);"""
+        values = [{
+                "ticker": trade.ticker,
+                "volume": trade.volume,
+                "unit_price": trade.unit_price,
+                "time": trade.time,
+                "account_id": trade.account_id
+                } for trade in trades]
+        # the write lock is held from the start, so the new ids are consecutive
+        with db.immediate(cls.dbpath) as connection:
             cursor = connection.cursor()
-            UPDATESQL = """UPDATE trades
-SET ticker=:ticker, volume=:volume, unit_price=:unit_price, time=:time, account_id=:account_id
-WHERE id=:id;"""
-            values = {
-                    "ticker": self.ticker,
-                    "volume": self.volume,
-                    "unit_price": self.unit_price,
-                    "time": self.time,
-                    "account_id": self.account_id,
-                    "id": self.id
-                    }
             try:
-                cursor.execute(UPDATESQL, values)
+                cursor.executemany(INSERTSQL, values)
             except sqlite3.IntegrityError:
-                raise ValueError("ID (id) does not set in datebase.")
+                raise ValueError("Ticker not set or is not found")
+            last_id = connection.execute("SELECT last_insert_rowid();").fetchone()[0]
+            first_id = last_id - len(trades) + 1
+        for offset, trade in enumerate(trades):
+            trade.id = first_id + offset
 
 
+    def _update(self, connection):
+        """ updates the row with id=self.id with this objects current values
+        and stamps it with the current time. raises errs.LedgerLockedError
+        for a trade a ledger snapshot covers """
+        self.time = time.time()
+        cursor = connection.cursor()
+        UPDATESQL = """UPDATE trades
+SET ticker=:ticker, volume=:volume, unit_price=:unit_price, time=:time, account_id=:account_id
+WHERE id=:id;"""
+        values = {
+                "ticker": self.ticker,
+                "volume": self.volume,
+                "unit_price": self.unit_price,
+                "time": self.time,
+                "account_id": self.account_id,
+                "id": self.id
+                }
+        try:
+            cursor.execute(UPDATESQL, values)
+        except sqlite3.IntegrityError as err:
+            _raise_locked(err)
+            raise ValueError("ID (id) does not set in datebase.")
+
+
+    @storage.backed
     def delete(self):
-        """ deletes row with id=self.id from db and sets self.id to None """
-        with sqlite3.connect(self.dbpath) as connection:
+        """ deletes row with id=self.id from db and sets self.id to None.
+        raises errs.LedgerLockedError for a trade a ledger snapshot covers """
+        with db.transaction(self.dbpath) as connection:
             cursor = connection.cursor()
             DELETESQL = """DELETE FROM trades WHERE id=:id;"""
             values = {
                     "id": self.id
                     }
-            cursor.execute(DELETESQL, values)
+            try:
+                cursor.execute(DELETESQL, values)
+            except sqlite3.IntegrityError as err:
+                _raise_locked(err)
+                raise
             # try:
             #     cursor.execute(DELETESQL, values)
             # except sqlite3.IntegrityError: # as E
@@ -113,77 +421,144 @@ WHERE id=:id;"""
 
 
     @classmethod
+    @storage.backed
     def from_id(cls, id):
         """ return an object of this class for the given database row id """
-        SELECTSQL = "SELECT * FROM trades WHERE id=:id;"
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        cached = session.cached(cls, id)
+        if cached is not None:
+            return cached
+        SELECTSQL = f"SELECT {cls.COLUMNS} FROM trades WHERE id=:id;"
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             cursor.execute(SELECTSQL, {"id": id})
             dictrow = cursor.fetchone()
             if dictrow:
-                return cls(**dictrow)
+                return session.remember(cls.from_row(dictrow))
             return None
 
 
     @classmethod
     def all(cls):
         """ return a list of every row of this table as objects of this class """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            SQL = "SELECT * FROM trades;"
-            cursor.execute(SQL)
-            result = []
-            for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
-            return result
+        return list(cls.iter_all())
+
+
+    @classmethod
+    @storage.backed
+    def iter_all(cls, after_id=0, batch_size=TRADE_PAGE_SIZE):
+        """ yield every trade with an id above after_id, in id order, reading
+        batch_size rows at a time so memory stays flat however many there are """
+        SQL = f"SELECT {cls.COLUMNS} FROM trades WHERE id>:after_id ORDER BY id LIMIT :limit;"
+        return cls._iter_pages(SQL, {"after_id": after_id}, batch_size)
             
 
     @classmethod
+    @storage.backed
+    def volume_rows(cls, account_id=None, dbpath=None):
+        """ return (account_id, ticker, volume, unit_price) tuples for the
+        trades of account_id, or of every account when it is None, in
+        account, ticker and id order """
+        SQL = "SELECT account_id, ticker, volume, unit_price FROM trades{where} ORDER BY account_id, ticker, id;"
+        where, values = ("", {}) if account_id is None else (" WHERE account_id=:account_id", {"account_id": account_id})
+        with db.transaction(dbpath or cls.dbpath) as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = None # plain tuples are cheaper than sqlite3.Row
+            return cursor.execute(SQL.format(where=where), values).fetchall()
+
+
+    @classmethod
+    @storage.backed
     def delete_all(cls):
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
+        with db.transaction(cls.dbpath) as connection:
             cursor = connection.cursor()
             SQL = "DELETE FROM trades;"
-            cursor.execute(SQL)
+            try:
+                cursor.execute(SQL)
+            except sqlite3.IntegrityError as err:
+                _raise_locked(err)
+                raise
             result = []
             for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
+                result.append(cls.from_row(dictrow))
             return result
 
 
     @classmethod
     def all_from_account_id(cls, account_id):
         """ return a list of Trade objects for all of a given account's trades """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            SQL = "SELECT * FROM trades WHERE account_id=:account_id;"
-            cursor.execute(SQL, {"account_id": account_id})
-            result = []
-            for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
-            return result
+        return list(cls.iter_from_account_id(account_id))
 
 
     @classmethod
     def all_from_account_id_and_ticker(cls, account_id, ticker):
         """ return a list of Trade object for all of a given accounts trades
         for a given ticker symbol """
-        with sqlite3.connect(cls.dbpath) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            SQL = "SELECT * FROM trades WHERE account_id=:account_id AND ticker=:ticker;"
-            values = {
-                    "account_id": account_id,
-                    "ticker": ticker
-                     }
-            cursor.execute(SQL, values)
-            result = []
-            for dictrow in cursor.fetchall():
-                result.append(cls(**dictrow))
-            return result
+        return list(cls.iter_from_account_id(account_id, ticker=ticker))
+
+
+    @classmethod
+    @storage.backed
+    def iter_from_account_id(cls, account_id, ticker=None, after_id=0, since=None,
+                             until=None, batch_size=TRADE_PAGE_SIZE):
+        """ yield an account's trades in id order, reading batch_size rows at a
+        time. only trades with an id above after_id are returned, and only for
+        ticker, and with since <= time < until, when those are given """
+        return cls._iter_pages(*cls._account_query(account_id, ticker, after_id, since, until),
+                               batch_size)
+
+
+    @classmethod
+    @storage.backed
+    def page_from_account_id(cls, account_id, ticker=None, after_id=0, since=None,
+                             until=None, limit=TRADE_PAGE_SIZE):
+        """ return (trades, next_after_id) for one page of at most limit of an
+        account's trades, filtered like iter_from_account_id. next_after_id is
+        the after_id of the following page, None when this is the last one """
+        SQL, values = cls._account_query(account_id, ticker, after_id, since, until)
+        with db.transaction(cls.dbpath) as connection:
+            # one extra row tells us whether there is another page
+            rows = connection.execute(SQL, dict(values, limit=limit + 1)).fetchall()
+        trades = [cls.from_row(dictrow) for dictrow in rows[:limit]]
+        if len(rows) > limit:
+            return trades, trades[-1].id
+        return trades, None
+
+
+    @classmethod
+    def _account_query(cls, account_id, ticker, after_id, since, until):
+        """ build the keyset query and its values for an account's trades """
+        conditions = ["account_id=:account_id", "id>:after_id"]
+        values = {"account_id": account_id, "after_id": after_id}
+        if ticker is not None:
+            conditions.append("ticker=:ticker")
+            values["ticker"] = ticker
+        if since is not None:
+            conditions.append("time>=:since")
+            values["since"] = since
+        if until is not None:
+            conditions.append("time<:until")
+            values["until"] = until
+        SQL = "SELECT {} FROM trades WHERE {} ORDER BY id LIMIT :limit;".format(cls.COLUMNS, " AND ".join(conditions))
+        return SQL, values
+
+
+    @classmethod
+    def _iter_pages(cls, SQL, values, batch_size):
+        """ run a keyset query, which must select rows with id>:after_id
+        ORDER BY id LIMIT :limit, page by page, yielding Trade objects. no
+        transaction is held open between pages """
+        values = dict(values, limit=batch_size)
+        from_row = cls.from_row
+        while True:
+            with db.transaction(cls.dbpath) as connection:
+                cursor = connection.cursor()
+                cursor.row_factory = None # plain tuples are cheaper than sqlite3.Row
+                rows = cursor.execute(SQL, values).fetchall()
+            for row in rows:
+                yield from_row(row)
+            if len(rows) < batch_size:
+                return
+            values["after_id"] = rows[-1][0]
 
 
     def get_account(self):
@@ -199,4 +574,4 @@ WHERE id=:id;"""
     def __repr__(self):
         """ return a string representing this object """
         # this is a good default __repr__
-        return f"<{type(self).__name__} {self.__dict__}>"
+        return f"<{type(self).__name__} {session.fields(self)}>"
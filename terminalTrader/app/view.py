@@ -118,8 +118,13 @@ def enter_sell_info():
 def bad_number_input():
     print("\nEnter number greater than 0! Please try again.")
 
-def stock_info(ticker, stock_quote):
+def stock_info(ticker, stock_quote, stale=False):
     print("\nThe current price for " + str(ticker).upper() + " is $" + str(stock_quote).upper())
+    if stale:
+        print("(last known price, live quotes are delayed)")
+
+def price_unavailable():
+    print("\nPrices are unavailable right now! Please try again later.")
 
 def insufficient_funds():
     print("\nInusfficient funds!")
@@ -127,10 +132,23 @@ def insufficient_funds():
 def insufficient_shares():
     print("\nInusfficient shares!")
 
-def positions_info(positions):
-    print("\nBelow is a list of all your positions:\nTICKER  SHARES\n")
-    for item in positions:
-        print(item.ticker, " ", item.shares,"\n")
+def pnl_info(pnl_rows):
+    print("\nBelow is a list of all your positions:\nTICKER  SHARES  PRICE   VALUE   AVG COST  UNREALIZED  REALIZED\n")
+    realized = unrealized = 0.0
+    for row in pnl_rows:
+        if row.realized is not None:
+            realized += row.realized
+        if row.unrealized is not None:
+            unrealized += row.unrealized
+        if not row.shares:
+            continue # closed, only its realized P&L counts
+        value = None if row.price is None else row.shares * row.price
+        print(row.ticker, " ", row.shares, " ", row.price, " ", value, " ",
+              _money(row.average_cost), " ", _money(row.unrealized), " ", _money(row.realized), "\n")
+    print(f"Total unrealized P&L: {_money(unrealized)}   Total realized P&L: {_money(realized)}")
+
+def _money(amount):
+    return None if amount is None else round(amount, 2)
 
 def trades_info(trades):
     print("Below is your trade history:\n")
@@ -138,11 +156,11 @@ def trades_info(trades):
     for item in trades:
         print(item.ticker, " ", item.volume, " ", item.unit_price, " ", item.time,"\n")
 
-def all_account_positions(list_values):
+def all_account_positions(report_rows):
     print("Below is all account position data:\n")
     print("Account ID  Total        Ticker  Shares   Price")
-    for value in list_values:
-        print(f"{value[0]}           ${value[1]}     {value[2]}   {value[3]}   ${value[4]}")
+    for row in report_rows:
+        print(f"{row.account_id}           ${row.value}     {row.ticker}   {row.shares}   ${row.price}")
 
 def grant_admin():
     return input("Enter username to grant admin access to: ")        
@@ -0,0 +1,41 @@
+""" time Account.from_id with a fresh sqlite3 connection per call (the old
+way) against the pooled per-thread connection from app.db
+
+run from the terminalTrader/ folder: python3 -m benchmarks.bench_connections """
+import os
+import sqlite3
+import tempfile
+import timeit
+from app import Account, setDB, db
+from schema import schema
+
+LOOKUPS = 5000
+
+
+def fresh_connection_from_id(dbpath, id):
+    with sqlite3.connect(dbpath) as connection:
+        connection.row_factory = sqlite3.Row
+        cursor = connection.cursor()
+        cursor.execute("SELECT * FROM accounts WHERE id=:id;", {"id": id})
+        return Account(**cursor.fetchone())
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dbpath = os.path.join(tmpdir, "bench.db")
+        schema(dbpath)
+        setDB(dbpath)
+        account = Account(username="bench", balance=1000.0)
+        account.save()
+
+        fresh = timeit.timeit(lambda: fresh_connection_from_id(dbpath, account.id), number=LOOKUPS)
+        pooled = timeit.timeit(lambda: Account.from_id(account.id), number=LOOKUPS)
+        print(f"{LOOKUPS} Account.from_id lookups")
+        print(f"  fresh connection per call: {fresh / LOOKUPS * 1e6:8.1f} us/op")
+        print(f"  pooled connection:         {pooled / LOOKUPS * 1e6:8.1f} us/op")
+        print(f"  speedup: {fresh / pooled:.1f}x")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+""" insert trades from 1 to 64 threads at once, one transaction per trade
+against the group commit writer, with the "durable" profile so every
+commit is an fsync. Every caller waits for its own commit, so a batch can
+never hold more writes than there are threads, and the win grows with them
+
+run from the terminalTrader/ folder: python3 -m benchmarks.bench_group_commit """
+import os
+import tempfile
+import threading
+import time
+from app import Trade, setDB, db
+from app.groupcommit import GroupCommitWriter
+from app import groupcommit
+from schema import schema
+
+THREADS = (1, 4, 16, 64)
+TRADES = 3200
+
+
+def one_by_one():
+    Trade(ticker="AAPL", volume=1, unit_price=10.0, account_id=1).save()
+
+
+def grouped():
+    Trade(ticker="AAPL", volume=1, unit_price=10.0, account_id=1).save_async().result()
+
+
+def run(insert, count):
+    def work():
+        for _ in range(TRADES // count):
+            insert()
+    threads = [threading.Thread(target=work) for _ in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return TRADES // count * count / (time.perf_counter() - start)
+
+
+def main():
+    db.setProfile("durable")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dbpath = os.path.join(tmpdir, "bench.db")
+        schema(dbpath)
+        setDB(dbpath)
+        print(f"{'threads':>8} {'one by one':>11} {'group 0ms':>10} {'group 2ms':>10} {'batch':>6}")
+        for count in THREADS:
+            rates = [run(one_by_one, count)]
+            for interval in (0, 0.002):
+                groupcommit.WRITER = GroupCommitWriter(interval=interval)
+                rates.append(run(grouped, count))
+                groupcommit.WRITER.close()
+                if not interval:
+                    batch = groupcommit.WRITER.written / groupcommit.WRITER.commits
+            print(f"{count:>8} {rates[0]:>11.0f} {rates[1]:>10.0f} {rates[2]:>10.0f} {batch:>6.1f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+""" show that api key, username and trade history lookups stay flat as the
+number of accounts and trades grows, now that schema() adds indexes
+
+run from the terminalTrader/ folder: python3 -m benchmarks.bench_lookups """
+import os
+import random
+import tempfile
+import timeit
+from app import Account, Trade, setDB, db
+from schema import schema
+
+SIZES = [1000, 10000, 100000]
+TRADES_PER_ACCOUNT = 5
+LOOKUPS = 2000
+
+
+def fill(dbpath, accounts):
+    """ bulk load accounts and their trades straight into the tables """
+    with db.transaction(dbpath) as connection:
+        connection.executemany(
+            "INSERT INTO accounts(username, balance, api_key) VALUES (?, ?, ?);",
+            ((f"user{n}", 1000.0, n) for n in range(accounts)))
+        connection.executemany(
+            "INSERT INTO trades(ticker, volume, unit_price, time, account_id) VALUES (?, ?, ?, ?, ?);",
+            ((random.choice(["AAPL", "GS", "MS"]), 1, 10.0, n, n // TRADES_PER_ACCOUNT + 1)
+             for n in range(accounts * TRADES_PER_ACCOUNT)))
+
+
+def per_op(function, keys):
+    keys = iter(keys)
+    return timeit.timeit(lambda: function(next(keys)), number=LOOKUPS) / LOOKUPS * 1e6
+
+
+def main():
+    print(f"{'accounts':>10} {'from_api_key':>14} {'username':>10} {'trades_for':>12}   (us/op)")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dbpath = os.path.join(tmpdir, "bench.db")
+            schema(dbpath)
+            setDB(dbpath)
+            fill(dbpath, size)
+            keys = [random.randrange(size) for _ in range(LOOKUPS)]
+            api_key = per_op(Account.from_api_key, keys)
+            username = per_op(Account.get_from_username, [f"user{key}" for key in keys])
+            trades = per_op(lambda key: Trade.all_from_account_id_and_ticker(key + 1, "AAPL"), keys)
+            print(f"{size:>10} {api_key:>14.1f} {username:>10.1f} {trades:>12.1f}")
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
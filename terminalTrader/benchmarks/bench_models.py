@@ -0,0 +1,73 @@
+""" materialize a large trade history as model objects: the old way, a
+__dict__ object built with cls(**sqlite3.Row) from SELECT *, against the
+slotted Trade built with Trade.from_row from plain tuples
+
+run from the terminalTrader/ folder: python3 -m benchmarks.bench_models [rows] """
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from app import Trade, setDB, db
+from schema import schema
+
+ROWS = 1000000
+
+
+class DictTrade:
+    """ the model before __slots__ """
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.get('id')
+        self.ticker = kwargs.get('ticker')
+        self.volume = kwargs.get('volume', 0.0)
+        self.unit_price = kwargs.get('unit_price')
+        self.time = time.time()
+        self.account_id = kwargs.get('account_id')
+
+
+def dict_trades(dbpath):
+    with sqlite3.connect(dbpath) as connection:
+        connection.row_factory = sqlite3.Row
+        return [DictTrade(**row) for row in connection.execute("SELECT * FROM trades;")]
+
+
+def slotted_trades(dbpath):
+    return list(Trade.iter_all())
+
+
+def measure(load, dbpath):
+    """ return (objects, seconds, bytes allocated for them). the time is
+    taken on a separate run, since tracemalloc slows allocation down """
+    start = time.perf_counter()
+    count = len(load(dbpath))
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    objects = load(dbpath)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return count, seconds, memory
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dbpath = os.path.join(tmpdir, "bench.db")
+        schema(dbpath)
+        setDB(dbpath)
+        with db.transaction(dbpath) as connection:
+            connection.executemany(
+                "INSERT INTO trades(ticker, volume, unit_price, time, account_id) VALUES (?, ?, ?, ?, ?);",
+                (("AAPL", n % 100, 10.0 + n % 7, 1.6e9 + n, n % 1000) for n in range(rows)))
+
+        print(f"{'model':>10} {'rows':>9} {'seconds':>9} {'MB':>8}")
+        for name, load in (("dict", dict_trades), ("slots", slotted_trades)):
+            count, seconds, memory = measure(load, dbpath)
+            print(f"{name:>10} {count:>9} {seconds:>9.2f} {memory / 2**20:>8.1f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
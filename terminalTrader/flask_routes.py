@@ -1,11 +1,38 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from app import view
 from app import account
 from app import errs
+from app import pnl
+from app import refresher
+from app import trade
+from app import session
+from app.config import TRADE_PAGE_SIZE, TRADE_PAGE_MAX
+from schema import schema
 
 app = Flask(__name__)
 
 Account = account.Account
+Trade = trade.Trade
+
+
+@app.before_request
+def open_session():
+    # one unit of work per request: rows are loaded once and changed
+    # objects are saved together before the response goes out
+    g.session = session.Session().open()
+
+
+@app.after_request
+def flush_session(response):
+    if response.status_code < 400:
+        g.session.flush()
+    return response
+
+
+@app.teardown_request
+def close_session(exc):
+    if "session" in g:
+        g.session.close()
 
 
 @app.route('/api', methods=["GET"])
@@ -20,7 +47,8 @@ def get_price(ticker):
                    balance=1000.00)
     acct.set_password_hash("password")
     acct.save()
-    return jsonify({f"{ticker} price": acct.stock_quotes(ticker)})
+    quote = acct.quote(ticker)
+    return jsonify({f"{ticker} price": quote.price, "stale": quote.stale})
 
 
 @app.route('/api/<api_key>/balance', methods=["GET"])
@@ -34,35 +62,57 @@ def get_balance(api_key):
 def get_positions(api_key):
     # test api_key = 445783670
     acct = Account.from_api_key(api_key)
-    print(acct.get_positions())
-    list_positions = acct.get_positions()
+    valued_positions = acct.value_positions()
     positions = [{"ticker": position.ticker, 
-                  "shares": position.shares} for position in list_positions]
+                  "shares": position.shares,
+                  "price": price,
+                  "value": value} for position, price, value in valued_positions]
     return jsonify({f"{acct.username} positions": positions})
 
 
+@app.route('/api/<api_key>/pnl', methods=["GET"])
+def get_pnl(api_key):
+    acct = Account.from_api_key(api_key)
+    rows = pnl.account_pnl(acct.id)
+    realized, unrealized = pnl.totals(rows)
+    return jsonify({f"{acct.username} pnl": [row._asdict() for row in rows],
+                    "realized": realized,
+                    "unrealized": unrealized})
+
+
 @app.route('/api/<api_key>/trades', methods=["GET"])
 def get_trades(api_key):
     # test api_key = 445783670
     acct = Account.from_api_key(api_key)
-    list_trades = acct.get_trades()
-    trades = [{"ticker": trade.ticker, 
-               "volume": trade.volume, 
-               "time": trade.time,
-               "unit_price": trade.unit_price} for trade in list_trades]
-    return jsonify({f"{acct.username}'s trades": trades})
+    trades, next_after_id = trades_page(acct)
+    return jsonify({f"{acct.username}'s trades": trades, "next_after_id": next_after_id})
 
 
 @app.route('/api/<api_key>/trades/<ticker>', methods=["GET"])
 def get_trades_for(api_key, ticker):
     # test api_key = 445783670
     acct = Account.from_api_key(api_key)
-    list_trades = acct.get_trades_for(ticker)
-    trades = [{"ticker": trade.ticker, 
+    trades, next_after_id = trades_page(acct, ticker)
+    return jsonify({f"{acct.username}'s {ticker} trades": trades, "next_after_id": next_after_id})
+
+
+def trades_page(acct, ticker=None):
+    """ return one page of acct's trades as dicts and the after_id of the next
+    page, None on the last one. The page is picked with the after_id, limit,
+    since and until query string arguments """
+    limit = min(request.args.get("limit", TRADE_PAGE_SIZE, type=int), TRADE_PAGE_MAX)
+    list_trades, next_after_id = Trade.page_from_account_id(
+        acct.id, ticker=ticker,
+        after_id=request.args.get("after_id", 0, type=int),
+        since=request.args.get("since", type=float),
+        until=request.args.get("until", type=float),
+        limit=max(limit, 1))
+    trades = [{"id": trade.id,
+               "ticker": trade.ticker, 
                "volume": trade.volume, 
                "time": trade.time,
                "unit_price": trade.unit_price} for trade in list_trades]
-    return jsonify({f"{acct.username}'s {ticker} trades": trades})
+    return trades, next_after_id
 
 
 @app.route('/api/<api_key>/deposit', methods=["PUT"])
@@ -72,8 +122,7 @@ def make_deposit(api_key):
     acct = Account.from_api_key(api_key)
     amount = round(float(data["amount"]), 2)
     old_balance = acct.balance
-    acct.balance += amount
-    acct.save()
+    acct.deposit(amount)
     return jsonify({f"{acct.username}'s balance": [{"OLD": "{:.2f}".format(old_balance),
                                                     "NEW": "{:.2f}".format(acct.balance)}] })
 
@@ -86,7 +135,6 @@ def sell_order(api_key):
     ticker = data["ticker"]
     volume = data["volume"]
     acct.sell(ticker, volume)
-    acct.save()
     return jsonify({f"{acct.username}'s sell order": [{"TICKER": ticker,
                                                        "VOLUME": volume}] })
 
@@ -99,12 +147,13 @@ def buy_order(api_key):
     ticker = data["ticker"]
     volume = data["volume"]
     acct.buy(ticker, volume)
-    acct.save()
     return jsonify({f"{acct.username}'s buy order": [{"TICKER": ticker,
                                                       "VOLUME": volume}] })
 
 
 if __name__ == '__main__':
+    schema()
+    refresher.start()
     app.run(debug=True)
 
 
@@ -115,4 +164,6 @@ curl -d '{"ticker": "aapl", "volume": 5}' -H "Content-Type: application/json" -X
 
 curl -d '{"ticker": "tsla", "volume": 2}' -H "Content-Type: application/json" -X POST http://localhost:5000/api/445783670/buy
 
+curl "http://localhost:5000/api/445783670/trades?limit=100&after_id=0"
+
 """
\ No newline at end of file
@@ -0,0 +1,16 @@
+import sys
+from app import ledger
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "snapshot":
+        print(f"Saved snapshot {ledger.snapshot()}")
+    elif command == "rebuild":
+        apply = "--dry-run" not in sys.argv
+        drift = ledger.rebuild(apply=apply)
+        for row in drift:
+            what = f"position {row.ticker}" if row.ticker else "balance"
+            print(f"account {row.account_id} {what}: stored {row.stored}, ledger {row.rebuilt}")
+        print(f"{len(drift)} {'corrected' if apply else 'out of line'}")
+    else:
+        print("usage: python ledger.py snapshot | rebuild [--dry-run]")
@@ -1,4 +1,6 @@
 import app
+from schema import schema
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    schema()
+    app.run()
@@ -0,0 +1,5 @@
+from app import trade
+
+if __name__ == "__main__":
+    count = trade.refresh_symbols()
+    print(f"Saved {count} symbols to {trade.SYMBOLS_FILE}")
@@ -1,74 +1,209 @@
 import sqlite3
+import sys
 from app.config import DBPATH
+from app.ticks import CREATE_SQL_PRICE_TICKS, CREATE_SQL_PRICE_TICKS_INDEX
+from app import db
+from app.ledger import LOCKED_MESSAGE
+from app.db import apply_profile
 
-def schema(dbpath=DBPATH):
-    """
-    Create these tables
+"""
+Tables
 
     account:
-        id, username, password_hash, balance, first, last
+        id, username, password_hash, balance, first, last, version
 
     position:
         id, ticker, shares, account_id
 
     trade:
         id, ticker, volume, time, price, account_id
-    """
-    
-    # TODO: Put Unique constraints back in.
-    
-    CREATE_SQL_ACCOUNTS = """
-    CREATE TABLE accounts(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        first_name VARCHAR(200),
-        last_name VARCHAR(200),
-        username VARCHAR(15) NOT NULL,
-        email_address VARCHAR(50),
-        password_hash VARCHAR(30),
-        balance FLOAT,
-        account_number INTEGER,
-        admin INTEGER,
-        api_key INTEGER(9),
-        UNIQUE(account_number)
-    ); """
-
-    CREATE_SQL_POSITIONS = """
-    CREATE TABLE positions(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ticker VARCHAR(15) NOT NULL,
-        shares FLOAT,
-        account_id INTEGER,
-        FOREIGN KEY ("account_id") REFERENCES accounts(id),
-        UNIQUE(ticker, account_id)
-    ); """
-
-    
-    CREATE_SQL_TRADES = """
-    CREATE TABLE trades(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ticker VARCHAR(5) NOT NULL,
-        volume FLOAT,
-        unit_price FLOAT,
-        time DATE,
-        account_id INTEGER,
-        FOREIGN KEY ("account_id") REFERENCES accounts(id)
-    ); """
-
-
-    DROPSQL_ACCOUNTS = "DROP TABLE IF EXISTS accounts;"
-    DROPSQL_POSITIONS = "DROP TABLE IF EXISTS positions;"
-    DROPSQL_TRADES = "DROP TABLE IF EXISTS trades;"
-
-
-    with sqlite3.connect(dbpath) as conn:
-        cursor = conn.cursor()
-        cursor.execute(DROPSQL_ACCOUNTS)
-        cursor.execute(DROPSQL_POSITIONS)
-        cursor.execute(DROPSQL_TRADES)
-        cursor.execute(CREATE_SQL_ACCOUNTS)
-        cursor.execute(CREATE_SQL_POSITIONS)
-        cursor.execute(CREATE_SQL_TRADES)
+
+    price_ticks:
+        ticker, ts, price
+
+    deposits:
+        id, account_id, amount, time
+
+    snapshots, snapshot_positions, snapshot_balances:
+        positions and balances as of a trade and deposit id, see app/ledger.py.
+        trades and deposits up to the latest snapshot cannot be updated or
+        deleted
+
+The database remembers which migrations it has had in PRAGMA user_version.
+schema() runs the ones it is missing, in order, each in its own transaction,
+so it is safe to run on a database that already holds data. To change the
+tables, add a new migration to the end of MIGRATIONS, never edit an old one.
+"""
+
+# TODO: Put Unique constraints back in.
+
+CREATE_SQL_ACCOUNTS = """
+CREATE TABLE IF NOT EXISTS accounts(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name VARCHAR(200),
+    last_name VARCHAR(200),
+    username VARCHAR(15) NOT NULL,
+    email_address VARCHAR(50),
+    password_hash VARCHAR(30),
+    balance FLOAT,
+    account_number INTEGER,
+    admin INTEGER,
+    api_key INTEGER(9),
+    UNIQUE(account_number)
+); """
+
+CREATE_SQL_POSITIONS = """
+CREATE TABLE IF NOT EXISTS positions(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker VARCHAR(15) NOT NULL,
+    shares FLOAT,
+    account_id INTEGER,
+    FOREIGN KEY ("account_id") REFERENCES accounts(id),
+    UNIQUE(ticker, account_id)
+); """
+
+CREATE_SQL_TRADES = """
+CREATE TABLE IF NOT EXISTS trades(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker VARCHAR(5) NOT NULL,
+    volume FLOAT,
+    unit_price FLOAT,
+    time DATE,
+    account_id INTEGER,
+    FOREIGN KEY ("account_id") REFERENCES accounts(id)
+); """
+
+CREATE_SQL_DEPOSITS = """
+CREATE TABLE IF NOT EXISTS deposits(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id INTEGER,
+    amount FLOAT,
+    time FLOAT,
+    FOREIGN KEY ("account_id") REFERENCES accounts(id)
+); """
+
+CREATE_SQL_SNAPSHOTS = """
+CREATE TABLE IF NOT EXISTS snapshots(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time FLOAT,
+    last_trade_id INTEGER NOT NULL,
+    last_deposit_id INTEGER NOT NULL
+); """
+
+CREATE_SQL_SNAPSHOT_POSITIONS = """
+CREATE TABLE IF NOT EXISTS snapshot_positions(
+    snapshot_id INTEGER NOT NULL,
+    account_id INTEGER NOT NULL,
+    ticker VARCHAR(15) NOT NULL,
+    shares FLOAT,
+    PRIMARY KEY(snapshot_id, account_id, ticker),
+    FOREIGN KEY ("snapshot_id") REFERENCES snapshots(id)
+); """
+
+CREATE_SQL_SNAPSHOT_BALANCES = """
+CREATE TABLE IF NOT EXISTS snapshot_balances(
+    snapshot_id INTEGER NOT NULL,
+    account_id INTEGER NOT NULL,
+    balance FLOAT,
+    PRIMARY KEY(snapshot_id, account_id),
+    FOREIGN KEY ("snapshot_id") REFERENCES snapshots(id)
+); """
+
+# format with table, event (UPDATE or DELETE) and the snapshots column that
+# holds the table's last snapshotted id
+CREATE_SQL_LOCKED_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {table}_locked_{event}
+BEFORE {event} ON {table}
+WHEN OLD.id <= (SELECT COALESCE(MAX({column}), 0) FROM snapshots)
+BEGIN
+    SELECT RAISE(ABORT, '""" + LOCKED_MESSAGE + """');
+END; """
+
+MIGRATIONS = [
+    # 1: the original tables
+    [CREATE_SQL_ACCOUNTS,
+     CREATE_SQL_POSITIONS,
+     CREATE_SQL_TRADES],
+
+    # 2: price history
+    [CREATE_SQL_PRICE_TICKS,
+     CREATE_SQL_PRICE_TICKS_INDEX],
+
+    # 3: indexes for api key and username logins and trade history lookups
+    ["CREATE INDEX IF NOT EXISTS idx_accounts_api_key ON accounts(api_key);",
+     "CREATE INDEX IF NOT EXISTS idx_accounts_username ON accounts(username);",
+     "CREATE INDEX IF NOT EXISTS idx_trades_account_id_ticker ON trades(account_id, ticker);",
+     "CREATE INDEX IF NOT EXISTS idx_trades_account_id_time ON trades(account_id, time);"],
+
+    # 4: keyset pagination of an account's trades in id order
+    ["CREATE INDEX IF NOT EXISTS idx_trades_account_id ON trades(account_id);"],
+
+    # 5: optimistic concurrency, every write to an account bumps its version
+    ["ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0;"],
+
+    # 6: the ledger, deposits as events next to trades, and snapshots to
+    # rebuild positions and balances from
+    [CREATE_SQL_DEPOSITS,
+     CREATE_SQL_SNAPSHOTS,
+     CREATE_SQL_SNAPSHOT_POSITIONS,
+     CREATE_SQL_SNAPSHOT_BALANCES],
+
+    # 7: trades and deposits a snapshot covers are append-only
+    [CREATE_SQL_LOCKED_TRIGGER.format(table=table, event=event, column=column)
+     for table, column in (("trades", "last_trade_id"), ("deposits", "last_deposit_id"))
+     for event in ("UPDATE", "DELETE")],
+]
+
+TABLES = ["accounts", "positions", "trades", "price_ticks",
+          "deposits", "snapshots", "snapshot_positions", "snapshot_balances"]
+
+
+def schema(dbpath=DBPATH, reset=False):
+    """ bring the database at dbpath up to the latest migration and return
+    its version. reset=True drops every table first, for a clean slate """
+    if db.is_memory(dbpath):
+        # closing a connection to an in-memory database would throw it away,
+        # so use the shared pinned one
+        with db.transaction(dbpath) as connection:
+            return _schema(connection, reset)
+    connection = sqlite3.connect(dbpath, isolation_level=None)
+    try:
+        apply_profile(connection)
+        return _schema(connection, reset)
+    finally:
+        connection.close()
+
+
+def _schema(connection, reset):
+    if reset:
+        for table in TABLES:
+            connection.execute(f"DROP TABLE IF EXISTS {table};")
+        connection.execute("PRAGMA user_version=0;")
+    return migrate(connection)
+
+
+def migrate(connection):
+    """ run every migration newer than the connection's user_version """
+    version = schema_version(connection)
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version={number};")
+            connection.execute("COMMIT;")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK;")
+            raise
+        version = number
+    return version
+
+
+def schema_version(connection):
+    """ return how many migrations the database has had """
+    return connection.execute("PRAGMA user_version;").fetchone()[0]
 
 
 if __name__ == "__main__":
-    schema()
\ No newline at end of file
+    version = schema(reset="--reset" in sys.argv)
+    print(f"Database is at version {version}")
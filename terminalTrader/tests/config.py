@@ -2,4 +2,6 @@ import os
 
 DIRNAME = os.path.dirname(__file__)
 DBFILE  = "test_data.db"
-DBPATH  = os.path.join(DIRNAME, DBFILE)
\ No newline at end of file
+DBPATH  = os.path.join(DIRNAME, DBFILE)
+# Tests price the made-up DICT_FAKES tickers without touching the network
+PRICE_PROVIDER = "static"
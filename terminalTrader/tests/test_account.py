@@ -1,22 +1,24 @@
 import bcrypt
 import sqlite3
+import threading
 import unittest
-from app import Account, Trade, Position, setDB
-from app import InsufficientFundsError, InsufficientSharesError, NoSuchTickerError
+from app import Account, Trade, Position, setDB, setPriceProvider
+from app import InsufficientFundsError, InsufficientSharesError, NoSuchTickerError, StaleAccountError
 from schema import schema
-from tests.config import DBPATH
+from tests.config import DBPATH, PRICE_PROVIDER
 
 
 class TestAccount(unittest.TestCase):
 
     @classmethod 
     def setUpClass(cls):
-        schema(DBPATH)
+        schema(DBPATH, reset=True)
         setDB(DBPATH)
+        setPriceProvider(PRICE_PROVIDER)
 
     @classmethod
     def tearDownClass(cls):
-        pass
+        setPriceProvider("iex")
 
     def setUp(self):
         with sqlite3.connect(DBPATH) as connection:
@@ -61,6 +63,20 @@ class TestAccount(unittest.TestCase):
         self.assertEqual(caroline3.first_name, "Caro" , "update should update name")
         self.assertEqual(caroline3.last_name, "Grabo" , "update should update name")
 
+
+    def testSaveMany(self):
+        caroline = Account(username="cg16", password_hash="password", balance=10000)
+        caroline.save()
+        caroline.balance = 20000
+        imported = [Account(username=f"user{n}", balance=n) for n in range(20)]
+        Account.save_many(imported + [caroline])
+        self.assertEqual(len(Account.all()), 21, "save_many should insert the new accounts")
+        self.assertEqual(Account.from_id(caroline.id).balance, 20000, "save_many should update saved accounts")
+        for acct in imported:
+            loaded = Account.from_id(acct.id)
+            self.assertEqual((loaded.username, loaded.api_key), (acct.username, acct.api_key),
+                             "save_many should set each new account's id and api_key")
+
     def testDelete(self):
         caroline = Account(username="cg16" , password_hash="password" , balance=10000, 
         first_name="Caroline", last_name="Grabowski", email="caroline.gbowksi@gmail.com")
@@ -175,6 +191,129 @@ class TestAccount(unittest.TestCase):
             caroline.sell(ticker="xyz1234", volume=100)
 
 
+    def testBuyDebitsBalance(self):
+        alex = Account(username="alex16", password_hash="password", balance=10000,
+                       first_name="Alex", last_name="C", email="alexc@gmail.com")
+        alex.save()
+        alex.buy(ticker="STOK", volume=10)
+        self.assertAlmostEqual(alex.balance, 10000 - 10 * 123.45, msg="buy() should debit the balance")
+        self.assertAlmostEqual(Account.from_id(alex.id).balance, alex.balance,
+                               msg="buy() should save the new balance")
+        self.assertEqual(len(alex.get_trades_for("STOK")), 1, "buy() should record the trade")
+
+        with self.assertRaises(InsufficientFundsError, msg="buy() should raise InsufficientFundsError"):
+            alex.buy(ticker="P2P", volume=100)
+
+    def testBuyChecksStoredBalance(self):
+        alex = Account(username="alex16", password_hash="password", balance=10000,
+                       first_name="Alex", last_name="C", email="alexc@gmail.com")
+        alex.save()
+        elsewhere = Account.from_id(alex.id)
+        elsewhere.balance = 0
+        elsewhere.save()
+        with self.assertRaises(InsufficientFundsError, msg="buy() should check the saved balance"):
+            alex.buy(ticker="STOK", volume=10)
+        self.assertEqual(Position.from_account_id_and_ticker(alex.id, "STOK").shares, 0,
+                         "a rejected buy should not change the position")
+        self.assertEqual(alex.get_trades_for("STOK"), [], "a rejected buy should not record a trade")
+
+    def testBuyAfterDepositElsewhere(self):
+        alex = Account(username="alex16", password_hash="password", balance=0,
+                       first_name="Alex", last_name="C", email="alexc@gmail.com")
+        alex.save()
+        Account.from_id(alex.id).deposit(10000)
+        alex.buy(ticker="STOK", volume=10)
+        self.assertAlmostEqual(alex.balance, 10000 - 10 * 123.45,
+                               msg="buy() should go by the saved balance, not an out of date one")
+        self.assertEqual(Position.from_account_id_and_ticker(alex.id, "STOK").shares, 10)
+
+    def testSellCreditsBalance(self):
+        caroline = Account(username="cg16", password_hash="password", balance=10000,
+                           first_name="Caroline", last_name="Grabowski", email="caroline.gbowksi@gmail.com")
+        caroline.save()
+        Position(ticker="A33A", shares=200, account_id=caroline.id).save()
+        caroline.sell(ticker="A33A", volume=100)
+        self.assertAlmostEqual(Account.from_id(caroline.id).balance, 10000 + 100 * 98.76,
+                               msg="sell() should credit the balance")
+        trades = caroline.get_trades_for("A33A")
+        self.assertEqual([trade.volume for trade in trades], [-100], "sell() should record a negative volume trade")
+
+    def testOrderRollsBack(self):
+        alex = Account(username="alex16", password_hash="password", balance=10000,
+                       first_name="Alex", last_name="C", email="alexc@gmail.com")
+        alex.save()
+
+        def fail(self, connection):
+            raise ValueError("disk full")
+
+        insert_with = Trade.insert_with
+        Trade.insert_with = fail
+        try:
+            with self.assertRaises(ValueError):
+                alex.buy(ticker="STOK", volume=10)
+        finally:
+            Trade.insert_with = insert_with
+        self.assertEqual(Account.from_id(alex.id).balance, 10000, "a failed buy should not debit the balance")
+        self.assertEqual(Position.from_account_id_and_ticker(alex.id, "STOK").shares, 0,
+                         "a failed buy should not change the position")
+
+    def testStaleSave(self):
+        caroline = Account(username="cg16", password_hash="password", balance=10000)
+        caroline.save()
+        elsewhere = Account.from_id(caroline.id)
+        elsewhere.deposit(500)
+        caroline.balance = 0
+        with self.assertRaises(StaleAccountError, msg="saving an outdated account should fail"):
+            caroline.save()
+        self.assertEqual(Account.from_id(caroline.id).balance, 10500, "a stale save should change nothing")
+        with self.assertRaises(StaleAccountError, msg="save_many should check versions too"):
+            Account.save_many([caroline])
+        elsewhere.balance = 1
+        elsewhere.save()
+        self.assertEqual(Account.from_id(caroline.id).version, 2, "every write should bump the version")
+
+    def testConcurrentBuys(self):
+        alex = Account(username="alex16", password_hash="password", balance=10 * 123.45 * 5)
+        alex.save()
+        errors = []
+
+        def buy():
+            acct = Account.from_id(alex.id)
+            try:
+                acct.buy("STOK", 10)
+            except InsufficientFundsError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=buy) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3, "only the orders the balance covers should go through")
+        self.assertEqual(Position.from_account_id_and_ticker(alex.id, "STOK").shares, 50)
+        self.assertAlmostEqual(Account.from_id(alex.id).balance, 0)
+
+    def testBuyNormalizesTicker(self):
+        alex = Account(username="alex16", password_hash="password", balance=20000000,
+                       first_name="Alex", last_name="C", email="alexc@gmail.com")
+        alex.save()
+        alex.buy(ticker=" stok", volume=10)
+        check_stok = Position.from_account_id_and_ticker(account_id=alex.id, ticker="STOK")
+        self.assertEqual(check_stok.shares, 10, "buy() should upper-case the ticker")
+
+
+    def testValuePositions(self):
+        alex = Account(username="alex16", password_hash="password", balance=20000000,
+                       first_name="Alex", last_name="C", email="alexc@gmail.com")
+        alex.save()
+        Position(ticker="STOK", shares=10, account_id=alex.id).save()
+        Position(ticker="P2P", shares=2, account_id=alex.id).save()
+
+        valued = {position.ticker: (price, value) for position, price, value in alex.value_positions()}
+        self.assertEqual(valued["STOK"], (123.45, 10 * 123.45), "value_positions() should price each position")
+        self.assertEqual(valued["P2P"], (678.90, 2 * 678.90), "value_positions() should price each position")
+
+
     def testIs_admin(self):
         alex = Account(username="alex16", password_hash="password", balance=20000000, 
                        first_name="Alex", last_name="C", email="alexc@gmail.com",
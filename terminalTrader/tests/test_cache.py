@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+from app import trade
+from app.cache import QuoteCache
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestQuoteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = QuoteCache(ttl=10, maxsize=2, clock=self.clock)
+
+    def testGetPut(self):
+        self.assertIsNone(self.cache.get("AAPL"), "empty cache should miss")
+        self.cache.put("AAPL", 101.5)
+        self.assertEqual(self.cache.get("AAPL"), 101.5, "put price should be returned")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def testExpires(self):
+        self.cache.put("AAPL", 101.5)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get("AAPL"), "price older than ttl should miss")
+        self.assertEqual(len(self.cache), 0, "expired entries should be dropped")
+
+    def testLeastRecentlyUsedEvicted(self):
+        self.cache.put("AAPL", 1)
+        self.cache.put("GS", 2)
+        self.cache.get("AAPL")
+        self.cache.put("MS", 3)
+        self.assertIsNone(self.cache.get("GS"), "least recently used ticker should be evicted")
+        self.assertEqual(self.cache.get("AAPL"), 1)
+        self.assertEqual(self.cache.get("MS"), 3)
+
+    def testInvalidate(self):
+        self.cache.put("AAPL", 1)
+        self.cache.put("GS", 2)
+        self.cache.invalidate("AAPL")
+        self.assertIsNone(self.cache.get("AAPL"))
+        self.assertEqual(self.cache.get("GS"), 2)
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0, "invalidate() should clear every ticker")
+
+    def testGetCurrentPriceUsesCache(self):
+        trade.QUOTE_CACHE.invalidate()
+        with mock.patch.object(trade.PRICE_PROVIDER, "get_price", return_value=55.5) as fetch:
+            self.assertEqual(trade.get_current_price("AAPL"), 55.5)
+            self.assertEqual(trade.get_current_price("AAPL"), 55.5)
+            self.assertEqual(fetch.call_count, 1, "second lookup should be served from the cache")
+        trade.QUOTE_CACHE.invalidate()
+
+    def testUnknownTickerNotCached(self):
+        trade.QUOTE_CACHE.invalidate()
+        with mock.patch.object(trade.PRICE_PROVIDER, "get_price", return_value=None) as fetch:
+            self.assertIsNone(trade.get_current_price("XYZ1234"))
+            self.assertIsNone(trade.get_current_price("XYZ1234"))
+            self.assertEqual(fetch.call_count, 2, "unknown tickers should not be cached")
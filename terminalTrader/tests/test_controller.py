@@ -2,6 +2,7 @@ import bcrypt
 import sqlite3
 import unittest
 from app import controller, Account, Trade, Position, setDB, view
+from app import pnl
 from app import InsufficientFundsError, InsufficientSharesError, NoSuchTickerError
 from schema import schema
 from tests.config import DBPATH
@@ -11,7 +12,7 @@ class TestController(unittest.TestCase):
 
     @classmethod 
     def setUpClass(cls):
-        schema(DBPATH)
+        schema(DBPATH, reset=True)
         setDB(DBPATH)
 
 
@@ -200,8 +201,7 @@ testView_positions()\n""")
         account_data.buy("P2P", 200)
         account_data.buy("A33A", 300)
 
-        positions = account_data.get_positions()
-        view.positions_info(positions)
+        view.pnl_info(pnl.account_pnl(account_data.id))
     
 
     def testReview_trade_history(self):
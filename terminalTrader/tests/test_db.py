@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from app.db import ConnectionManager, apply_profile
+
+
+class TestConnectionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbpath = os.path.join(self.tmpdir.name, "db.db")
+        self.manager = ConnectionManager(self.dbpath)
+        with self.manager.transaction() as connection:
+            connection.execute("CREATE TABLE things(id INTEGER PRIMARY KEY, name TEXT);")
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmpdir.cleanup()
+
+    def testConnectionReusedInThread(self):
+        self.assertIs(self.manager.connection(), self.manager.connection(),
+                      "a thread should get the same connection every time")
+        self.assertEqual(self.manager.opened, 1)
+
+    def testConnectionPerThread(self):
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.manager.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.manager.connection(), "each thread should get its own connection")
+
+    def testTransactionCommits(self):
+        with self.manager.transaction() as connection:
+            connection.execute("INSERT INTO things(name) VALUES ('a');")
+        with sqlite3.connect(self.dbpath) as other:
+            self.assertEqual(other.execute("SELECT COUNT(*) FROM things;").fetchone()[0], 1)
+
+    def testTransactionRollsBack(self):
+        with self.assertRaises(ValueError):
+            with self.manager.transaction() as connection:
+                connection.execute("INSERT INTO things(name) VALUES ('a');")
+                raise ValueError
+        with self.manager.transaction() as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM things;").fetchone()[0], 0,
+                             "an exception should roll the transaction back")
+
+    def testImmediate(self):
+        with self.manager.immediate() as connection:
+            self.assertTrue(connection.in_transaction, "immediate() should open the transaction up front")
+            connection.execute("INSERT INTO things(name) VALUES ('a');")
+        with self.assertRaises(ValueError):
+            with self.manager.immediate() as connection:
+                connection.execute("INSERT INTO things(name) VALUES ('b');")
+                raise ValueError
+        with self.manager.transaction() as connection:
+            self.assertEqual([row["name"] for row in connection.execute("SELECT name FROM things;")], ["a"],
+                             "immediate() should commit on success and roll back on an exception")
+
+    def testRowsByName(self):
+        with self.manager.transaction() as connection:
+            connection.execute("INSERT INTO things(name) VALUES ('a');")
+            row = connection.execute("SELECT * FROM things;").fetchone()
+        self.assertEqual(row["name"], "a", "rows should be sqlite3.Row for cls(**row)")
+
+    def testClose(self):
+        first = self.manager.connection()
+        self.manager.close()
+        self.assertIsNot(first, self.manager.connection(), "close() should drop the thread's connection")
+
+    def testFastProfile(self):
+        connection = ConnectionManager(self.dbpath, profile="fast").connection()
+        self.assertEqual(connection.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+        self.assertEqual(connection.execute("PRAGMA synchronous;").fetchone()[0], 1, "synchronous should be NORMAL")
+        self.assertEqual(connection.execute("PRAGMA temp_store;").fetchone()[0], 2, "temp_store should be MEMORY")
+        self.assertEqual(connection.execute("PRAGMA busy_timeout;").fetchone()[0], 5000)
+        connection.close()
+
+    def testUnknownProfile(self):
+        with self.assertRaises(ValueError):
+            self.manager.setProfile("nope")
+        with self.assertRaises(ValueError):
+            apply_profile(self.manager.connection(), "nope")
+
+    def testReaderDoesNotBlockWriter(self):
+        self.manager.setProfile("fast")
+        self.manager.close()
+        reader = sqlite3.connect(self.dbpath, isolation_level=None)
+        reader.execute("BEGIN;")
+        reader.execute("SELECT COUNT(*) FROM things;").fetchone()
+        writer = sqlite3.connect(self.dbpath, timeout=0)
+        with writer:
+            writer.execute("INSERT INTO things(name) VALUES ('a');")
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM things;").fetchone()[0], 0,
+                         "an open read transaction should keep its snapshot")
+        reader.execute("COMMIT;")
+        reader.close()
+        writer.close()
+
+
+class TestMemoryDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.manager = ConnectionManager(":memory:test")
+        with self.manager.transaction() as connection:
+            connection.execute("CREATE TABLE things(id INTEGER PRIMARY KEY, name TEXT);")
+            connection.execute("INSERT INTO things(name) VALUES ('a');")
+
+    def tearDown(self):
+        self.manager.discard()
+        self.tmpdir.cleanup()
+
+    def names(self, dbpath=None):
+        with self.manager.transaction(dbpath) as connection:
+            return [row["name"] for row in connection.execute("SELECT name FROM things ORDER BY id;")]
+
+    def testSharedAcrossThreads(self):
+        self.manager.close()
+        names = []
+        thread = threading.Thread(target=lambda: names.append(self.names()))
+        thread.start()
+        thread.join()
+        self.assertEqual(names, [["a"]], "every thread should see the same in-memory database")
+
+    def testNamedDatabasesAreSeparate(self):
+        with self.manager.transaction(":memory:other") as connection:
+            connection.execute("CREATE TABLE things(id INTEGER PRIMARY KEY, name TEXT);")
+        self.assertEqual(self.names(":memory:other"), [])
+        self.manager.discard(":memory:other")
+
+    def testSnapshotAndRestore(self):
+        path = os.path.join(self.tmpdir.name, "snapshot.db")
+        self.manager.snapshot(path)
+        with sqlite3.connect(path) as other:
+            self.assertEqual(other.execute("SELECT name FROM things;").fetchall(), [("a",)],
+                             "snapshot() should copy the database to disk")
+        with self.manager.transaction() as connection:
+            connection.execute("DELETE FROM things;")
+        self.manager.restore(path)
+        self.assertEqual(self.names(), ["a"], "restore() should load the snapshot back")
+
+    def testDiscard(self):
+        self.manager.discard()
+        with self.assertRaises(sqlite3.OperationalError, msg="discard() should throw the data away"):
+            self.names()
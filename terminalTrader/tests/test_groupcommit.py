@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from app import Account, Position, Trade, setDB, setPriceProvider
+from app import InsufficientFundsError
+from app import groupcommit
+from app.groupcommit import GroupCommitWriter
+from schema import schema
+from tests.config import DBPATH, PRICE_PROVIDER
+
+
+def insert(name):
+    def write(connection):
+        connection.execute("INSERT INTO things(name) VALUES (?);", (name,))
+        return name
+    return write
+
+
+def fail(connection):
+    connection.execute("INSERT INTO things(name) VALUES ('bad');")
+    raise ValueError("bad write")
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbpath = os.path.join(self.tmpdir.name, "group.db")
+        with sqlite3.connect(self.dbpath) as connection:
+            connection.execute("CREATE TABLE things(id INTEGER PRIMARY KEY, name TEXT);")
+        self.writer = GroupCommitWriter(batch_size=50, interval=0.05)
+
+    def tearDown(self):
+        self.writer.close()
+        self.tmpdir.cleanup()
+
+    def names(self):
+        with sqlite3.connect(self.dbpath) as connection:
+            return [row[0] for row in connection.execute("SELECT name FROM things ORDER BY id;")]
+
+    def testBatches(self):
+        futures = [self.writer.submit(insert(str(n)), self.dbpath) for n in range(100)]
+        self.assertEqual([future.result() for future in futures], [str(n) for n in range(100)])
+        self.assertEqual(self.names(), [str(n) for n in range(100)], "every write should be committed in order")
+        self.assertLess(self.writer.commits, 10, "writes should be committed in batches")
+
+    def testFailureIsolated(self):
+        futures = [self.writer.submit(insert("a"), self.dbpath),
+                   self.writer.submit(fail, self.dbpath),
+                   self.writer.submit(insert("b"), self.dbpath)]
+        with self.assertRaises(ValueError):
+            futures[1].result()
+        self.assertEqual(futures[2].result(), "b")
+        self.assertEqual(self.names(), ["a", "b"], "a failed write should be rolled back on its own")
+
+    def testCloseDrains(self):
+        future = self.writer.submit(insert("a"), self.dbpath)
+        self.writer.close()
+        self.assertTrue(future.done(), "close() should commit what is queued")
+        self.assertEqual(self.names(), ["a"])
+
+
+class TestGroupCommitOrders(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        schema(DBPATH, reset=True)
+        setDB(DBPATH)
+        setPriceProvider(PRICE_PROVIDER)
+        groupcommit.WRITER.enabled = True
+
+    @classmethod
+    def tearDownClass(cls):
+        groupcommit.WRITER.enabled = False
+        setPriceProvider("iex")
+
+    def testConcurrentBuys(self):
+        alex = Account(username="alex16", balance=10 * 123.45 * 5)
+        alex.save()
+        errors = []
+
+        def buy():
+            try:
+                Account.from_id(alex.id).buy("STOK", 10)
+            except InsufficientFundsError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=buy) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3, "the balance check should still run inside each write")
+        self.assertEqual(Position.from_account_id_and_ticker(alex.id, "STOK").shares, 50)
+        self.assertEqual(len(alex.get_trades_for("STOK")), 5, "a rejected order should leave no trade")
+
+    def testSaveAsync(self):
+        trade = Trade(ticker="IBM", volume=1.0, unit_price=2.0, account_id=1)
+        trade.save_async().result()
+        self.assertIsNotNone(Trade.from_id(trade.id), "the trade should be committed when its future is done")
@@ -0,0 +1,102 @@
+import sqlite3
+import unittest
+from app import Account, Position, setDB, setPriceProvider
+from app import ledger
+from app.errs import LedgerLockedError
+from app.providers import StaticProvider
+from schema import schema
+from tests.config import DBPATH
+
+
+class TestLedger(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        schema(DBPATH, reset=True)
+        setDB(DBPATH)
+        setPriceProvider(StaticProvider({"STOK": 10.0, "P2P": 1.0}))
+
+    @classmethod
+    def tearDownClass(cls):
+        setPriceProvider("iex")
+
+    def setUp(self):
+        with sqlite3.connect(DBPATH) as connection:
+            # snapshots first, the trades and deposits they cover cannot be deleted
+            for table in ("snapshots", "snapshot_positions", "snapshot_balances",
+                          "accounts", "positions", "trades", "deposits"):
+                connection.execute(f"DELETE FROM {table};")
+        self.alex = Account(username="alex16", balance=1000.0)
+        self.alex.save()
+        self.alex.buy("STOK", 10)
+        self.alex.buy("P2P", 50)
+        self.alex.sell("STOK", 4)
+
+    def corrupt(self, SQL):
+        with sqlite3.connect(DBPATH) as connection:
+            connection.execute(SQL)
+
+    def testInLine(self):
+        ledger.snapshot()
+        self.alex.deposit(25.0)
+        self.alex.buy("P2P", 5)
+        self.assertEqual(ledger.rebuild(), [], "orders and deposits should keep the book in line with the ledger")
+
+    def testRebuildPositionsWithoutSnapshot(self):
+        self.corrupt("UPDATE positions SET shares=99 WHERE ticker='STOK';")
+        self.corrupt("DELETE FROM positions WHERE ticker='P2P';")
+        drift = ledger.rebuild(apply=False)
+        self.assertEqual(sorted(drift), [ledger.Drift(self.alex.id, "P2P", None, 50.0),
+                                         ledger.Drift(self.alex.id, "STOK", 99.0, 6.0)])
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 99,
+                         "apply=False should only report")
+        ledger.rebuild()
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 6)
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "P2P").shares, 50)
+        self.assertEqual(ledger.rebuild(), [])
+
+    def testRebuildBalanceFromSnapshot(self):
+        ledger.snapshot()
+        self.alex.deposit(100.0)
+        self.alex.sell("P2P", 10)
+        expected = Account.from_id(self.alex.id).balance
+        self.corrupt("UPDATE accounts SET balance=0;")
+        self.assertEqual(ledger.rebuild(), [ledger.Drift(self.alex.id, None, 0.0, expected)])
+        self.assertAlmostEqual(Account.from_id(self.alex.id).balance, expected)
+
+    def testSnapshotFoldsEvents(self):
+        first = ledger.snapshot()
+        self.alex.buy("STOK", 1)
+        self.corrupt("UPDATE positions SET shares=0;")
+        second = ledger.snapshot()
+        self.assertGreater(second, first)
+        with sqlite3.connect(DBPATH) as connection:
+            rows = connection.execute("""SELECT ticker, shares FROM snapshot_positions
+                                         WHERE snapshot_id=? ORDER BY ticker;""", (second,)).fetchall()
+        self.assertEqual(rows, [("P2P", 50.0), ("STOK", 7.0)],
+                         "a snapshot should come from the ledger, not the drifted positions")
+
+    def testImportedPositionsKept(self):
+        Position.upsert_many([Position(ticker="AAPL", shares=50, account_id=self.alex.id)])
+        self.assertEqual(ledger.rebuild(), [], "a position with no trades should be left alone")
+        ledger.snapshot()
+        self.alex.buy("P2P", 1)
+        self.assertEqual(ledger.rebuild(), [], "an imported position should be seeded into the snapshot")
+        self.corrupt("UPDATE positions SET shares=0 WHERE ticker='AAPL';")
+        self.assertEqual(ledger.rebuild(), [ledger.Drift(self.alex.id, "AAPL", 0.0, 50.0)])
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "AAPL").shares, 50)
+
+    def testSnapshottedEventsAppendOnly(self):
+        self.alex.deposit(10.0)
+        ledger.snapshot()
+        old = self.alex.get_trades()[0]
+        old.volume = 1000
+        with self.assertRaises(LedgerLockedError):
+            old.save()
+        with self.assertRaises(LedgerLockedError):
+            old.delete()
+        with self.assertRaises(sqlite3.IntegrityError, msg="a snapshotted deposit should not change"):
+            self.corrupt("DELETE FROM deposits;")
+        self.alex.buy("P2P", 1)
+        self.alex.get_trades()[-1].delete() # not snapshotted yet, so not locked
+        self.assertEqual(ledger.rebuild(apply=False)[0].rebuilt, 50.0)
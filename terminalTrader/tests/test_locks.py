@@ -0,0 +1,43 @@
+import threading
+import unittest
+from app.locks import LockStripes
+
+
+class TestLockStripes(unittest.TestCase):
+
+    def testSameKeySameLock(self):
+        stripes = LockStripes(8)
+        self.assertIs(stripes.lock_for(42), stripes.lock_for(42), "a key should always get the same lock")
+        self.assertEqual(len({id(stripes.lock_for(key)) for key in range(100)}), 8,
+                         "keys should be spread over every stripe")
+
+    def testDifferentKeysDoNotWait(self):
+        stripes = LockStripes(8)
+        done = threading.Event()
+
+        def other():
+            with stripes.hold(2):
+                done.set()
+
+        with stripes.hold(1):
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join(1)
+        self.assertTrue(done.is_set(), "another stripe should not wait for a held one")
+
+    def testSameKeySerializes(self):
+        stripes = LockStripes(8)
+        counter = {"value": 0}
+
+        def work():
+            for _ in range(1000):
+                with stripes.hold(7):
+                    value = counter["value"]
+                    counter["value"] = value + 1
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter["value"], 4000)
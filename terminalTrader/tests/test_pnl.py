@@ -0,0 +1,115 @@
+import sqlite3
+import unittest
+from app import Account, Position, Trade, setDB, setPriceProvider
+from app import pnl, storage
+from app.providers import StaticProvider
+from schema import schema
+from tests.config import DBPATH
+
+
+def trade(ticker, volume, unit_price, account_id=1):
+    return Trade(ticker=ticker, volume=volume, unit_price=unit_price, account_id=account_id)
+
+
+def record(*trades):
+    """ save trades and the positions they add up to, like buy() and sell() """
+    Trade.save_many(trades)
+    held = {}
+    for row in trades:
+        held[(row.account_id, row.ticker)] = held.get((row.account_id, row.ticker), 0) + row.volume
+    Position.upsert_many([Position(account_id=account_id, ticker=ticker, shares=shares)
+                          for (account_id, ticker), shares in held.items()])
+
+
+class TestPnl(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        schema(DBPATH, reset=True)
+        setDB(DBPATH)
+        setPriceProvider(StaticProvider({"STOK": 15.0, "P2P": 2.0}))
+
+    @classmethod
+    def tearDownClass(cls):
+        setPriceProvider("iex")
+
+    def setUp(self):
+        with sqlite3.connect(DBPATH) as connection:
+            connection.execute("DELETE FROM trades;")
+            connection.execute("DELETE FROM positions;")
+
+    def testAverageCost(self):
+        record(trade("STOK", 10, 10.0), trade("STOK", 10, 20.0), trade("STOK", -5, 25.0))
+        row, = pnl.account_pnl(1)
+        self.assertEqual(row.shares, 15)
+        self.assertAlmostEqual(row.average_cost, 15.0, msg="a sell should not move the average")
+        self.assertAlmostEqual(row.realized, 5 * (25.0 - 15.0))
+        self.assertAlmostEqual(row.unrealized, 0.0)
+        self.assertEqual(row.price, 15.0)
+
+    def testReopenedPosition(self):
+        record(trade("STOK", 10, 10.0), trade("STOK", -10, 12.0),
+               trade("STOK", 4, 30.0), trade("STOK", -1, 40.0))
+        row, = pnl.account_pnl(1)
+        self.assertAlmostEqual(row.average_cost, 30.0, msg="a reopened position should start a new average")
+        self.assertAlmostEqual(row.realized, 20.0 + 10.0)
+        self.assertAlmostEqual(row.unrealized, 3 * (15.0 - 30.0))
+
+    def testClosedAndUnpriced(self):
+        record(trade("P2P", 100, 1.0), trade("P2P", -100, 1.5), trade("GONE", 3, 7.0))
+        rows = {row.ticker: row for row in pnl.account_pnl(1)}
+        self.assertIsNone(rows["P2P"].average_cost, "a closed position has no average cost")
+        self.assertAlmostEqual(rows["P2P"].realized, 50.0)
+        self.assertEqual(rows["P2P"].unrealized, 0.0)
+        self.assertIsNone(rows["GONE"].price)
+        self.assertIsNone(rows["GONE"].unrealized)
+        self.assertEqual(pnl.totals(rows.values()), (50.0, 0.0))
+
+    def testBookAndAccount(self):
+        record(trade("STOK", 1, 10.0, account_id=1), trade("P2P", 2, 1.0, account_id=2),
+               trade("STOK", 3, 12.0, account_id=2))
+        book = pnl.book_pnl()
+        self.assertEqual([(row.account_id, row.ticker) for row in book],
+                         [(1, "STOK"), (2, "P2P"), (2, "STOK")])
+        self.assertEqual(pnl.account_pnl(2), book[1:])
+        self.assertEqual(pnl.account_pnl(3), [])
+
+    def testPositionWithoutTrades(self):
+        record(trade("STOK", 2, 10.0))
+        Position(ticker="P2P", shares=3, account_id=1).save()
+        rows = {row.ticker: row for row in pnl.account_pnl(1)}
+        self.assertEqual(rows["P2P"], pnl.PnlRow(1, "P2P", 3, None, 2.0, 0.0, None),
+                         "a held position with no trades should still be listed")
+        self.assertAlmostEqual(rows["STOK"].unrealized, 2 * (15.0 - 10.0))
+
+    def testSharesFromPositions(self):
+        record(trade("STOK", 10, 10.0))
+        Position.upsert_many([Position(ticker="STOK", shares=4, account_id=1)])
+        row, = pnl.account_pnl(1)
+        self.assertEqual(row.shares, 4, "held shares should come from the positions table")
+        self.assertEqual(row, pnl.PnlRow(1, "STOK", 4, None, 15.0, None, None),
+                         "a cost is not known when the trades do not add up to the shares held")
+
+    def testImportedThenSold(self):
+        Position.upsert_many([Position(ticker="STOK", shares=200, account_id=1)])
+        Trade.save_many([trade("STOK", -50, 123.45)])
+        Position.upsert_many([Position(ticker="STOK", shares=150, account_id=1)])
+        row, = pnl.account_pnl(1)
+        self.assertEqual(row, pnl.PnlRow(1, "STOK", 150, None, 15.0, None, None),
+                         "selling imported shares should not be booked against a zero cost")
+        self.assertEqual(pnl.totals([row]), (0, 0))
+        book, = pnl.pnl(pnl.load_trades(1), {"STOK": 15.0})
+        self.assertIsNone(book.realized, "more sold than bought should leave the cost unknown")
+
+    def testMemoryStorage(self):
+        storage.setStorage("memory")
+        try:
+            alex = Account(username="alex16", balance=1000.0)
+            alex.save()
+            alex.buy("STOK", 10)
+            alex.sell("STOK", 2)
+            row, = pnl.account_pnl(alex.id)
+            self.assertEqual(row.shares, 8)
+            self.assertAlmostEqual(row.average_cost, 15.0)
+        finally:
+            storage.setStorage("sqlite")
@@ -1,5 +1,7 @@
 import unittest
 import sqlite3 
+from unittest import mock
+from app import trade
 from app import Account, Trade, Position, setDB
 from app import InsufficientFundsError, InsufficientSharesError, NoSuchTickerError
 from schema import schema
@@ -10,7 +12,7 @@ class TestPosition(unittest.TestCase):
 
     @classmethod 
     def setUpClass(cls):
-        schema(DBPATH)
+        schema(DBPATH, reset=True)
         setDB(DBPATH)
     
     @classmethod
@@ -59,6 +61,17 @@ class TestPosition(unittest.TestCase):
         self.assertEqual(apple3.shares,  150, "save updates should increase share amt by 50")
         self.assertEqual(apple3.account_id,  3, "save should keep the same account_id if not changed")
 
+
+    def testUpsertMany(self):
+        Position(ticker="IBM", shares=5, account_id=7).save()
+        Position.upsert_many([Position(ticker="IBM", shares=50, account_id=7),
+                              Position(ticker="GS", shares=20, account_id=7)])
+        self.assertEqual(Position.from_account_id_and_ticker(7, "IBM").shares, 50,
+                         "upsert_many should replace an existing position's shares")
+        self.assertEqual(Position.from_account_id_and_ticker(7, "GS").shares, 20,
+                         "upsert_many should insert a new position")
+        self.assertEqual(len(Position.all_from_account_id(7)), 2, "upsert_many should not duplicate positions")
+
     def testDelete(self):
         apple = Position(ticker="AAPL", shares=100, account_id=3)
         apple.save()
@@ -127,3 +140,11 @@ class TestPosition(unittest.TestCase):
         print(all_account_data)
         self.assertEqual(all_account_data, results, "function should spit out all positions for account id where shares >0")
         pass
+
+    def testValueWithGivenPrice(self):
+        stok = Position(ticker="STOK", shares=10, account_id=1)
+        with mock.patch.object(trade, "get_current_price", return_value=2.0) as get_current_price:
+            self.assertEqual(stok.value(3.0), 30.0)
+            self.assertIsNone(stok.value(None), "an unpriced ticker passed in should not be fetched")
+            get_current_price.assert_not_called()
+            self.assertEqual(stok.value(), 20.0)
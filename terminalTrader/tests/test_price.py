@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+import requests
+from app import trade
+from app.errs import PriceUnavailableError
+from app.resilience import CircuitBreaker
+from app.price_client import PriceClient
+from app.providers import IEXProvider, StaticProvider, PriceProvider
+
+
+STUB_PRICES = {"AAPL": 150.25, "GS": 210.5, "MS": 45.75}
+
+
+class StubIEXHandler(BaseHTTPRequestHandler):
+    """ answers IEX quote and batch urls from STUB_PRICES """
+
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+    client_ports = set()
+    error_status = None # answer every request with this status when set
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        type(self).requests_seen.append(url.path)
+        type(self).client_ports.add(self.client_address[1])
+        if type(self).error_status:
+            return self._send(type(self).error_status, "Service Unavailable")
+        if url.path.endswith("/stock/market/batch"):
+            body = {}
+            for symbol in query["symbols"][0].split(","):
+                if symbol.upper() in STUB_PRICES:
+                    body[symbol.upper()] = {"quote": {"latestPrice": STUB_PRICES[symbol.upper()]}}
+            return self._send(200, body)
+        ticker = url.path.split("/")[-2].upper()
+        if ticker in STUB_PRICES:
+            return self._send(200, {"latestPrice": STUB_PRICES[ticker]})
+        return self._send(404, "Unknown symbol")
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPrice(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubIEXHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        tokenfile = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+        tokenfile.write("stubtoken\n")
+        tokenfile.close()
+        cls.tokenfile = tokenfile.name
+        cls.base_url = "http://127.0.0.1:{}/stable".format(cls.server.server_address[1])
+        cls.client = PriceClient(base_url=cls.base_url, tokenfile=cls.tokenfile)
+        trade.setPriceProvider(StaticProvider(trade.DICT_FAKES, fallback=IEXProvider(cls.client)))
+
+    @classmethod
+    def tearDownClass(cls):
+        trade.setPriceProvider("iex")
+        cls.client.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+        os.remove(cls.tokenfile)
+
+    def setUp(self):
+        trade.QUOTE_CACHE.invalidate()
+        StubIEXHandler.requests_seen = []
+        StubIEXHandler.client_ports = set()
+
+    def tearDown(self):
+        StubIEXHandler.error_status = None
+        trade.QUOTE_CACHE.invalidate()
+        trade.QUOTE_BREAKER.reset()
+
+    def testGetCurrentPrice(self):
+        self.assertEqual(trade.get_current_price("AAPL"), 150.25)
+        self.assertIsNone(trade.get_current_price("XYZ1234"), "unknown ticker should return None")
+
+    def testGetCurrentPricesOneBatchCall(self):
+        prices = trade.get_current_prices(["AAPL", "GS", "MS", "XYZ1234"])
+        self.assertEqual(prices, {"AAPL": 150.25, "GS": 210.5, "MS": 45.75, "XYZ1234": None})
+        self.assertEqual(len(StubIEXHandler.requests_seen), 1, "all tickers should be fetched in one batch")
+
+    def testGetCurrentPricesFakesAndCacheLocal(self):
+        trade.get_current_price("AAPL")
+        StubIEXHandler.requests_seen = []
+        prices = trade.get_current_prices(["STOK", "AAPL"])
+        self.assertEqual(prices, {"STOK": trade.DICT_FAKES["STOK"], "AAPL": 150.25})
+        self.assertEqual(StubIEXHandler.requests_seen, [], "fakes and cached prices should not hit the network")
+
+    def testGetCurrentPricesChunked(self):
+        with mock.patch.object(self.client, "batch_size", 2):
+            prices = trade.get_current_prices(["AAPL", "GS", "MS"])
+        self.assertEqual(prices["MS"], 45.75)
+        self.assertEqual(len(StubIEXHandler.requests_seen), 2, "batches should hold at most IEX_BATCH_SIZE symbols")
+
+    def testBatchTimeoutReachesClient(self):
+        with mock.patch.object(self.client.session, "get", wraps=self.client.session.get) as get:
+            prices = trade.get_current_prices_concurrently(["AAPL"], timeout=2)
+        self.assertEqual(prices, {"AAPL": 150.25})
+        self.assertEqual(get.call_args.kwargs["timeout"], 2, "the batch timeout should bound the HTTP call")
+
+    def testUnknownTickerIsNotAFailure(self):
+        self.assertIsNone(self.client.get_price("NOPE"), "a 404 should mean the ticker is unknown")
+        self.assertEqual(self.client.get_prices(["NOPE"]), {})
+
+    def testServerErrorsOpenBreaker(self):
+        StubIEXHandler.error_status = 503
+        for _ in range(trade.QUOTE_BREAKER.failure_threshold):
+            with self.assertRaises(requests.HTTPError, msg="a 503 should not look like an unknown ticker"):
+                trade.get_quote("AAPL")
+        self.assertEqual(trade.QUOTE_BREAKER.state, CircuitBreaker.OPEN, "503s should count as failures")
+        with self.assertRaises(PriceUnavailableError):
+            trade.get_quote("AAPL")
+
+    def testBatchServerErrorFallsBackToStale(self):
+        trade.get_current_prices(["AAPL"])
+        StubIEXHandler.error_status = 429
+        with mock.patch.object(trade.QUOTE_CACHE, "get", return_value=None):
+            prices = trade.get_current_prices(["AAPL", "GS"])
+        self.assertEqual(prices, {"AAPL": 150.25, "GS": None}, "a failed batch should fall back to stale prices")
+        self.assertEqual(trade.QUOTE_BREAKER.failures, 1)
+
+    def testGetCurrentPricesLowercase(self):
+        prices = trade.get_current_prices(["aapl"])
+        self.assertEqual(prices, {"aapl": 150.25}, "prices should be keyed by the requested ticker")
+
+    def testClientReusesConnectionAndToken(self):
+        client = PriceClient(base_url=self.base_url, tokenfile=self.tokenfile)
+        with mock.patch("builtins.open", wraps=open) as opened:
+            for ticker in ("AAPL", "GS", "MS"):
+                client.get_price(ticker)
+        self.assertEqual(opened.call_count, 1, "token file should be read once")
+        self.assertEqual(len(StubIEXHandler.client_ports), 1, "quotes should share one keep-alive connection")
+        client.close()
+
+
+class SlowProvider(PriceProvider):
+    """ a remote-looking provider whose batch calls take delay seconds """
+
+    remote = True
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get_price(self, ticker):
+        return self.get_prices([ticker]).get(ticker)
+
+    def get_prices(self, tickers):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return {ticker: float(len(ticker)) for ticker in tickers}
+
+
+class TestAsyncPrices(unittest.TestCase):
+
+    def tearDown(self):
+        trade.setPriceProvider("iex")
+
+    def testBatchesRunConcurrently(self):
+        provider = SlowProvider(0.2)
+        trade.setPriceProvider(provider)
+        tickers = ["T{}".format(n) for n in range(200)]
+        start = time.monotonic()
+        prices = asyncio.run(trade.get_current_prices_async(tickers, concurrency=4, chunk_size=50))
+        elapsed = time.monotonic() - start
+        self.assertEqual(len(prices), 200)
+        self.assertEqual(prices["T10"], 3.0)
+        self.assertEqual(provider.calls, 4, "200 tickers should be fetched in 4 batches of 50")
+        self.assertLess(elapsed, 0.6, "batches should be fetched at the same time")
+
+    def testConcurrencyLimit(self):
+        provider = SlowProvider(0.05)
+        trade.setPriceProvider(provider)
+        tickers = ["T{}".format(n) for n in range(10)]
+        asyncio.run(trade.get_current_prices_async(tickers, concurrency=2, chunk_size=1))
+        self.assertEqual(provider.max_in_flight, 2, "no more than concurrency batches should be in flight")
+
+    def testTimeout(self):
+        trade.setPriceProvider(SlowProvider(0.5))
+        start = time.monotonic()
+        prices = trade.get_current_prices_concurrently(["AAPL"], timeout=0.05)
+        self.assertEqual(prices, {"AAPL": None}, "a timed out batch should map its tickers to None")
+        self.assertLess(time.monotonic() - start, 0.3, "a timed out batch should not be waited for")
+
+    def testCachedTickersSkipped(self):
+        provider = SlowProvider(0)
+        trade.setPriceProvider(provider)
+        trade.get_current_prices_concurrently(["AAPL"])
+        trade.get_current_prices_concurrently(["AAPL"])
+        self.assertEqual(provider.calls, 1, "cached tickers should not be fetched again")
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from app import trade
+from app.providers import PriceProvider, StaticProvider, ReplayProvider, from_config
+
+
+class TestProviders(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testStaticProvider(self):
+        provider = StaticProvider({"AAPL": 10.0})
+        self.assertEqual(provider.get_price("AAPL"), 10.0)
+        self.assertIsNone(provider.get_price("GS"), "unknown ticker should return None")
+        self.assertEqual(provider.get_prices(["AAPL", "GS"]), {"AAPL": 10.0})
+        self.assertFalse(provider.remote, "a dict provider should not be remote")
+
+    def testStaticProviderFallback(self):
+        fallback = StaticProvider({"GS": 20.0})
+        provider = StaticProvider({"AAPL": 10.0}, fallback=fallback)
+        self.assertEqual(provider.get_price("GS"), 20.0, "misses should be passed to fallback")
+        self.assertEqual(provider.get_prices(["AAPL", "GS"]), {"AAPL": 10.0, "GS": 20.0})
+
+    def testReplayCSV(self):
+        path = os.path.join(self.tmpdir.name, "ticks.csv")
+        with open(path, "w") as tickfile:
+            tickfile.write("ticker,ts,price\nAAPL,2,11.0\nAAPL,1,10.0\nGS,1,20.0\n")
+        provider = ReplayProvider(path)
+        self.assertEqual([provider.get_price("AAPL") for _ in range(3)], [10.0, 11.0, 10.0],
+                         "ticks should replay in time order and loop")
+        self.assertEqual(provider.get_price("GS"), 20.0)
+        self.assertIsNone(provider.get_price("MS"))
+        provider.reset()
+        self.assertEqual(provider.get_price("AAPL"), 10.0, "reset() should rewind to the first tick")
+
+    def testReplaySQLiteNoLoop(self):
+        path = os.path.join(self.tmpdir.name, "ticks.db")
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE price_ticks(ticker, ts, price);")
+            connection.executemany("INSERT INTO price_ticks VALUES (?, ?, ?);",
+                                   [("AAPL", 1, 10.0), ("AAPL", 2, 11.0)])
+        provider = ReplayProvider(path, loop=False)
+        self.assertEqual(provider.get_prices(["AAPL"]), {"AAPL": 10.0})
+        self.assertEqual(provider.get_price("AAPL"), 11.0)
+        self.assertIsNone(provider.get_price("AAPL"), "an exhausted recording should return None")
+
+    def testFromConfig(self):
+        self.assertIsInstance(from_config("static"), StaticProvider)
+        self.assertTrue(from_config("iex").remote, "the iex provider should be remote")
+        with self.assertRaises(ValueError):
+            from_config("nope")
+
+    def testSetPriceProvider(self):
+        trade.setPriceProvider(StaticProvider({"AAPL": 10.0}))
+        try:
+            self.assertEqual(trade.get_current_price("AAPL"), 10.0)
+            self.assertEqual(trade.get_current_prices(["AAPL", "GS"]), {"AAPL": 10.0, "GS": None})
+        finally:
+            trade.setPriceProvider("iex")
+
+    def testBaseProviderNotImplemented(self):
+        with self.assertRaises(NotImplementedError):
+            PriceProvider().get_price("AAPL")
@@ -0,0 +1,71 @@
+import sqlite3
+import time
+import unittest
+from app import trade, setDB, Position
+from app.providers import PriceProvider
+from app.refresher import PriceRefresher
+from schema import schema
+from tests.config import DBPATH
+
+
+class CountingProvider(PriceProvider):
+
+    remote = True
+
+    def __init__(self):
+        self.batches = []
+
+    def get_price(self, ticker):
+        return self.get_prices([ticker])[ticker]
+
+    def get_prices(self, tickers):
+        self.batches.append(list(tickers))
+        return {ticker: 10.0 for ticker in tickers}
+
+
+class TestRefresher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        schema(DBPATH, reset=True)
+        setDB(DBPATH)
+
+    def setUp(self):
+        with sqlite3.connect(DBPATH) as connection:
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM positions;")
+        self.provider = CountingProvider()
+        trade.setPriceProvider(self.provider)
+        self.refresher = PriceRefresher(interval=0.05)
+
+    def tearDown(self):
+        self.refresher.stop()
+        trade.setPriceProvider("iex")
+
+    def testHotTickers(self):
+        Position(ticker="AAPL", shares=10, account_id=1).save()
+        Position(ticker="GS", shares=0, account_id=1).save()
+        trade.get_current_price("MS")
+        hot = self.refresher.hot_tickers()
+        self.assertIn("AAPL", hot, "held tickers should be hot")
+        self.assertIn("MS", hot, "recently looked up tickers should be hot")
+        self.assertNotIn("GS", hot, "tickers with no shares held should not be hot")
+
+    def testRefreshOnceBatches(self):
+        Position(ticker="AAPL", shares=10, account_id=1).save()
+        Position(ticker="GS", shares=10, account_id=2).save()
+        self.refresher.refresh_once()
+        self.assertEqual(len(self.provider.batches), 1, "hot tickers should be fetched in one batch")
+        self.assertTrue({"AAPL", "GS"} <= set(self.provider.batches[0]))
+
+    def testLookupsHitWarmCache(self):
+        Position(ticker="AAPL", shares=10, account_id=1).save()
+        self.refresher.start()
+        deadline = time.monotonic() + 2
+        while self.refresher.runs == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        batches = len(self.provider.batches)
+        self.assertEqual(trade.get_current_price("AAPL"), 10.0)
+        self.assertEqual(len(self.provider.batches), batches, "a warm ticker should not be fetched by the lookup")
+        self.refresher.stop()
+        self.assertFalse(self.refresher.running)
@@ -0,0 +1,61 @@
+import sqlite3
+import unittest
+from app import Account, Position, setDB, setPriceProvider
+from app import report
+from app.providers import StaticProvider
+from schema import schema
+from tests.config import DBPATH
+
+
+class TestReport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        schema(DBPATH, reset=True)
+        setDB(DBPATH)
+        setPriceProvider(StaticProvider({"STOK": 10.0, "P2P": 1.0}))
+
+    @classmethod
+    def tearDownClass(cls):
+        setPriceProvider("iex")
+
+    def setUp(self):
+        with sqlite3.connect(DBPATH) as connection:
+            connection.execute("DELETE FROM accounts;")
+            connection.execute("DELETE FROM positions;")
+        alex = Account(username="alex16", balance=100)
+        caroline = Account(username="cg16", balance=100)
+        Account.save_many([alex, caroline])
+        self.alex, self.caroline = alex, caroline
+        Position.upsert_many([Position(ticker="STOK", shares=5, account_id=alex.id),
+                              Position(ticker="P2P", shares=20, account_id=alex.id),
+                              Position(ticker="STOK", shares=1, account_id=caroline.id),
+                              Position(ticker="GONE", shares=3, account_id=caroline.id),
+                              Position(ticker="P2P", shares=0, account_id=caroline.id)])
+
+    def testSortByShares(self):
+        rows = report.portfolio_report()
+        self.assertEqual([row.shares for row in rows], [20, 5, 3, 1], "the report should skip empty positions")
+        self.assertEqual(rows[0], report.ReportRow(self.alex.id, "alex16", "P2P", 20, 1.0, 20.0))
+
+    def testSortByValue(self):
+        rows = report.portfolio_report(sort="value")
+        self.assertEqual([row.value for row in rows], [50.0, 20.0, 10.0, None],
+                         "unpriced positions should sort last")
+        rows = report.portfolio_report(sort="value", descending=False)
+        self.assertEqual([row.value for row in rows], [10.0, 20.0, 50.0, None],
+                         "unpriced positions should sort last when ascending too")
+        self.assertEqual([row.ticker for row in report.portfolio_report(sort="value", descending=False, limit=1)],
+                         ["STOK"])
+
+    def testTopAndPages(self):
+        self.assertEqual([row.value for row in report.top_positions(2)], [50.0, 20.0])
+        self.assertEqual([row.value for row in report.portfolio_report(sort="value", limit=2, offset=1)],
+                         [20.0, 10.0], "limit and offset should page the value sort")
+        self.assertEqual([row.shares for row in report.portfolio_report(limit=2, offset=2)], [3, 1],
+                         "limit and offset should page the shares sort")
+        self.assertEqual([row.shares for row in report.portfolio_report(descending=False, limit=1)], [1])
+
+    def testUnknownSort(self):
+        with self.assertRaises(ValueError):
+            report.portfolio_report(sort="ticker")
@@ -0,0 +1,143 @@
+import time
+import unittest
+from app import trade
+from app.errs import PriceUnavailableError
+from app.providers import PriceProvider
+from app.resilience import CircuitBreaker
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyProvider(PriceProvider):
+    """ a remote-looking provider that fails while down is True """
+
+    remote = True
+
+    def __init__(self):
+        self.down = False
+        self.calls = 0
+
+    def get_price(self, ticker):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("upstream down")
+        return 10.0 + self.calls
+
+    def get_prices(self, tickers):
+        return {ticker: self.get_price(ticker) for ticker in tickers}
+
+
+def fail():
+    raise ConnectionError("upstream down")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=self.clock)
+
+    def testOpensAfterFailures(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(PriceUnavailableError, msg="an open breaker should fail fast"):
+            self.breaker.call(lambda: 1)
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    def testHalfOpenTrial(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(fail)
+        self.clock.now = 30
+        self.assertEqual(self.breaker.call(lambda: 1), 1, "a trial call should go through after reset_timeout")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def testHalfOpenFailureReopens(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(fail)
+        self.clock.now = 30
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN, "a failed trial should open the breaker again")
+
+    def testSuccessResetsFailures(self):
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.breaker.call(lambda: 1)
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED, "failures should have to be in a row")
+
+
+class TestStaleQuotes(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = FlakyProvider()
+        trade.setPriceProvider(self.provider)
+        self.clock = FakeClock()
+        self.old_clock = trade.QUOTE_CACHE.clock
+        trade.QUOTE_CACHE.clock = self.clock
+
+    def tearDown(self):
+        trade.QUOTE_CACHE.clock = self.old_clock
+        trade.setPriceProvider("iex")
+
+    def expire(self):
+        self.clock.now += trade.QUOTE_CACHE.ttl
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 2
+        while trade._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def testFreshQuote(self):
+        quote = trade.get_quote("AAPL")
+        self.assertEqual(quote.price, 11.0)
+        self.assertFalse(quote.stale, "a fetched price should be fresh")
+
+    def testStaleServedWhileRefreshing(self):
+        trade.get_quote("AAPL")
+        self.expire()
+        quote = trade.get_quote("AAPL")
+        self.assertEqual(quote, trade.Quote("AAPL", 11.0, True), "an expired price should be served as stale")
+        self.wait_for_refresh()
+        self.assertEqual(trade.get_quote("AAPL"), trade.Quote("AAPL", 12.0, False),
+                         "the background refresh should replace the stale price")
+
+    def testStaleServedDuringOutage(self):
+        trade.get_quote("AAPL")
+        self.provider.down = True
+        self.expire()
+        for _ in range(10):
+            self.assertTrue(trade.get_quote("AAPL").stale)
+            self.wait_for_refresh()
+        self.assertEqual(trade.QUOTE_BREAKER.state, CircuitBreaker.OPEN, "repeated failures should open the breaker")
+        calls = self.provider.calls
+        trade.get_quote("AAPL")
+        self.wait_for_refresh()
+        self.assertEqual(self.provider.calls, calls, "an open breaker should stop upstream calls")
+
+    def testNoStalePriceRaises(self):
+        self.provider.down = True
+        for _ in range(trade.QUOTE_BREAKER.failure_threshold):
+            with self.assertRaises(ConnectionError):
+                trade.get_quote("AAPL")
+        with self.assertRaises(PriceUnavailableError):
+            trade.get_quote("AAPL")
+
+    def testBatchFallsBackToStale(self):
+        trade.get_current_prices(["AAPL"])
+        self.provider.down = True
+        self.expire()
+        self.assertEqual(trade.get_current_prices(["AAPL", "GS"]), {"AAPL": 11.0, "GS": None},
+                         "a failed batch should fall back to stale prices")
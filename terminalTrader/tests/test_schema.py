@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from app import Account, setDB, db
+from tests.config import DBPATH
+from schema import schema, MIGRATIONS, CREATE_SQL_ACCOUNTS, CREATE_SQL_POSITIONS, CREATE_SQL_TRADES
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbpath = os.path.join(self.tmpdir.name, "schema.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def indexes(self):
+        with sqlite3.connect(self.dbpath) as connection:
+            rows = connection.execute("SELECT name FROM sqlite_master WHERE type='index';").fetchall()
+        return {row[0] for row in rows}
+
+    def query_plan(self, sql):
+        with sqlite3.connect(self.dbpath) as connection:
+            return " ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql).fetchall())
+
+    def testFreshDatabase(self):
+        self.assertEqual(schema(self.dbpath), len(MIGRATIONS), "schema() should return the latest version")
+        self.assertTrue({"idx_accounts_api_key", "idx_accounts_username",
+                         "idx_trades_account_id_ticker", "idx_trades_account_id_time"} <= self.indexes())
+
+    def testExistingDatabaseKeepsData(self):
+        # a database made by the old drop-and-recreate schema(), which has no version
+        with sqlite3.connect(self.dbpath) as connection:
+            for statement in (CREATE_SQL_ACCOUNTS, CREATE_SQL_POSITIONS, CREATE_SQL_TRADES):
+                connection.execute(statement)
+            connection.execute("INSERT INTO accounts(username, api_key) VALUES ('cg16', 123456789);")
+        schema(self.dbpath)
+        with sqlite3.connect(self.dbpath) as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM accounts;").fetchone()[0], 1,
+                             "migrating should keep existing rows")
+        self.assertIn("idx_accounts_api_key", self.indexes(), "indexes should be added in place")
+
+    def testIdempotent(self):
+        schema(self.dbpath)
+        with sqlite3.connect(self.dbpath) as connection:
+            connection.execute("INSERT INTO accounts(username) VALUES ('cg16');")
+        self.assertEqual(schema(self.dbpath), len(MIGRATIONS))
+        with sqlite3.connect(self.dbpath) as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM accounts;").fetchone()[0], 1)
+
+    def testReset(self):
+        schema(self.dbpath)
+        with sqlite3.connect(self.dbpath) as connection:
+            connection.execute("INSERT INTO accounts(username) VALUES ('cg16');")
+        schema(self.dbpath, reset=True)
+        with sqlite3.connect(self.dbpath) as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM accounts;").fetchone()[0], 0,
+                             "reset should start from empty tables")
+
+    def testLookupsUseIndexes(self):
+        schema(self.dbpath)
+        self.assertIn("idx_accounts_api_key", self.query_plan("SELECT * FROM accounts WHERE api_key=1;"))
+        self.assertIn("idx_accounts_username", self.query_plan("SELECT * FROM accounts WHERE username='a';"))
+        self.assertIn("idx_trades_account_id_ticker",
+                      self.query_plan("SELECT * FROM trades WHERE account_id=1 AND ticker='A';"))
+
+
+class TestMemorySchema(unittest.TestCase):
+
+    def tearDown(self):
+        db.discard(":memory:schema")
+
+    def testModelsInMemory(self):
+        self.assertEqual(schema(":memory:schema"), len(MIGRATIONS))
+        setDB(":memory:schema")
+        try:
+            caroline = Account(username="cg16", balance=10000)
+            caroline.save()
+            self.assertEqual(Account.from_id(caroline.id).username, "cg16",
+                             "the models should share one in-memory database")
+        finally:
+            setDB(DBPATH)
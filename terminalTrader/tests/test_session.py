@@ -0,0 +1,81 @@
+import sqlite3
+import unittest
+from app import Account, Position, Trade, setDB, setPriceProvider
+from app import session
+from schema import schema
+from tests.config import DBPATH, PRICE_PROVIDER
+
+
+class TestSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        schema(DBPATH, reset=True)
+        setDB(DBPATH)
+        setPriceProvider(PRICE_PROVIDER)
+
+    @classmethod
+    def tearDownClass(cls):
+        setPriceProvider("iex")
+
+    def setUp(self):
+        with sqlite3.connect(DBPATH) as connection:
+            connection.execute("DELETE FROM accounts;")
+            connection.execute("DELETE FROM positions;")
+        self.alex = Account(username="alex16", balance=10000)
+        self.alex.save()
+        Position(ticker="STOK", shares=10, account_id=self.alex.id).save()
+
+    def testIdentityMap(self):
+        with session.Session() as current:
+            acct = Account.from_id(self.alex.id)
+            self.assertIs(Account.from_id(self.alex.id), acct, "a session should hand back the loaded object")
+            self.assertIs(Account.from_api_key(acct.api_key), acct,
+                          "every lookup of the row should share one instance")
+            position = Position.from_account_id_and_ticker(self.alex.id, "STOK")
+            self.assertIs(position.get_account(), acct)
+            self.assertIs(Position.from_id(position.id), position)
+            self.assertEqual(current.hits, 3)
+        self.assertIsNot(Account.from_id(self.alex.id), acct, "outside a session every lookup queries")
+
+    def testFlushSavesDirtyObjects(self):
+        with session.Session() as current:
+            acct = Account.from_id(self.alex.id)
+            acct.balance = 5
+            position = Position.from_account_id_and_ticker(self.alex.id, "STOK")
+            new_position = Position.from_account_id_and_ticker(self.alex.id, "P2P")
+            new_position.shares = 3
+            self.assertEqual(set(map(id, current.dirty())), {id(acct), id(new_position)},
+                             "only changed objects should be dirty")
+            self.assertEqual(Account.from_id(self.alex.id).balance, 5)
+        self.assertEqual(Account.from_id(self.alex.id).balance, 5, "flush should save changed objects")
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "P2P").shares, 3,
+                         "flush should insert new objects")
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 10)
+
+    def testExceptionDiscardsChanges(self):
+        with self.assertRaises(ValueError):
+            with session.Session():
+                Account.from_id(self.alex.id).balance = 5
+                raise ValueError
+        self.assertEqual(Account.from_id(self.alex.id).balance, 10000, "a failed action should not be flushed")
+        self.assertIsNone(session.current())
+
+    def testAddAndDelete(self):
+        with session.Session() as current:
+            trade = Trade(ticker="STOK", volume=1, unit_price=1.0, account_id=self.alex.id)
+            current.add(trade)
+            position = Position.from_account_id_and_ticker(self.alex.id, "STOK")
+            position.delete()
+        self.assertIsNotNone(trade.id, "added objects should be inserted at flush")
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 0,
+                         "a deleted object should not be saved again")
+
+    def testBuyInSession(self):
+        with session.Session():
+            acct = Account.from_id(self.alex.id)
+            self.assertEqual(Position.from_account_id_and_ticker(acct.id, "STOK").shares, 10)
+            acct.buy("STOK", 5)
+            self.assertEqual(Position.from_account_id_and_ticker(acct.id, "STOK").shares, 15,
+                             "an order should refresh the position the session holds")
+        self.assertAlmostEqual(Account.from_id(self.alex.id).balance, 10000 - 5 * 123.45)
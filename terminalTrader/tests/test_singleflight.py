@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+from app import trade
+from app.providers import PriceProvider
+from app.singleflight import SingleFlight
+
+
+class CountingProvider(PriceProvider):
+    """ a remote-looking provider that counts calls and answers slowly """
+
+    remote = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_price(self, ticker):
+        self.calls += 1
+        time.sleep(0.1)
+        return 42.0
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_threads(self, count, target):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def testConcurrentCallsShareResult(self):
+        flights = SingleFlight()
+        results = []
+
+        def slow():
+            time.sleep(0.1)
+            return "quote"
+
+        self.run_threads(10, lambda: results.append(flights.do("AAPL", slow)))
+        self.assertEqual(results, ["quote"] * 10)
+        self.assertEqual(flights.stats()["calls"] + flights.stats()["coalesced"], 10)
+        self.assertLess(flights.stats()["calls"], 10, "concurrent callers should be coalesced")
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+    def testErrorShared(self):
+        flights = SingleFlight()
+        errors = []
+
+        def broken():
+            time.sleep(0.05)
+            raise ConnectionError("upstream down")
+
+        def call():
+            try:
+                flights.do("AAPL", broken)
+            except ConnectionError as error:
+                errors.append(error)
+
+        self.run_threads(5, call)
+        self.assertEqual(len(errors), 5, "waiting callers should see the leader's error")
+
+    def testDifferentKeysNotCoalesced(self):
+        flights = SingleFlight()
+        flights.do("AAPL", lambda: 1)
+        flights.do("GS", lambda: 2)
+        self.assertEqual(flights.stats()["coalesced"], 0)
+
+    def testGetCurrentPriceCoalesced(self):
+        provider = CountingProvider()
+        trade.setPriceProvider(provider)
+        try:
+            self.run_threads(10, lambda: trade.get_current_price("AAPL"))
+        finally:
+            trade.setPriceProvider("iex")
+        self.assertEqual(provider.calls, 1, "one upstream call should serve every concurrent caller")
@@ -0,0 +1,122 @@
+import threading
+import unittest
+from app import Account, Position, Trade, setPriceProvider
+from app import ledger, locks, report, session, storage
+from app import InsufficientFundsError, InsufficientSharesError, StaleAccountError
+from app.errs import UnsupportedStorageError
+from tests.config import PRICE_PROVIDER
+
+
+class TestMemoryStorage(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setPriceProvider(PRICE_PROVIDER)
+
+    @classmethod
+    def tearDownClass(cls):
+        setPriceProvider("iex")
+
+    def setUp(self):
+        self.store = storage.setStorage("memory")
+        self.alex = Account(username="alex", balance=10000.0)
+        self.alex.save()
+
+    def tearDown(self):
+        storage.setStorage("sqlite")
+
+    def testLookups(self):
+        self.assertEqual(Account.from_id(self.alex.id).username, "alex")
+        self.assertEqual(Account.get_from_username("alex").id, self.alex.id)
+        api_key = Account.from_id(self.alex.id).api_key
+        self.assertEqual(Account.from_api_key(api_key).id, self.alex.id)
+        self.assertIsNone(Account.from_id(self.alex.id + 1))
+        self.assertEqual(len(self.store.accounts), 1, "nothing should be written to SQLite")
+
+    def testBuySell(self):
+        self.alex.buy("STOK", 10)
+        self.alex.sell("STOK", 4)
+        stored = Account.from_id(self.alex.id)
+        self.assertAlmostEqual(stored.balance, 10000.0 - 6 * 123.45)
+        self.assertEqual(stored.version, 2, "each order should bump the version")
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 6)
+        self.assertEqual([trade.volume for trade in self.alex.get_trades()], [10, -4])
+
+    def testRejectedOrdersWriteNothing(self):
+        self.alex.buy("STOK", 1)
+        with self.assertRaises(InsufficientSharesError):
+            self.alex.sell("STOK", 2)
+        self.alex.balance = 1e9 # stale in-memory balance, the stored one is checked
+        with self.assertRaises(InsufficientFundsError):
+            self.alex.buy("STOK", 1000)
+        self.assertEqual(len(self.store.trades), 1, "a rejected order should leave no trade")
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 1)
+
+    def testStaleAccount(self):
+        other = Account.from_id(self.alex.id)
+        self.alex.deposit(5.0)
+        other.balance = 0.0
+        with self.assertRaises(StaleAccountError):
+            other.save()
+
+    def testOrdersTakeTheAccountLock(self):
+        caroline = Account(username="cg16", balance=1000.0)
+        caroline.save()
+        alex_done, caroline_done = threading.Event(), threading.Event()
+
+        def buy(acct, done):
+            acct.buy("STOK", 1)
+            done.set()
+
+        with locks.ACCOUNT_LOCKS.hold(self.alex.id):
+            threads = [threading.Thread(target=buy, args=(self.alex, alex_done)),
+                       threading.Thread(target=buy, args=(caroline, caroline_done))]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(caroline_done.wait(1), "an order should not wait for another account's lock")
+            self.assertFalse(alex_done.is_set(), "an order should wait for its own account's lock")
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Position.from_account_id_and_ticker(self.alex.id, "STOK").shares, 1)
+
+    def testTradePages(self):
+        Trade.save_many([Trade(ticker="STOK", volume=1, unit_price=1.0, account_id=self.alex.id)
+                         for _ in range(5)])
+        page, after_id = Trade.page_from_account_id(self.alex.id, limit=2)
+        self.assertEqual(len(page), 2)
+        page, after_id = Trade.page_from_account_id(self.alex.id, after_id=after_id, limit=3)
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(after_id, "the last page should have no next id")
+        self.assertEqual(len(list(Trade.iter_all())), 5)
+
+    def testSessionFlush(self):
+        with session.Session():
+            acct = Account.from_id(self.alex.id)
+            acct.first_name = "Alex"
+        self.assertEqual(Account.from_id(self.alex.id).first_name, "Alex")
+
+    def testDeleteAll(self):
+        Position(ticker="STOK", shares=3, account_id=self.alex.id).save()
+        Position.delete_all()
+        Account.delete_all()
+        self.assertEqual(Position.all(), [])
+        self.assertIsNone(Account.get_from_username("alex"))
+
+    def testReport(self):
+        caroline = Account(username="cg16", balance=1000.0)
+        caroline.save()
+        self.alex.buy("STOK", 5)
+        self.alex.buy("P2P", 10)
+        caroline.buy("STOK", 1)
+        rows = report.portfolio_report()
+        self.assertEqual([(row.username, row.ticker, row.shares) for row in rows],
+                         [("alex", "P2P", 10), ("alex", "STOK", 5), ("cg16", "STOK", 1)],
+                         "the report should read the selected storage")
+        self.assertEqual([row.shares for row in report.portfolio_report(descending=False, limit=2, offset=1)], [5, 10])
+        self.assertEqual([row.ticker for row in report.top_positions(1)], ["P2P"])
+
+    def testLedgerNeedsSQLite(self):
+        with self.assertRaises(UnsupportedStorageError):
+            ledger.rebuild()
+        with self.assertRaises(UnsupportedStorageError):
+            ledger.snapshot()
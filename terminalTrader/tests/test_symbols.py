@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from app import trade, symbols
+from app.providers import PriceProvider
+from app.symbols import SymbolUniverse
+
+
+class FakeClient:
+
+    def get_symbols(self):
+        return ["aapl", "GS", "MS"]
+
+
+class CountingProvider(PriceProvider):
+
+    remote = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_price(self, ticker):
+        self.calls += 1
+        return 10.0
+
+
+class TestSymbols(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "symbols.txt")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testNormalize(self):
+        self.assertEqual(symbols.normalize(" aapl\n"), "AAPL")
+
+    def testFromFile(self):
+        symbols.write(["msft", "AAPL"], self.path)
+        universe = SymbolUniverse.from_file(self.path)
+        self.assertIn("aapl", universe, "membership should ignore case")
+        self.assertIn("STOK", universe, "DICT_FAKES should always be known")
+        self.assertNotIn("XYZ1234", universe)
+        with open(self.path) as symbolfile:
+            self.assertEqual(symbolfile.read(), "AAPL\nMSFT\n", "write() should store sorted upper case symbols")
+
+    def testMissingFileAcceptsEverything(self):
+        with self.assertLogs("app.symbols", "WARNING"):
+            universe = SymbolUniverse.from_file(self.path)
+        self.assertFalse(universe.loaded)
+        self.assertIn("XYZ1234", universe, "without a symbols file every ticker should be let through")
+
+    def testUnknownTickerNoNetwork(self):
+        provider = CountingProvider()
+        trade.setPriceProvider(provider)
+        try:
+            with mock.patch.object(trade, "SYMBOLS", SymbolUniverse(["AAPL"])):
+                self.assertIsNone(trade.get_current_price("XYZ1234"))
+                self.assertEqual(trade.get_current_prices(["XYZ1234", "AAPL"]), {"XYZ1234": None, "AAPL": 10.0})
+                self.assertEqual(trade.get_current_prices([" aapl"]), {" aapl": 10.0},
+                                 "batch lookups should normalize tickers before checking them")
+        finally:
+            trade.setPriceProvider("iex")
+        self.assertEqual(provider.calls, 1, "unknown tickers should be rejected before any fetch")
+
+    def testRefreshSymbols(self):
+        old_symbols = trade.SYMBOLS
+        try:
+            count = trade.refresh_symbols(client=FakeClient(), path=self.path)
+            self.assertIn("AAPL", trade.SYMBOLS)
+            self.assertNotIn("IBM", trade.SYMBOLS)
+            self.assertEqual(count, 3 + len(trade.DICT_FAKES))
+        finally:
+            trade.SYMBOLS = old_symbols
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from app import trade, ticks, db
+from app.providers import PriceProvider, ReplayProvider
+from app.ticks import TickStore
+
+
+class FixedProvider(PriceProvider):
+
+    remote = True
+
+    def get_price(self, ticker):
+        return 10.0
+
+
+class TestTicks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbpath = os.path.join(self.tmpdir.name, "ticks.db")
+        self.store = TickStore(self.dbpath, batch_size=3, flush_interval=60)
+
+    def tearDown(self):
+        db.close(self.dbpath)
+        self.tmpdir.cleanup()
+
+    def testRecordIsBuffered(self):
+        self.store.record("AAPL", 10.0, ts=1)
+        self.assertEqual(self.store.written, 0, "record() should not write on the caller's thread")
+        self.assertEqual(self.store.range("AAPL"), [(1.0, 10.0)], "queries should see buffered ticks")
+        self.assertEqual(self.store.written, 1)
+
+    def testTableCreatedOnce(self):
+        self.store.record("AAPL", 10.0, ts=1)
+        self.store.flush()
+        with mock.patch.object(ticks, "CREATE_SQL_PRICE_TICKS", "not sql"):
+            self.store.record("AAPL", 11.0, ts=2)
+            self.store.flush()
+        self.assertEqual(self.store.written, 2, "a flush should not create the table again")
+
+    def testBatchSizeWakesWriter(self):
+        self.store.record_many({"AAPL": 10.0, "GS": 20.0, "MS": 30.0}, ts=1)
+        deadline = time.monotonic() + 2
+        while self.store.written < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.store.written, 3, "a full batch should be written by the writer thread")
+
+    def testRange(self):
+        for ts, price in ((1, 10.0), (2, 11.0), (3, 12.0)):
+            self.store.record("AAPL", price, ts=ts)
+        self.store.record("GS", 99.0, ts=2)
+        self.assertEqual(self.store.range("AAPL", start=2), [(2.0, 11.0), (3.0, 12.0)])
+        self.assertEqual(self.store.range("AAPL", end=2), [(1.0, 10.0)])
+
+    def testPriceAt(self):
+        self.store.record("AAPL", 10.0, ts=1)
+        self.store.record("AAPL", 11.0, ts=5)
+        self.assertEqual(self.store.price_at("AAPL", 4), 10.0)
+        self.assertIsNone(self.store.price_at("AAPL", 0))
+        self.assertEqual(self.store.prices_at(["AAPL", "GS"], 5), {"AAPL": 11.0, "GS": None})
+
+    def testReplayFromHistory(self):
+        self.store.record("AAPL", 10.0, ts=1)
+        self.store.record("AAPL", 11.0, ts=2)
+        self.store.flush()
+        provider = ReplayProvider(self.dbpath)
+        self.assertEqual([provider.get_price("AAPL"), provider.get_price("AAPL")], [10.0, 11.0],
+                         "recorded history should replay through ReplayProvider")
+
+    def testFetchedPricesRecorded(self):
+        old_dbpath = ticks.TICK_STORE.dbpath
+        ticks.TICK_STORE.setDB(self.dbpath)
+        trade.setPriceProvider(FixedProvider())
+        try:
+            trade.get_current_price("AAPL")
+            trade.get_current_prices(["GS"])
+            self.assertEqual(len(ticks.TICK_STORE.range("AAPL")), 1, "fetched prices should be recorded")
+            self.assertEqual(len(ticks.TICK_STORE.range("GS")), 1, "batch prices should be recorded")
+        finally:
+            trade.setPriceProvider("iex")
+            ticks.TICK_STORE.setDB(old_dbpath)
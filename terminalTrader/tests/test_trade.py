@@ -11,7 +11,7 @@ class TestTrade(unittest.TestCase):
 
     @classmethod 
     def setUpClass(cls):
-        schema(DBPATH)
+        schema(DBPATH, reset=True)
         setDB(DBPATH)
 
 
@@ -55,6 +55,21 @@ class TestTrade(unittest.TestCase):
             self.assertEqual(len(rows), 1, "save should create a row in the database")
 
 
+
+    def testSaveMany(self):
+        trades = [Trade(ticker="IBM", volume=n, unit_price=11.22, account_id=7) for n in range(1, 51)]
+        for trade in trades:
+            trade.time = 1000 + trade.volume
+        Trade.save_many(trades)
+        self.assertEqual(len({trade.id for trade in trades}), 50, "save_many should set each id")
+        for trade in (trades[0], trades[-1]):
+            loaded = Trade.from_id(trade.id)
+            self.assertEqual(loaded.volume, trade.volume, "each id should point at its own row")
+        with sqlite3.connect(Trade.dbpath) as connection:
+            times = connection.execute("SELECT time FROM trades WHERE account_id=7 ORDER BY id;").fetchall()
+        self.assertEqual([row[0] for row in times], [1000 + n for n in range(1, 51)],
+                         "save_many should insert every trade with its own time")
+
     def testSaveUpdate(self):
         # First trade instance to initialize data on row 2
         trade = Trade(ticker="GS", volume=100.0, unit_price=33.44, account_id="7654321")
@@ -80,6 +95,49 @@ class TestTrade(unittest.TestCase):
         self.assertNotEqual(trade3.time, trade.time, "time should be updated")
 
 
+    def testIterFromAccountId(self):
+        trades = [Trade(ticker=("IBM" if n % 2 else "GS"), volume=n, unit_price=1.0, account_id=7)
+                  for n in range(25)]
+        for trade in trades:
+            trade.time = 1000 + trade.volume
+        Trade.save_many(trades)
+        Trade(ticker="IBM", volume=1, unit_price=1.0, account_id=8).save()
+
+        self.assertEqual([trade.id for trade in Trade.iter_from_account_id(7, batch_size=4)],
+                         [trade.id for trade in trades], "the iterator should page through every trade in id order")
+        self.assertEqual(len(list(Trade.iter_from_account_id(7, ticker="IBM", batch_size=4))), 12,
+                         "the iterator should filter by ticker")
+        self.assertEqual([trade.id for trade in Trade.iter_from_account_id(7, after_id=trades[19].id)],
+                         [trade.id for trade in trades[20:]], "the iterator should start after after_id")
+        self.assertEqual(len(list(Trade.iter_from_account_id(7, since=1005, until=1010))), 5,
+                         "the iterator should filter by time range")
+
+    def testPageFromAccountId(self):
+        trades = [Trade(ticker="IBM", volume=n, unit_price=1.0, account_id=7) for n in range(5)]
+        Trade.save_many(trades)
+        page, next_after_id = Trade.page_from_account_id(7, limit=3)
+        self.assertEqual([trade.id for trade in page], [trade.id for trade in trades[:3]])
+        self.assertEqual(next_after_id, trades[2].id, "a full page should point at the next one")
+        page, next_after_id = Trade.page_from_account_id(7, after_id=next_after_id, limit=3)
+        self.assertEqual([trade.id for trade in page], [trade.id for trade in trades[3:]])
+        self.assertIsNone(next_after_id, "the last page should have no next page")
+
+    def testIterAll(self):
+        Trade.save_many([Trade(ticker="IBM", volume=n, unit_price=1.0, account_id=n) for n in range(7)])
+        self.assertEqual(len(list(Trade.iter_all(batch_size=2))), 7, "iter_all should page through every trade")
+
+
+    def testFromRow(self):
+        trade = Trade(ticker="IBM", volume=10.0, unit_price=11.22, account_id=7)
+        trade.time = 1000.0
+        Trade.save_many([trade])
+        loaded = Trade.from_id(trade.id)
+        self.assertEqual((loaded.id, loaded.ticker, loaded.volume, loaded.unit_price, loaded.time, loaded.account_id),
+                         (trade.id, "IBM", 10.0, 11.22, 1000.0, 7), "from_row should map every column")
+        with self.assertRaises(AttributeError, msg="trades should be slotted"):
+            loaded.extra = 1
+
+
     def testDelete(self):
         # First trade instance to initialize data
         trade = Trade(ticker="GS", volume=1100.0, unit_price=77.88, account_id="7654321")